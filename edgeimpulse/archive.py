@@ -0,0 +1,460 @@
+"""Append-only archive of classified segments for later retraining.
+
+Segments are appended as raw int16 to shard files (shard_00000.i16, ...)
+that can be memory-mapped; index.bin holds one fixed-size record per
+segment (INDEX_DTYPE) and scores.f32 the matching row of class scores, so
+the whole index loads as columns with np.fromfile. Records are appended in
+time order, so time ranges are a binary search on `ts`.
+
+    python edgeimpulse/archive.py stats
+    python edgeimpulse/archive.py query --since 2025-06-01 --label can --limit 20
+    python edgeimpulse/archive.py export ei_dataset --outcome ok --min-score 0.8
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import logs
+from pipeline import DROP_OLDEST, DropQueue
+
+log = logs.get('ARCHIVE')
+
+# Cycle outcome of an archived segment ('uncertain': no cycle, the decision engine was not sure)
+OUTCOMES = ('none', 'pending', 'ok', 'failed', 'uncertain')
+OUTCOME_ID = {name: i for i, name in enumerate(OUTCOMES)}
+
+INDEX_DTYPE = np.dtype([
+    ('id', '<u8'),
+    ('ts', '<f8'),
+    ('shard', '<u4'),
+    ('offset', '<u4'),     # in samples
+    ('length', '<u4'),     # in samples
+    ('rms', '<f4'),
+    ('top_score', '<f4'),
+    ('label', '<i2'),      # index into meta labels, -1 = unknown
+    ('type_id', '<i1'),    # -1 = not mapped
+    ('outcome', '<u1'),
+])
+
+
+class SegmentArchive:
+    """Shard + columnar index store; all disk I/O runs on one writer thread.
+
+    submit() assigns the record id and queues the segment (bounded, the
+    oldest pending segment is dropped when the writer falls behind), so the
+    classification worker never waits for the SD card. set_outcome() patches
+    the cycle outcome of a record in place. Retention drops whole shards,
+    oldest first, when the archive exceeds max_mb or a shard is older than
+    max_days.
+    """
+    def __init__(self, root: str, shard_mb: float = 64.0, max_mb: float = 0.0,
+                 max_days: float = 0.0, queue_size: int = 32, readonly: bool = False):
+        self.root = root
+        self.shard_bytes = int(shard_mb * 1024 * 1024)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_days = float(max_days)
+        self.jobs = DropQueue('archive', queue_size, DROP_OLDEST)
+        self.sample_rate = 16000
+        self.labels: List[str] = []
+        self._lock = threading.Lock()
+        self._index = np.zeros(0, dtype=INDEX_DTYPE)
+        self._scores = np.zeros((0, 0), dtype=np.float32)
+        self._n = 0
+        self._outcomes: Dict[int, int] = {}  # id -> outcome, not yet on disk
+        self.evicted = 0
+        self.write_errors = 0
+        self.readonly = readonly
+        os.makedirs(root, exist_ok=True)
+        self._load()
+        self._next_id = int(self._index['id'][self._n - 1]) + 1 if self._n else 1
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if not readonly:
+            self._thread = threading.Thread(target=self._loop, name='archive-writer', daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls, env, base_dir: str) -> Optional['SegmentArchive']:
+        if env.get('ARCHIVE', '1') != '1':
+            return None
+        return cls(
+            os.path.join(base_dir, env.get('ARCHIVE_DIR', 'archive')),
+            shard_mb=float(env.get('ARCHIVE_SHARD_MB', '64')),
+            max_mb=float(env.get('ARCHIVE_MAX_MB', '1024')),
+            max_days=float(env.get('ARCHIVE_MAX_DAYS', '0')),
+            queue_size=int(env.get('ARCHIVE_QUEUE', '32')),
+        )
+
+    # Files
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _shard_path(self, shard: int) -> str:
+        return self._path(f"shard_{shard:05d}.i16")
+
+    def _load(self) -> None:
+        meta_path = self._path('meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.labels = list(meta.get('labels', []))
+            self.sample_rate = int(meta.get('sample_rate', self.sample_rate))
+        idx_path = self._path('index.bin')
+        index = np.fromfile(idx_path, dtype=INDEX_DTYPE) if os.path.exists(idx_path) else np.zeros(0, INDEX_DTYPE)
+        width = len(self.labels)
+        sc_path = self._path('scores.f32')
+        scores = np.fromfile(sc_path, dtype=np.float32) if os.path.exists(sc_path) else np.zeros(0, np.float32)
+        n = min(index.size, scores.size // width) if width else index.size  # a torn last write is dropped
+        self._index = np.array(index[:n])
+        self._scores = scores[:n * width].reshape(n, width).copy()
+        self._n = n
+        if not self.readonly:
+            self._repair()
+
+    def _repair(self) -> None:
+        """Cut the files back to the loaded records, so later appends line up with the index.
+
+        _append writes shard, scores and index row in that order; a crash in
+        between leaves samples or a score row without an index row (or a part
+        of one) that the next append would otherwise be paired with.
+        """
+        n, width = self._n, self._scores.shape[1]
+        last = int(self._index['shard'][n - 1]) if n else 0
+        end = (int(self._index['offset'][n - 1]) + int(self._index['length'][n - 1])) * 2 if n else 0
+        sizes = {'index.bin': n * INDEX_DTYPE.itemsize, 'scores.f32': n * width * 4, self._shard_path(last): end}
+        for name in os.listdir(self.root):
+            m = re.fullmatch(r'shard_(\d+)\.i16', name)
+            if m and int(m.group(1)) > last:
+                sizes[name] = 0
+        repaired = []
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                if size:
+                    os.truncate(path, size)
+                else:
+                    os.remove(path)
+                repaired.append(os.path.basename(path))
+        if repaired:
+            log.warning(f"torn write after record {n}: cut back {', '.join(sorted(repaired))}", files=sorted(repaired))
+
+    def _write_meta(self) -> None:
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': 1, 'sample_rate': self.sample_rate, 'labels': self.labels}, f)
+        os.replace(tmp, self._path('meta.json'))
+
+    def bind(self, labels: List[str], sample_rate: int) -> None:
+        """Fix the score columns on first use; later runs map scores by label name."""
+        with self._lock:
+            if not self.labels:
+                self.labels = list(labels)
+                self.sample_rate = int(sample_rate)
+                self._scores = np.zeros((0, len(self.labels)), dtype=np.float32)
+                self._write_meta()
+            elif list(labels) != self.labels:
+                log.warning(f"model labels {labels} differ from archive labels {self.labels}; scores mapped by name")
+            if int(sample_rate) != self.sample_rate:
+                log.warning(f"sample rate {sample_rate} Hz differs from archive ({self.sample_rate} Hz)")
+
+    # Producer side
+    def submit(self, segment: np.ndarray, top_label: Optional[str], scores: Dict[str, float],
+               type_id: Optional[int] = None, outcome: str = 'none', ts: Optional[float] = None) -> int:
+        """Queue a copy of segment for archiving; returns its record id."""
+        with self._lock:
+            rec_id = self._next_id
+            self._next_id += 1
+        job = (rec_id, ts if ts is not None else time.time(), np.array(segment, dtype=np.int16, copy=True),
+               top_label, dict(scores or {}), type_id, OUTCOME_ID[outcome])
+        self.jobs.put(job)
+        return rec_id
+
+    def set_outcome(self, rec_id: int, outcome: str) -> None:
+        with self._lock:
+            self._outcomes[rec_id] = OUTCOME_ID[outcome]
+
+    # Writer thread
+    def _loop(self) -> None:
+        last_retention = 0.0
+        while not self._stop.is_set():
+            try:
+                job = self.jobs.get(timeout=0.5)
+            except queue.Empty:
+                job = None
+            try:
+                if job is not None:
+                    self._append(*job)
+                self._flush_outcomes()
+                now = time.monotonic()
+                if now - last_retention >= 60.0:
+                    last_retention = now
+                    self._enforce_retention()
+            except Exception as e:
+                self.write_errors += 1
+                log.error(f"write error: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self._flush_outcomes()
+
+    def _append(self, rec_id: int, ts: float, segment: np.ndarray, top_label: Optional[str],
+                scores: Dict[str, float], type_id: Optional[int], outcome: int) -> None:
+        shard = int(self._index['shard'][self._n - 1]) if self._n else 0
+        path = self._shard_path(shard)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size and size + segment.nbytes > self.shard_bytes:
+            shard, size = shard + 1, 0
+            path = self._shard_path(shard)
+        with open(path, 'ab') as f:
+            f.write(segment.tobytes())
+        row = np.zeros(1, dtype=INDEX_DTYPE)
+        row['id'] = rec_id
+        row['ts'] = ts
+        row['shard'] = shard
+        row['offset'] = size // 2
+        row['length'] = segment.size
+        row['rms'] = float(np.sqrt(np.mean(segment.astype(np.float32) ** 2))) if segment.size else 0.0
+        row['top_score'] = scores.get(top_label, 0.0) if top_label else 0.0
+        row['label'] = self.labels.index(top_label) if top_label in self.labels else -1
+        row['type_id'] = -1 if type_id is None else type_id
+        row['outcome'] = outcome
+        score_row = np.array([[scores.get(lbl, np.nan) for lbl in self.labels]], dtype=np.float32)
+        with open(self._path('scores.f32'), 'ab') as f:
+            f.write(score_row.tobytes())
+        with open(self._path('index.bin'), 'ab') as f:
+            f.write(row.tobytes())
+        with self._lock:
+            if self._n == self._index.size:
+                grow = max(1024, self._n)
+                self._index = np.concatenate([self._index, np.zeros(grow, INDEX_DTYPE)])
+                self._scores = np.concatenate([self._scores, np.zeros((grow, len(self.labels)), np.float32)])
+            self._index[self._n] = row[0]
+            self._scores[self._n] = score_row[0]
+            self._n += 1
+
+    def _flush_outcomes(self) -> None:
+        with self._lock:
+            if not self._outcomes:
+                return
+            ids = self._index['id'][:self._n]
+            patches = []
+            for rec_id, outcome in list(self._outcomes.items()):
+                i = int(np.searchsorted(ids, rec_id))
+                if i < self._n and ids[i] == rec_id:
+                    self._index['outcome'][i] = outcome
+                    patches.append((i, outcome))
+                    del self._outcomes[rec_id]
+                elif self._n and rec_id < ids[self._n - 1]:
+                    del self._outcomes[rec_id]  # dropped before it was written (ids are written in order)
+        if patches:
+            pos = INDEX_DTYPE.fields['outcome'][1]
+            with open(self._path('index.bin'), 'r+b') as f:
+                for i, outcome in patches:
+                    f.seek(i * INDEX_DTYPE.itemsize + pos)
+                    f.write(bytes((outcome,)))
+
+    def _enforce_retention(self) -> None:
+        if not self.max_bytes and not self.max_days:
+            return
+        with self._lock:
+            shards = np.unique(self._index['shard'][:self._n])
+        if shards.size <= 1:
+            return  # never drop the shard being written
+        sizes = {int(s): os.path.getsize(self._shard_path(int(s))) for s in shards
+                 if os.path.exists(self._shard_path(int(s)))}
+        total = sum(sizes.values())
+        cutoff = time.time() - self.max_days * 86400.0 if self.max_days else None
+        drop = []
+        for s in shards[:-1]:
+            s = int(s)
+            with self._lock:
+                newest = float(self._index['ts'][:self._n][self._index['shard'][:self._n] == s].max())
+            if (self.max_bytes and total > self.max_bytes) or (cutoff is not None and newest < cutoff):
+                drop.append(s)
+                total -= sizes.get(s, 0)
+            else:
+                break
+        if drop:
+            self._evict(drop)
+
+    def _evict(self, shards: List[int]) -> None:
+        with self._lock:
+            keep = ~np.isin(self._index['shard'][:self._n], shards)
+            index = self._index[:self._n][keep].copy()
+            scores = self._scores[:self._n][keep].copy()
+            removed = self._n - index.size
+            # rewrite index + scores first so a crash never leaves rows pointing at deleted shards
+            for name, arr in (('index.bin', index), ('scores.f32', scores)):
+                tmp = self._path(name + '.tmp')
+                arr.tofile(tmp)
+                os.replace(tmp, self._path(name))
+            self._index, self._scores, self._n = index, scores, index.size
+            self.evicted += removed
+        for s in shards:
+            try:
+                os.remove(self._shard_path(s))
+            except FileNotFoundError:
+                pass
+        log.info(f"retention: removed {len(shards)} shard(s), {removed} segments", shards=len(shards), segments=removed)
+
+    # Queries
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              label: Optional[str] = None, type_id: Optional[int] = None, outcome: Optional[str] = None,
+              min_score: Optional[float] = None, limit: Optional[int] = None) -> np.ndarray:
+        """Index rows in [since, until) matching the filters (newest last)."""
+        with self._lock:
+            rows = self._index[:self._n]
+            lo = int(np.searchsorted(rows['ts'], since, 'left')) if since is not None else 0
+            hi = int(np.searchsorted(rows['ts'], until, 'left')) if until is not None else self._n
+            rows = rows[lo:hi].copy()
+            label_id = self.labels.index(label) if label in self.labels else -1
+        mask = np.ones(rows.size, dtype=bool)
+        if label is not None:
+            mask &= rows['label'] == label_id
+        if type_id is not None:
+            mask &= rows['type_id'] == type_id
+        if outcome is not None:
+            mask &= rows['outcome'] == OUTCOME_ID[outcome]
+        if min_score is not None:
+            mask &= rows['top_score'] >= min_score
+        rows = rows[mask]
+        return rows[-limit:] if limit else rows
+
+    def _find(self, rec_id: int) -> int:
+        i = int(np.searchsorted(self._index['id'][:self._n], rec_id))
+        if i >= self._n or self._index['id'][i] != rec_id:
+            raise KeyError(rec_id)
+        return i
+
+    def row(self, rec_id: int) -> np.void:
+        with self._lock:
+            return self._index[self._find(rec_id)].copy()
+
+    def scores(self, rec_id: int) -> Dict[str, float]:
+        with self._lock:
+            i = self._find(rec_id)
+            return {lbl: float(v) for lbl, v in zip(self.labels, self._scores[i]) if not np.isnan(v)}
+
+    def read(self, row: np.void) -> np.ndarray:
+        """Samples of one index row (memory-mapped, read-only)."""
+        return np.memmap(self._shard_path(int(row['shard'])), dtype=np.int16, mode='r',
+                         offset=int(row['offset']) * 2, shape=(int(row['length']),))
+
+    def to_dict(self, row: np.void) -> Dict[str, Any]:
+        label = int(row['label'])
+        return {
+            'id': int(row['id']),
+            'ts': float(row['ts']),
+            'rms': float(row['rms']),
+            'top_label': self.labels[label] if 0 <= label < len(self.labels) else None,
+            'top_score': float(row['top_score']),
+            'type_id': int(row['type_id']) if row['type_id'] >= 0 else None,
+            'outcome': OUTCOMES[int(row['outcome'])],
+            'duration_s': int(row['length']) / float(self.sample_rate),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._index[:self._n]
+            shards = np.unique(rows['shard'])
+            counts = np.bincount(rows['label'][rows['label'] >= 0], minlength=len(self.labels)) if self._n else []
+            out = {
+                'root': self.root,
+                'segments': int(self._n),
+                'shards': int(shards.size),
+                'oldest_ts': float(rows['ts'][0]) if self._n else None,
+                'newest_ts': float(rows['ts'][-1]) if self._n else None,
+                'labels': {lbl: int(c) for lbl, c in zip(self.labels, counts)},
+                'evicted': self.evicted,
+                'write_errors': self.write_errors,
+            }
+        out['bytes'] = sum(os.path.getsize(self._shard_path(int(s))) for s in shards
+                           if os.path.exists(self._shard_path(int(s))))
+        out['queue'] = self.jobs.stats()
+        return out
+
+    # Export
+    def export_edge_impulse(self, out_dir: str, rows: np.ndarray, test_ratio: float = 0.2) -> int:
+        """Write rows as <label>.<id>.wav into training/ and testing/ plus an info.labels manifest.
+
+        The split is a stable hash of the record id, so repeated exports keep
+        every segment on the same side.
+        """
+        from scipy.io.wavfile import write as wavwrite
+        files = []
+        for row in rows:
+            rec = self.to_dict(row)
+            if rec['top_label'] is None:
+                continue
+            category = 'testing' if (zlib.crc32(str(rec['id']).encode()) % 1000) < test_ratio * 1000 else 'training'
+            name = f"{rec['top_label']}.{rec['id']}"
+            rel = f"{category}/{name}.wav"
+            os.makedirs(os.path.join(out_dir, category), exist_ok=True)
+            wavwrite(os.path.join(out_dir, rel), self.sample_rate, np.asarray(self.read(row)))
+            files.append({'path': rel, 'name': name, 'category': category,
+                          'label': {'type': 'label', 'label': rec['top_label']}})
+        with open(os.path.join(out_dir, 'info.labels'), 'w') as f:
+            json.dump({'version': 1, 'files': files}, f, indent=2)
+        return len(files)
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Inspect and export the segment archive')
+    ap.add_argument('--dir', default=None, help='archive directory (default: ARCHIVE_DIR)')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats')
+    for name in ('query', 'export'):
+        p = sub.add_parser(name)
+        if name == 'export':
+            p.add_argument('out', help='dataset directory')
+            p.add_argument('--test-ratio', type=float, default=0.2)
+        p.add_argument('--since', help='ISO date/time or epoch seconds')
+        p.add_argument('--until', help='ISO date/time or epoch seconds')
+        p.add_argument('--label')
+        p.add_argument('--type-id', type=int)
+        p.add_argument('--outcome', choices=OUTCOMES)
+        p.add_argument('--min-score', type=float)
+        p.add_argument('--limit', type=int)
+    args = ap.parse_args(argv)
+
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv())
+    root = args.dir or os.path.join(os.path.dirname(os.path.realpath(__file__)), os.environ.get('ARCHIVE_DIR', 'archive'))
+    archive = SegmentArchive(root, readonly=True)
+    if args.cmd == 'stats':
+        print(json.dumps(archive.stats(), indent=2))
+        return 0
+    rows = archive.query(_parse_time(args.since), _parse_time(args.until), args.label, args.type_id,
+                         args.outcome, args.min_score, args.limit)
+    if args.cmd == 'query':
+        for row in rows:
+            print(json.dumps(archive.to_dict(row)))
+        return 0
+    n = archive.export_edge_impulse(args.out, rows, args.test_ratio)
+    print(f"[ARCHIVE] exported {n} segments to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
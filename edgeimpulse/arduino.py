@@ -0,0 +1,443 @@
+import time
+import serial
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Iterable, List, Tuple
+import logs
+import metrics
+from state_store import StateStore
+from transport import SerialTransport
+
+log_event, log_serial, log_auto = logs.get('EVENT'), logs.get('SERIAL'), logs.get('AUTO')
+
+# Protocol commands supported by the firmware
+PROTOCOL_COMMANDS = {
+    'start', 'mTray', 'mPosBottle', 'gPosBottle', 'gLimitTray', 'gState', 'gType', 'estop', 'ping',
+    'gDiagTray', 'gDiagBottle', 'setTrayPos', 'setBottleSpeed',
+    'gTrayEnabled', 'setTrayEnabled', 'recover', 'gLastError', 'gBottleAngle', 'mBottleAngle'
+}
+
+# Aliases and direct protocol names
+commands = {
+    "GetBottleStatus": "gPosBottle",
+    "MoveBottle": "mPosBottle",
+    "MoveTray": "mTray",
+    # direct protocol names allowed
+    "start": "start",
+    "mTray": "mTray",
+    "mPosBottle": "mPosBottle",
+    "gPosBottle": "gPosBottle",
+    "gLimitTray": "gLimitTray",
+    "gState": "gState",
+    "gType": "gType",
+    "estop": "estop",
+    "ping": "ping",
+    # diagnostics/settings
+    "gDiagTray": "gDiagTray",
+    "gDiagBottle": "gDiagBottle",
+    "setTrayPos": "setTrayPos",
+    "setBottleSpeed": "setBottleSpeed",
+    "gTrayEnabled": "gTrayEnabled",
+    "setTrayEnabled": "setTrayEnabled",
+    "recover": "recover",
+    "gLastError": "gLastError",
+    "gBottleAngle": "gBottleAngle",
+    "mBottleAngle": "mBottleAngle",
+}
+
+class Arduino:
+    """Serial interface with async event reader and a pipelined command/ack transport.
+
+    State events from the reader are also published through a condition
+    variable (wait_for_state), subscriber callbacks, a timestamped history and
+    the 'state' topic of the shared StateStore.
+    """
+    def __init__(self, port: str, baud: int = 9600, timeout: float = 1.0, history: int = 200,
+                 ack_timeout: float = 2.0, ack_timeouts: Optional[Dict[str, float]] = None,
+                 store: Optional[StateStore] = None, ser=None, name: str = 'main'):
+        # ser: an already open serial-like object (readline/write/close) instead of port
+        self.ser = ser if ser is not None else serial.Serial(port=port, baudrate=baud, timeout=timeout)
+        self.name = name  # bin name in log records
+        self.store = store if store is not None else StateStore()
+        self.transport = SerialTransport(self.ser, default_timeout=ack_timeout, timeouts=ack_timeouts, name=name)
+        self.last_state: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.state_seq = 0  # incremented on every state event
+        self.state_history: deque = deque(maxlen=history)
+        self._state_cv = threading.Condition()
+        self._subscribers: List[Callable[[str, Optional[str]], None]] = []
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name="arduino-reader", daemon=True)
+        self._reader.start()
+
+    def close(self) -> None:
+        self._running = False
+        self.transport.close()
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+
+    def _read_loop(self) -> None:
+        while self._running:
+            try:
+                line = self.ser.readline()
+                if not line:
+                    continue
+                try:
+                    s = line.decode('utf-8', errors='replace').strip()
+                except Exception:
+                    continue
+                if not s:
+                    continue
+                # Async state events
+                if s.startswith('event::state::'):
+                    state = s.split('::', 2)[2]
+                    self._on_state(state)
+                    log_event.info(f"state={state}", bin=self.name, state=state)
+                    continue
+                # Async error events
+                if s.startswith('event::error::'):
+                    code = s.split('::', 2)[2]
+                    metrics.FIRMWARE_ERRORS.labels(self.name, code).inc()
+                    with self._state_cv:
+                        self.last_error = code
+                        self._state_cv.notify_all()
+                    self.store.update('state', {'state': self.last_state, 'error': code})
+                    log_event.warning(f"error={code}", bin=self.name, error=code)
+                    continue
+                # Acks: <cmd>::ack::<payload?>
+                parts = s.split('::')
+                if len(parts) >= 2 and parts[1] == 'ack':
+                    cmd = parts[0]
+                    payload = parts[2] if len(parts) > 2 else None
+                    self.transport.on_ack(cmd, payload)
+                    continue
+                # Unknown lines
+                log_serial.info(s, category='SERIAL.raw', bin=self.name)
+            except Exception as e:
+                # do not crash on sporadic errors
+                log_serial.error(f"read: {e}", bin=self.name)
+                time.sleep(0.05)
+
+    # State events
+    def _on_state(self, state: str) -> None:
+        now = time.monotonic()
+        with self._state_cv:
+            prev = self.last_state
+            if prev is not None and self.state_history:
+                metrics.STATE_DURATION.labels(self.name, prev).observe(now - self.state_history[-1]['mono'])
+            self.last_state = state
+            self.state_seq += 1
+            self.state_history.append({'state': state, 'ts': time.time(), 'mono': now, 'seq': self.state_seq})
+            self._state_cv.notify_all()
+            subscribers = list(self._subscribers)
+            error, seq = self.last_error, self.state_seq
+        if state == 'LOADING':
+            # the board has reset: commands that timed out before will never be answered
+            self.transport.drop_expired()
+        # shared with the API (dashboard push) instead of rewriting last_state.json
+        self.store.update('state', {'state': state, 'error': error, 'seq': seq})
+        for cb in subscribers:
+            try:
+                cb(state, prev)
+            except Exception as e:
+                log_event.error(f"subscriber error: {e}", bin=self.name)
+
+    def subscribe(self, callback: Callable[[str, Optional[str]], None]) -> Callable[[], None]:
+        """Call callback(state, previous_state) on every state event (reader thread).
+
+        Returns a function that removes the subscription.
+        """
+        with self._state_cv:
+            self._subscribers.append(callback)
+
+        def _unsubscribe() -> None:
+            with self._state_cv:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return _unsubscribe
+
+    def wait_for_state(self, states: Iterable[str], timeout: float, after_seq: Optional[int] = None) -> Optional[str]:
+        """Block until the current state is one of states; returns it, or None on timeout.
+
+        With after_seq only states reported after that state_seq count, so a
+        caller can wait for the *next* IDLE while the device is still IDLE.
+        """
+        wanted = set(states)
+        deadline = time.monotonic() + timeout
+
+        def _reached() -> bool:
+            if after_seq is not None and self.state_seq <= after_seq:
+                return False
+            return self.last_state in wanted
+
+        with self._state_cv:
+            while not _reached():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._state_cv.wait(remaining)
+            return self.last_state
+
+    def history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._state_cv:
+            items = list(self.state_history)
+        return items[-limit:] if limit else items
+
+    def send(self, command: str, value) -> Optional[str]:
+        if command not in commands:
+            raise ValueError(f"Invalid command '{command}'")
+        proto_cmd = commands[command]
+        line = f"{proto_cmd}::{value}\n"
+        return self.transport.request(proto_cmd, line)
+
+    def send_many(self, items: Iterable[Tuple[str, Any]]) -> List[Optional[str]]:
+        """send() for several (command, value) pairs in one burst: all lines are written
+        back to back and the acks collected afterwards (None where one timed out)."""
+        lines = []
+        for command, value in items:
+            if command not in commands:
+                raise ValueError(f"Invalid command '{command}'")
+            proto_cmd = commands[command]
+            lines.append((proto_cmd, f"{proto_cmd}::{value}\n"))
+        return self.transport.request_many(lines)
+
+    async def send_async(self, command: str, value, dedup: bool = True) -> Optional[str]:
+        """send() for event loops: awaits the ack future set by the reader thread."""
+        if command not in commands:
+            raise ValueError(f"Invalid command '{command}'")
+        proto_cmd = commands[command]
+        line = f"{proto_cmd}::{value}\n"
+        return await self.transport.request_async(proto_cmd, line, dedup=dedup)
+
+    # Convenience methods
+    def ping(self) -> bool:
+        p = self.send('ping', 'x')
+        return p == 'pong'
+
+    def get_state(self) -> Optional[str]:
+        return self.send('gState', 'x')
+
+    def start(self, type_value: int | str) -> bool:
+        return self.send('start', type_value) == 'OK'
+
+    def move_tray(self, type_value: int | str) -> bool:
+        return self.send('mTray', type_value) == 'OK'
+
+    def move_bottle(self, pos: int) -> Optional[str]:
+        return self.send('mPosBottle', pos)
+
+    # Diagnostics: tray
+    def diag_tray(self) -> Optional[Dict[str, Any]]:
+        payload = self.send('gDiagTray', 'x')
+        if not payload:
+            return None
+        return parse_diag_tray(payload)
+
+    # Diagnostics: bottle
+    def diag_bottle(self) -> Optional[int]:
+        payload = self.send('gDiagBottle', 'x')
+        if not payload:
+            return None
+        try:
+            if payload.startswith('state='):
+                return int(payload.split('=', 1)[1].strip())
+            return int(payload)
+        except Exception:
+            return None
+
+    # Settings
+    def set_tray_pos(self, type_value: int | str, steps: int) -> Optional[bool]:
+        ack = self.send('setTrayPos', f"{type_value}={int(steps)}")
+        return True if ack == 'OK' else (False if ack else None)
+
+    def set_bottle_speed(self, ms: int) -> Optional[bool]:
+        ack = self.send('setBottleSpeed', int(ms))
+        return True if ack == 'OK' else (False if ack else None)
+
+    # Settings and queries added
+    def get_tray_enabled(self) -> Optional[bool]:
+        val = self.send('gTrayEnabled', 'x')
+        if val is None:
+            return None
+        try:
+            return bool(int(val))
+        except Exception:
+            return None
+
+    def set_tray_enabled(self, enabled: bool) -> Optional[bool]:
+        v = '1' if enabled else '0'
+        ack = self.send('setTrayEnabled', v)
+        return True if ack == 'OK' else (False if ack else None)
+
+    def recover(self) -> Optional[bool]:
+        ack = self.send('recover', 'x')
+        return True if ack == 'OK' else (False if ack else None)
+
+    def get_last_error(self) -> Optional[str]:
+        return self.send('gLastError', 'x')
+
+    def get_bottle_angle(self) -> Optional[int]:
+        val = self.send('gBottleAngle', 'x')
+        try:
+            return int(val) if val is not None else None
+        except Exception:
+            return None
+
+    def set_bottle_angle(self, deg: int) -> Optional[int]:
+        val = self.send('mBottleAngle', int(deg))
+        try:
+            return int(val) if val is not None else None
+        except Exception:
+            return None
+
+def parse_diag_tray(payload: str) -> Dict[str, Any]:
+    """gDiagTray payload 'pos=..,target=..,dtg=..,speed=..,state=..' as a dict."""
+    out: Dict[str, Any] = {}
+    try:
+        parts = [p.strip() for p in payload.split(',') if p.strip()]
+        for p in parts:
+            if '=' in p:
+                k, v = p.split('=', 1)
+                k = k.strip(); v = v.strip()
+                if k in ('pos', 'target', 'dtg', 'speed'):
+                    try:
+                        out[k] = int(v)
+                    except Exception:
+                        out[k] = v
+                elif k == 'state':
+                    out[k] = v
+        return out
+    except Exception:
+        return {'raw': payload}
+
+# Type mapping helpers
+TYPE_NAME_BY_ID = {0: 'PLASTIC', 1: 'GLAS', 2: 'CAN'}
+ID_BY_NAME = {
+    'plastic': 0, 'plastik': 0,
+    'glas': 1, 'glass': 1,
+    'can': 2, 'dose': 2,
+}
+
+def normalize_type(value) -> Optional[int]:
+    try:
+        iv = int(value)
+        if iv in (0, 1, 2):
+            return iv
+    except Exception:
+        pass
+    if isinstance(value, str):
+        return ID_BY_NAME.get(value.strip().lower())
+    return None
+
+
+def label_type(label: Optional[str]) -> Optional[int]:
+    """Type id named by a model label: exact name, else a name containing one (e.g. plastic_bottle)."""
+    if not label:
+        return None
+    type_id = normalize_type(label)
+    if type_id is None:
+        lbl = label.lower()
+        if 'plast' in lbl:
+            type_id = 0
+        elif 'glas' in lbl or 'glass' in lbl:
+            type_id = 1
+        elif 'can' in lbl or 'dose' in lbl or 'metal' in lbl:
+            type_id = 2
+    return type_id
+
+
+# Automatic cycle helpers
+
+# Silence after MOVING_TO_IDLE before one gState is sent (the IDLE event line may be lost)
+STATE_POLL_FALLBACK_S = 5.0
+
+
+def wait_for_idle(arduino: Arduino, timeout_s: float = 5.0) -> bool:
+    # No event seen yet (e.g. right after connect): ask once
+    if arduino.last_state is None:
+        st = arduino.get_state()
+        if st == 'IDLE':
+            return True
+    return arduino.wait_for_state(('IDLE',), timeout=timeout_s) == 'IDLE'
+
+
+def run_automatic_cycle(arduino: Arduino, type_id: int, timeout_s: float = 30.0, trace=None) -> bool:
+    """start::<type> once the device is IDLE, then wait for the next IDLE.
+
+    With a tracing.Trace the IDLE wait, the start ack round trip and the
+    cycle itself (ack until IDLE/failure) are recorded as spans.
+    """
+    t_wait = time.monotonic()
+    idle = wait_for_idle(arduino, timeout_s=5.0)
+    if trace is not None:
+        trace.add('wait_for_idle', t_wait, time.monotonic(), idle=idle)
+    if not idle:
+        log_auto.warning('not IDLE, aborting start', bin=arduino.name, type_id=type_id)
+        metrics.CYCLE_FAILURES.labels(arduino.name, 'NOT_IDLE').inc()
+        return False
+    seq = arduino.state_seq
+    t_send = time.monotonic()
+    acked = arduino.start(type_id)
+    t_start = time.monotonic()
+    if trace is not None:
+        trace.add('start_ack', t_send, t_start, type=TYPE_NAME_BY_ID.get(type_id), acked=acked)
+    if not acked:
+        log_auto.warning('start::<type> was not acknowledged', bin=arduino.name, type_id=type_id)
+        metrics.CYCLE_FAILURES.labels(arduino.name, 'NO_ACK').inc()
+        return False
+    trace_id = trace.id if trace is not None else None
+    log_auto.info(f"started, type {type_id}={TYPE_NAME_BY_ID.get(type_id)}", bin=arduino.name, type_id=type_id,
+                  trace_id=trace_id, start_ack_ms=round((t_start - t_send) * 1000.0, 1))
+
+    def _done(outcome: str) -> None:
+        t_end = time.monotonic()
+        metrics.CYCLES.labels(arduino.name, outcome).observe(t_end - t_start)
+        if trace is not None:
+            trace.add('cycle', t_start, t_end, outcome=outcome, error=arduino.last_error)
+
+    def _completed_by_poll() -> bool:
+        if arduino.get_state() != 'IDLE':
+            return False
+        log_auto.info('cycle completed (poll)', bin=arduino.name, trace_id=trace_id,
+                      cycle_s=round(time.monotonic() - t_start, 2))
+        _done('ok')
+        return True
+
+    # Events only: the firmware reads serial input only while IDLE, so a gState sent during
+    # the cycle stays unread until the cycle ends and costs an ack timeout; its late ack
+    # would then be answered in front of the next command. gState is sent only when the
+    # last event says the board should be back (MOVING_TO_IDLE and silence since, i.e. the
+    # IDLE line was lost) and once after the timeout.
+    deadline = t_start + timeout_s
+    polled_seq = None
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        st = arduino.wait_for_state(('IDLE', 'EMO_MOOD'), timeout=min(remaining, STATE_POLL_FALLBACK_S), after_seq=seq)
+        if st == 'IDLE':
+            log_auto.info('cycle completed (event)', bin=arduino.name, trace_id=trace_id,
+                          cycle_s=round(time.monotonic() - t_start, 2))
+            _done('ok')
+            return True
+        if st == 'EMO_MOOD':
+            log_auto.error(f"cycle failed: error={arduino.last_error}", bin=arduino.name, trace_id=trace_id,
+                           error=arduino.last_error, cycle_s=round(time.monotonic() - t_start, 2))
+            _done('failed')
+            metrics.CYCLE_FAILURES.labels(arduino.name, arduino.last_error or 'UNKNOWN').inc()
+            return False
+        last = arduino.history(1)
+        if (last and last[-1]['seq'] > seq and last[-1]['state'] == 'MOVING_TO_IDLE'
+                and last[-1]['seq'] != polled_seq
+                and time.monotonic() - last[-1]['mono'] >= STATE_POLL_FALLBACK_S):
+            polled_seq = last[-1]['seq']
+            if _completed_by_poll():
+                return True
+    if _completed_by_poll():
+        return True
+    log_auto.error('timeout while waiting for IDLE', bin=arduino.name, trace_id=trace_id, timeout_s=timeout_s)
+    _done('failed')
+    metrics.CYCLE_FAILURES.labels(arduino.name, 'TIMEOUT').inc()
+    return False
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from features import LogMelBands
+
+
+class InferenceBackend:
+    """Inference backend: init() -> model info, classify(segment) -> result, close().
+
+    init() and classify() return the same shapes as the Edge Impulse runner
+    ({'model_parameters': {'labels', 'frequency'}, 'project': {...}} and
+    {'result': {'classification': {label: score}}, 'timing': {...}}), so the
+    rest of the daemon does not care which backend is loaded. Usable as a
+    context manager like AudioImpulseRunner.
+    """
+    name = 'base'
+
+    def __init__(self):
+        self.labels: List[str] = []
+        self.frequency = 16000
+
+    def init(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def classify(self, segment: np.ndarray) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def model_info(self, owner: str, name: str) -> Dict[str, Any]:
+        return {
+            'project': {'owner': owner, 'name': name},
+            'model_parameters': {'labels': list(self.labels), 'frequency': self.frequency},
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class EdgeImpulseBackend(InferenceBackend):
+    """The .eim model through edge_impulse_linux's AudioImpulseRunner.
+
+    The runner talks to the model process over one socket with a shared
+    message counter and input buffer, so calls are serialized: with
+    CLASSIFY_MODE=both the classify and stream workers share one backend.
+    """
+    name = 'eim'
+
+    def __init__(self, model_path: str):
+        super().__init__()
+        self.model_path = model_path
+        self._runner = None
+        self._lock = threading.Lock()
+
+    def init(self) -> Dict[str, Any]:
+        from edge_impulse_linux.audio import AudioImpulseRunner
+        self._runner = AudioImpulseRunner(str(self.model_path))
+        info = self._runner.init()
+        params = info['model_parameters']
+        self.labels = list(params['labels'])
+        self.frequency = params.get('frequency', 16000)
+        return info
+
+    def classify(self, segment: np.ndarray) -> Dict[str, Any]:
+        with self._lock:
+            return self._runner.classify(segment)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._runner is not None:
+                self._runner.stop()
+                self._runner = None
+
+
+class StubBackend(InferenceBackend):
+    """Deterministic in-process stub for hardware-free tests and benchmarks.
+
+    Scores are a softmax over the mean log-mel energy of one group of bands
+    per label, so the same audio always yields the same result.
+    latency_ms adds a fixed sleep per call to mimic a real model.
+    """
+    name = 'stub'
+
+    def __init__(self, labels: Optional[List[str]] = None, frequency: int = 16000,
+                 latency_ms: float = 0.0):
+        super().__init__()
+        self.labels = list(labels or ['can', 'glas', 'plastic'])
+        self.frequency = int(frequency)
+        self.latency_ms = float(latency_ms)
+        self._bands = LogMelBands(self.frequency, bands=3 * len(self.labels))
+
+    def init(self) -> Dict[str, Any]:
+        return self.model_info('stub', 'deterministic stub')
+
+    def classify(self, segment: np.ndarray) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        db = self._bands(np.asarray(segment, dtype=np.int16)).mean(axis=0)
+        groups = db.reshape(len(self.labels), -1).mean(axis=1) if db.size % len(self.labels) == 0 \
+            else np.resize(db, len(self.labels))
+        z = (groups - groups.max()) / 10.0
+        p = np.exp(z)
+        p /= p.sum()
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+        dsp_ms = (time.perf_counter() - t0) * 1000.0
+        return {
+            'result': {'classification': {lbl: float(v) for lbl, v in zip(self.labels, p)}},
+            'timing': {'dsp': dsp_ms, 'classification': 0, 'anomaly': 0},
+        }
+
+
+class NumpyBackend(InferenceBackend):
+    """Small dense network over log-mel features, evaluated with NumPy.
+
+    Loads an .npz exported from a TFLite/ONNX model (or trained directly):
+      labels      (n,)      class names
+      frequency   ()        sample rate, default 16000
+      frame, bands ()       log-mel framing, default 512 / 24
+      mean, std   (f,)      optional feature normalisation
+      W0, b0, W1, b1, ...   dense layers, ReLU between, softmax at the end
+    """
+    name = 'numpy'
+
+    def __init__(self, model_path: str):
+        super().__init__()
+        self.model_path = model_path
+        self._layers: List[tuple] = []
+        self._mean = None
+        self._std = None
+        self._bands: Optional[LogMelBands] = None
+
+    def init(self) -> Dict[str, Any]:
+        with np.load(self.model_path, allow_pickle=False) as z:
+            self.labels = [str(x) for x in z['labels']]
+            self.frequency = int(z['frequency']) if 'frequency' in z else 16000
+            frame = int(z['frame']) if 'frame' in z else 512
+            bands = int(z['bands']) if 'bands' in z else 24
+            self._mean = z['mean'].astype(np.float32) if 'mean' in z else None
+            self._std = z['std'].astype(np.float32) if 'std' in z else None
+            i = 0
+            while f'W{i}' in z:
+                self._layers.append((z[f'W{i}'].astype(np.float32), z[f'b{i}'].astype(np.float32)))
+                i += 1
+        if not self._layers:
+            raise ValueError(f"{self.model_path}: no dense layers (W0/b0) found")
+        self._bands = LogMelBands(self.frequency, frame, bands)
+        return self.model_info('numpy', os.path.basename(self.model_path))
+
+    @property
+    def features(self) -> Optional[LogMelBands]:
+        """The log-mel front end, so callers can compute (and reuse) features themselves."""
+        return self._bands
+
+    def classify(self, segment: np.ndarray) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        feats = self._bands(np.asarray(segment, dtype=np.int16))
+        result = self.classify_features(feats)
+        result['timing']['dsp'] += (time.perf_counter() - t0) * 1000.0
+        return result
+
+    def classify_features(self, feats: np.ndarray) -> Dict[str, Any]:
+        """classify() on a precomputed (frames, bands) log-mel matrix."""
+        t0 = time.perf_counter()
+        x = np.asarray(feats, dtype=np.float32).reshape(-1)
+        if self._mean is not None:
+            x = x - self._mean
+        if self._std is not None:
+            x = x / np.maximum(self._std, 1e-6)
+        t1 = time.perf_counter()
+        for i, (w, b) in enumerate(self._layers):
+            x = x @ w + b
+            if i < len(self._layers) - 1:
+                np.maximum(x, 0.0, out=x)
+        x = np.exp(x - x.max())
+        x /= x.sum()
+        t2 = time.perf_counter()
+        return {
+            'result': {'classification': {lbl: float(v) for lbl, v in zip(self.labels, x)}},
+            'timing': {'dsp': (t1 - t0) * 1000.0, 'classification': (t2 - t1) * 1000.0, 'anomaly': 0},
+        }
+
+
+def create_backend(env, model_path: str) -> InferenceBackend:
+    """Backend selected by INFERENCE_BACKEND (eim|stub|numpy).
+
+    With INFERENCE_WORKERS > 1 the backend runs in that many worker processes
+    (inference_pool.InferencePool), each with its own instance.
+    """
+    workers = int(env.get('INFERENCE_WORKERS', '1'))
+    if workers > 1:
+        from inference_pool import InferencePool
+        return InferencePool(env, model_path, workers,
+                             slot_samples=int(env.get('INFERENCE_SLOT_SAMPLES', '48000')),
+                             start_method=env.get('INFERENCE_START_METHOD', 'spawn'),
+                             max_failed_starts=int(env.get('INFERENCE_MAX_FAILED_STARTS', '5')))
+    kind = env.get('INFERENCE_BACKEND', 'eim').strip().lower()
+    if kind == 'eim':
+        return EdgeImpulseBackend(model_path)
+    if kind == 'stub':
+        labels = [s.strip() for s in env.get('STUB_LABELS', 'can,glas,plastic').split(',') if s.strip()]
+        return StubBackend(labels, int(env.get('STUB_FREQUENCY', '16000')),
+                           float(env.get('STUB_LATENCY_MS', '0')))
+    if kind == 'numpy':
+        path = env.get('NUMPY_MODEL_PATH')
+        if path:
+            path = os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
+        return NumpyBackend(path or model_path)
+    raise ValueError(f"Invalid INFERENCE_BACKEND '{kind}'")
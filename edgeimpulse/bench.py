@@ -0,0 +1,420 @@
+"""Benchmark suite for the daemon's hot paths, with stored baselines.
+
+Every case reports microseconds per operation (best of several repeats, so
+scheduler noise on the Pi inflates it less). With --save the results become
+the baseline for this machine (stored per CPU architecture and Python
+version in bench_baseline.json). No baseline is committed: record one on
+the reference commit first. Later runs compare against it and exit
+with status 1 if a case got slower by more than --threshold (twice that
+for the api.* cases, whose client and server share one process).
+
+    python edgeimpulse/bench.py                  # run all, compare with baseline
+    python edgeimpulse/bench.py --save           # record the baseline on this machine
+    python edgeimpulse/bench.py --only trigger --threshold 0.1
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from arduino import Arduino, normalize_type, parse_diag_tray
+from classifier import ClassificationService
+from decision import DecisionEngine
+from detector import SegmentDetector
+import logs
+from ringbuffer import BlockRing, Int16RingBuffer
+from state_store import StateStore
+from trigger import create_trigger
+
+SAMPLE_RATE = 16000
+BLOCK = int(SAMPLE_RATE * 0.02)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'bench_baseline.json')
+
+
+def _timeit(op: Callable[[], None], number: int, repeat: int) -> float:
+    """Best-of-repeat time per call of op in microseconds."""
+    op()
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            op()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best * 1e6
+
+
+def _blocks(n: int, burst_every: int = 0) -> List[np.ndarray]:
+    """Noise blocks; with burst_every one loud 'impact' block every N blocks."""
+    rng = np.random.default_rng(0)
+    blocks = [rng.integers(-300, 300, BLOCK, dtype=np.int16) for _ in range(n)]
+    if burst_every:
+        for i in range(burst_every - 1, n, burst_every):
+            blocks[i] = rng.integers(-12000, 12000, BLOCK, dtype=np.int16)
+    return blocks
+
+
+def _cycler(items: List) -> Callable[[], object]:
+    it = [0]
+
+    def _next():
+        i = it[0]
+        it[0] = i + 1 if i + 1 < len(items) else 0
+        return items[i]
+    return _next
+
+
+# Cases: fn(scale) -> us per operation; scale < 1 for --quick
+
+def bench_ring_write(scale: float) -> float:
+    """Int16RingBuffer.write of one 20 ms block."""
+    ring = Int16RingBuffer(SAMPLE_RATE + 2 * BLOCK)
+    nxt = _cycler(_blocks(64))
+    return _timeit(lambda: ring.write(nxt()), int(5000 * scale) or 1, 5)
+
+
+def bench_audio_callback(scale: float) -> float:
+    """Audio callback hand-off: BlockRing.put of one (frames, 1) PortAudio block, then get."""
+    ring = BlockRing(8, BLOCK)
+    nxt = _cycler([b.reshape(-1, 1) for b in _blocks(64)])
+
+    def _op():
+        ring.put(nxt()[:, 0])
+        ring.get()
+    return _timeit(_op, int(5000 * scale) or 1, 5)
+
+
+def _bench_trigger(mode: str, scale: float) -> float:
+    trig = create_trigger({'TRIGGER_MODE': mode}, SAMPLE_RATE, BLOCK)
+    nxt = _cycler(_blocks(100, burst_every=50))
+    return _timeit(lambda: trig.process(nxt()), int(3000 * scale) or 1, 5)
+
+
+def bench_trigger_rms(scale: float) -> float:
+    """RMS trigger features for one block."""
+    return _bench_trigger('rms', scale)
+
+
+def bench_trigger_adaptive(scale: float) -> float:
+    """Adaptive (RMS + flux + band ratio) trigger for one block."""
+    return _bench_trigger('adaptive', scale)
+
+
+def bench_detector_feed(scale: float) -> float:
+    """Full per-block path: ring write, trigger and segment assembly (one burst per second)."""
+    classifier = ClassificationService()
+    blocks = _blocks(500, burst_every=50)
+    n = len(blocks)
+
+    def _run():
+        classifier.reset_triggers()
+        detector = SegmentDetector(create_trigger({}, SAMPLE_RATE, BLOCK), classifier, BLOCK, SAMPLE_RATE)
+        for b in blocks:
+            detector.feed(b)
+    return _timeit(_run, max(1, int(4 * scale)), 3) / n
+
+
+def bench_segment_window(scale: float) -> float:
+    """Copy of one 1 s classification window out of the ring."""
+    ring = Int16RingBuffer(SAMPLE_RATE + 2 * BLOCK)
+    for b in _blocks(60):
+        ring.write(b)
+    start = ring.total_written - SAMPLE_RATE
+    return _timeit(lambda: ring.window(start, SAMPLE_RATE).copy(), int(5000 * scale) or 1, 5)
+
+
+def bench_normalize_type(scale: float) -> float:
+    """normalize_type over ids, names and junk."""
+    nxt = _cycler([0, '2', 'Glass', ' plastic ', 'dose', 'unknown', None, 7])
+    return _timeit(lambda: normalize_type(nxt()), int(20000 * scale) or 1, 5)
+
+
+def bench_decision_evaluate(scale: float) -> float:
+    """DecisionEngine.evaluate on the scores and 3 shifted windows of one trigger (accept/uncertain/reject)."""
+    engine = DecisionEngine(thresholds={'glas': 0.8}, reject_labels=['noise'])
+    cases = []
+    for scores in ({'can': 0.93, 'glas': 0.04, 'plastic': 0.02, 'noise': 0.01},
+                   {'can': 0.30, 'glas': 0.41, 'plastic': 0.27, 'noise': 0.02},
+                   {'can': 0.05, 'glas': 0.03, 'plastic': 0.88, 'noise': 0.04},
+                   {'can': 0.46, 'glas': 0.02, 'plastic': 0.42, 'noise': 0.10},
+                   {'can': 0.04, 'glas': 0.03, 'plastic': 0.03, 'noise': 0.90}):
+        top = max(scores, key=scores.get)
+        other = min(scores, key=scores.get)
+        windows = [scores, scores, {**scores, top: scores[other], other: scores[top]}]
+        cases.append((scores, windows))
+    nxt = _cycler(cases)
+
+    def _op():
+        scores, windows = nxt()
+        engine.evaluate(scores, windows)
+    return _timeit(_op, int(20000 * scale) or 1, 5)
+
+
+def bench_diag_tray_parse(scale: float) -> float:
+    """gDiagTray payload parsing."""
+    payload = 'pos=1234,target=2400,dtg=1166,speed=800,state=MOVING'
+    return _timeit(lambda: parse_diag_tray(payload), int(20000 * scale) or 1, 5)
+
+
+class _ReplaySerial:
+    """Serial stand-in that hands out prepared lines as fast as they are read."""
+    def __init__(self, lines: List[bytes]):
+        self.lines = lines
+        self.i = 0
+        self.done = threading.Event()
+
+    def readline(self) -> bytes:
+        i = self.i
+        if i >= len(self.lines):
+            self.done.set()
+            time.sleep(0.001)
+            return b''
+        self.i = i + 1
+        return self.lines[i]
+
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+    def close(self) -> None:
+        pass
+
+
+def bench_serial_read_loop(scale: float) -> float:
+    """Arduino._read_loop per line: state events, errors, acks and unknown lines."""
+    states = ['CONTAINS_BOTTLE', 'TRAY_IN_POSITION', 'MOVING_BOTTLE_TO_TRAY', 'BOTTLE_IN_TRAY', 'MOVING_TO_IDLE', 'IDLE']
+    pattern = [f"event::state::{s}\n".encode() for s in states]
+    pattern += [b'gState::ack::IDLE\n', b'ping::ack::pong\n', b'event::error::TRAY_TIMEOUT\n', b'debug: tray 1234\n']
+    n = max(len(pattern), int(20000 * scale))
+    lines = (pattern * (n // len(pattern) + 1))[:n]
+    best = float('inf')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        for _ in range(3):
+            ser = _ReplaySerial(lines)
+            t0 = time.perf_counter()
+            a = Arduino('bench', ser=ser, store=StateStore())
+            ser.done.wait(60.0)
+            best = min(best, (time.perf_counter() - t0) / n)
+            a.close()
+    return best * 1e6
+
+
+def bench_log_record(scale: float) -> float:
+    """logs: one structured record handed to the async writer (rate limiter, record, queue)."""
+    n = max(1000, int(20000 * scale))
+    log = logs.get('BENCH')
+    best = float('inf')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        logs.setup({'LOG_RATE_LIMIT': '0', 'LOG_QUEUE_SIZE': str(3 * n + 1)})
+        try:
+            for _ in range(3):
+                t0 = time.perf_counter()
+                for i in range(n):
+                    log.info("main: trigger RMS=4578.7 onset=+0", category='BENCH.record', bin='main',
+                             trace_id=i, rms=4578.7, onset_index=i)
+                best = min(best, (time.perf_counter() - t0) / n)
+        finally:
+            logs.shutdown()
+    return best * 1e6
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+_api: Dict[str, object] = {}  # one server for all api.* cases
+
+
+def _api_server() -> Tuple[int, StateStore]:
+    if not _api:
+        # main pulls in sounddevice/uvicorn; imported here so the other cases run without them
+        import main as daemon
+        port = _free_port()
+        os.environ['DASH_HOST'] = '127.0.0.1'
+        os.environ['DASH_PORT'] = str(port)
+        store = StateStore()
+        store.update('state', {'state': 'IDLE', 'error': None, 'seq': 0})
+        store.update('result', {'scores': {'can': 0.9, 'glas': 0.05, 'plastic': 0.05}, 'top_label': 'can',
+                                'top_score': 0.9, 'type_id': 2, 'type_name': 'CAN'})
+        daemon.start_api_server(None, store=store)
+        deadline = time.monotonic() + 10.0
+        while True:
+            try:
+                c = http.client.HTTPConnection('127.0.0.1', port, timeout=1.0)
+                c.request('GET', '/api/health')
+                c.getresponse().read()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        _api.update(port=port, store=store)
+    return _api['port'], _api['store']
+
+
+def _bench_api(path: str, scale: float, concurrency: int = 8, repeat: int = 3) -> Tuple[float, Dict[str, float]]:
+    port, store = _api_server()
+    # concurrent writers like the serial reader/classifier (about 100 updates/s)
+    stop = threading.Event()
+
+    def _writer():
+        seq = 0
+        while not stop.wait(0.01):
+            seq += 1
+            store.update('state', {'state': 'IDLE', 'error': None, 'seq': seq})
+
+    threading.Thread(target=_writer, daemon=True).start()
+    per_client = max(10, int(200 * scale))
+
+    def _client(_) -> List[float]:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5.0)
+        lat = []
+        for _ in range(per_client):
+            t0 = time.perf_counter()
+            conn.request('GET', path)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                raise RuntimeError(f"{path}: HTTP {resp.status}")
+            lat.append(time.perf_counter() - t0)
+        conn.close()
+        return lat
+
+    best = None
+    try:
+        with ThreadPoolExecutor(concurrency) as pool:
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                lat = np.concatenate([np.asarray(x) for x in pool.map(_client, range(concurrency))])
+                wall = time.perf_counter() - t0
+                if best is None or wall < best[0]:
+                    best = (wall, lat)
+    finally:
+        stop.set()
+    wall, lat = best
+    p50, p99 = np.percentile(lat, [50, 99]) * 1e6
+    return wall / lat.size * 1e6, {'p50_us': float(p50), 'p99_us': float(p99), 'req_per_s': lat.size / wall}
+
+
+def bench_api_state(scale: float):
+    """GET /api/state, 8 keep-alive clients while the store is updated at 100 Hz (best-of-3 wall time per request)."""
+    return _bench_api('/api/state', scale)
+
+
+def bench_api_result(scale: float):
+    """GET /api/result under the same load."""
+    return _bench_api('/api/result', scale)
+
+
+CASES: Dict[str, Callable[[float], object]] = {
+    'ring.write': bench_ring_write,
+    'audio.callback': bench_audio_callback,
+    'trigger.rms': bench_trigger_rms,
+    'trigger.adaptive': bench_trigger_adaptive,
+    'detector.feed': bench_detector_feed,
+    'segment.window': bench_segment_window,
+    'mapping.normalize_type': bench_normalize_type,
+    'decision.evaluate': bench_decision_evaluate,
+    'serial.read_loop': bench_serial_read_loop,
+    'serial.diag_tray_parse': bench_diag_tray_parse,
+    'log.record': bench_log_record,
+    'api.state': bench_api_state,
+    'api.result': bench_api_result,
+}
+
+
+def machine_key() -> str:
+    return f"{platform.machine()}-py{sys.version_info.major}.{sys.version_info.minor}"
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def run(names: List[str], scale: float) -> Dict[str, Dict[str, object]]:
+    results: Dict[str, Dict[str, object]] = {}
+    for name in names:
+        try:
+            out = CASES[name](scale)
+        except ImportError as e:
+            print(f"{name:26s} skipped ({e})")
+            continue
+        us, extra = out if isinstance(out, tuple) else (out, {})
+        results[name] = {'us': float(us), **extra}
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    p.add_argument('--only', action='append', default=[], help='run cases whose name contains this (repeatable)')
+    p.add_argument('--baseline', default=BASELINE_FILE)
+    p.add_argument('--save', action='store_true', help='store the results as baseline for this machine')
+    p.add_argument('--threshold', type=float, default=float(os.environ.get('BENCH_THRESHOLD', '0.25')),
+                   help='allowed slowdown vs. baseline (0.25 = +25%%)')
+    p.add_argument('--quick', action='store_true', help='fewer iterations (smoke test)')
+    p.add_argument('--json', default=None, help='also write the results to this file')
+    args = p.parse_args(argv)
+
+    names = [n for n in CASES if not args.only or any(o in n for o in args.only)]
+    if not names:
+        print(f"no case matches {args.only}; cases: {', '.join(CASES)}")
+        return 2
+    key = machine_key()
+    baselines = load_baseline(args.baseline)
+    base = baselines.get(key, {})
+    results = run(names, 0.2 if args.quick else 1.0)
+
+    regressions = []
+    print(f"\n{'case':26s} {'us/op':>10s} {'baseline':>10s} {'delta':>8s}")
+    for name, r in results.items():
+        us = r['us']
+        ref = base.get(name)
+        if ref:
+            delta = us / ref - 1.0
+            # the HTTP cases share the CPU with the in-process server and vary more
+            limit = args.threshold * (2.0 if name.startswith('api.') else 1.0)
+            flag = '  REGRESSION' if delta > limit else ''
+            if flag:
+                regressions.append(name)
+            line = f"{name:26s} {us:10.2f} {ref:10.2f} {delta:+7.0%}{flag}"
+        else:
+            line = f"{name:26s} {us:10.2f} {'-':>10s} {'':>8s}"
+        extra = ' '.join(f"{k}={v:.0f}" for k, v in r.items() if k != 'us')
+        print(line + (f"  ({extra})" if extra else ''))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'machine': key, 'results': results}, f, indent=2)
+    if args.save:
+        baselines[key] = {**base, **{n: round(r['us'], 3) for n, r in results.items()}}
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nbaseline for {key} saved to {args.baseline}")
+        return 0
+    if not base:
+        print(f"\nno baseline for {key} in {args.baseline}: baselines are per machine, "
+              f"record one with --save on the reference commit, then compare")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over +{args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\nno regression over +{args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
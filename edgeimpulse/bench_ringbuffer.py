@@ -0,0 +1,73 @@
+"""Micro-benchmark: deque-of-ints audio buffer vs. Int16RingBuffer.
+
+Replays N seconds of synthetic 20 ms int16 blocks through both buffer paths
+(ingest every block, build a 1 s segment once per second) and prints timings.
+
+    python edgeimpulse/bench_ringbuffer.py [seconds]
+"""
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from ringbuffer import Int16RingBuffer
+
+SAMPLE_RATE = 16000
+BLOCK = int(SAMPLE_RATE * 0.02)
+
+
+def _blocks(seconds: float):
+    rng = np.random.default_rng(0)
+    n = int(seconds * SAMPLE_RATE / BLOCK)
+    return [rng.integers(-3000, 3000, BLOCK, dtype=np.int16) for _ in range(n)]
+
+
+def bench_deque(blocks, buffer_size: int) -> float:
+    """The original main() path: tolist() into a deque, list() + pad + asarray per segment."""
+    audio_buffer = deque(maxlen=buffer_size)
+    blocks_per_segment = SAMPLE_RATE // BLOCK
+    t0 = time.perf_counter()
+    for i, b in enumerate(blocks, 1):
+        audio_buffer.extend(b.tolist())
+        if i % blocks_per_segment == 0:
+            segment = list(audio_buffer)
+            if len(segment) < buffer_size:
+                segment = ([0] * (buffer_size - len(segment))) + segment
+            segment = np.asarray(segment, dtype=np.int16)
+    return time.perf_counter() - t0
+
+
+def bench_ring(blocks, buffer_size: int) -> float:
+    audio_buffer = Int16RingBuffer(buffer_size)
+    blocks_per_segment = SAMPLE_RATE // BLOCK
+    t0 = time.perf_counter()
+    for i, b in enumerate(blocks, 1):
+        audio_buffer.write(b)
+        if i % blocks_per_segment == 0:
+            segment = audio_buffer.latest(buffer_size)
+    return time.perf_counter() - t0
+
+
+def main(seconds: float = 60.0) -> None:
+    blocks = _blocks(seconds)
+    buffer_size = SAMPLE_RATE
+    # Sanity: both paths must yield the same segment
+    ref = deque(maxlen=buffer_size)
+    ring = Int16RingBuffer(buffer_size)
+    for b in blocks[:77]:
+        ref.extend(b.tolist())
+        ring.write(b)
+    assert np.array_equal(np.asarray(list(ref), dtype=np.int16), ring.latest(buffer_size))
+
+    t_deque = bench_deque(blocks, buffer_size)
+    t_ring = bench_ring(blocks, buffer_size)
+    n = len(blocks)
+    print(f"audio: {seconds:.0f} s, {n} blocks of {BLOCK} samples")
+    print(f"deque : {t_deque * 1e3:8.1f} ms total, {t_deque / n * 1e6:7.2f} us/block")
+    print(f"ring  : {t_ring * 1e3:8.1f} ms total, {t_ring / n * 1e6:7.2f} us/block")
+    print(f"speedup: {t_deque / t_ring:.1f}x")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 60.0)
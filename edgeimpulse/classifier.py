@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from classify_cache import ClassificationCache, SegmentFingerprint
+
+
+class ClassificationRequest:
+    """Audio span around one (possibly coalesced) trigger onset."""
+    def __init__(self, audio: np.ndarray, onset: int, onset_index: int, coalesced: int = 0):
+        self.audio = audio              # int16 span covering every shifted window
+        self.onset = onset              # onset offset inside audio
+        self.onset_index = onset_index  # absolute sample index of the onset
+        self.coalesced = coalesced      # further triggers merged into this window
+        self.ts = time.time()
+        self.t_ready = time.monotonic()  # when the window was complete (queue wait starts)
+        self.trace = None               # tracing.Trace of the onset, if tracing is enabled
+
+
+class ClassificationService:
+    """Wraps AudioImpulseRunner: trigger coalescing, shifted windows, score aggregation.
+
+    The trigger loop reports onsets with add_trigger() and asks pop_ready()
+    which windows are fully recorded; classify() then runs one inference per
+    configured shift (e.g. -50/0/+50 ms around the onset), aggregates the
+    scores and records per-inference latency. An optional ClassificationCache
+    short-circuits windows whose fingerprint was classified before.
+    """
+    def __init__(self, pre_ms: float = 200.0, post_ms: float = 800.0,
+                 shifts_ms: Sequence[float] = (0.0,), aggregate: str = 'mean',
+                 cooldown_s: float = 0.3, latency_window: int = 500,
+                 cache: Optional[ClassificationCache] = None):
+        if aggregate not in ('mean', 'max'):
+            raise ValueError(f"Invalid aggregate '{aggregate}'")
+        self.pre_ms = float(pre_ms)
+        self.post_ms = float(post_ms)
+        self.shifts_ms = sorted(float(s) for s in shifts_ms) or [0.0]
+        self.aggregate = aggregate
+        self.cooldown_s = float(cooldown_s)
+        self.runner = None
+        self.cache = cache
+        self.sample_rate = 16000
+        self._configure_samples()
+        self._pending: List[List[int]] = []  # [onset_index, coalesced]
+        self._window_end = None               # end index of the newest accepted window
+        self._last_onset = None
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.triggers = 0
+        self.coalesced = 0
+        self.requests = 0
+        self.inferences = 0
+
+    @classmethod
+    def from_env(cls, env) -> 'ClassificationService':
+        shifts = [s for s in env.get('CLASSIFY_SHIFTS_MS', '0').split(',') if s.strip()]
+        return cls(
+            pre_ms=float(env.get('PRE_MS', '200')),
+            post_ms=float(env.get('POST_MS', '800')),
+            shifts_ms=[float(s) for s in shifts],
+            aggregate=env.get('CLASSIFY_AGGREGATE', 'mean').strip().lower(),
+            cooldown_s=float(env.get('TRIGGER_COOLDOWN_S', '0.3')),
+            cache=ClassificationCache.from_env(env),
+        )
+
+    def _configure_samples(self) -> None:
+        sr = self.sample_rate
+        self.window_samples = int(sr * (self.pre_ms + self.post_ms) / 1000.0)
+        self.pre_samples = int(sr * self.pre_ms / 1000.0)
+        self.post_samples = int(sr * self.post_ms / 1000.0)
+        self.shift_samples = [int(sr * s / 1000.0) for s in self.shifts_ms]
+        # Span around the onset that covers every shifted window
+        self.span_before = self.pre_samples - min(0, self.shift_samples[0])
+        self.span_after = self.post_samples + max(0, self.shift_samples[-1])
+        self.cooldown_samples = int(sr * self.cooldown_s)
+
+    def bind(self, runner, sample_rate: int) -> None:
+        """Attach the initialised runner; sizes are derived from the model frequency."""
+        self.runner = runner
+        self.sample_rate = int(sample_rate)
+        self._configure_samples()
+        if self.cache is not None and self.cache.fingerprint.sample_rate != self.sample_rate:
+            self.cache.fingerprint = SegmentFingerprint(self.sample_rate, tolerance_db=self.cache.fingerprint.tolerance_db)
+            self.cache.clear()
+
+    @property
+    def span_samples(self) -> int:
+        return self.span_before + self.span_after
+
+    # Trigger side (audio thread)
+    def reset_triggers(self) -> None:
+        """Forget pending windows and coalescing state (new stream, sample indices restart)."""
+        self._pending.clear()
+        self._window_end = None
+        self._last_onset = None
+
+    def add_trigger(self, onset_index: int) -> bool:
+        """Register a trigger onset. Returns False if it was merged into a pending window."""
+        self.triggers += 1
+        if (self._window_end is not None and onset_index < self._window_end) or \
+                (self._last_onset is not None and onset_index - self._last_onset < self.cooldown_samples):
+            self.coalesced += 1
+            if self._pending:
+                self._pending[-1][1] += 1
+            return False
+        self._pending.append([onset_index, 0])
+        self._last_onset = onset_index
+        self._window_end = onset_index + self.post_samples
+        return True
+
+    def pop_ready(self, ring) -> List[ClassificationRequest]:
+        """Cut every pending window whose audio is complete out of the ring buffer (copied)."""
+        ready = []
+        while self._pending and ring.total_written - self._pending[0][0] >= self.span_after:
+            onset_index, coalesced = self._pending.pop(0)
+            start = onset_index - self.span_before
+            audio = ring.window(start, self.span_samples).copy()
+            ready.append(ClassificationRequest(audio, self.span_before, onset_index, coalesced))
+        return ready
+
+    # Worker side
+    def windows(self, req: ClassificationRequest) -> List[np.ndarray]:
+        """The shifted 1 s windows of a request (views into req.audio)."""
+        out = []
+        for shift in self.shift_samples:
+            start = req.onset + shift - self.pre_samples
+            out.append(req.audio[start:start + self.window_samples])
+        return out
+
+    def primary_window(self, req: ClassificationRequest) -> np.ndarray:
+        """The window with the shift closest to the onset (0 ms if configured)."""
+        i = min(range(len(self.shift_samples)), key=lambda k: abs(self.shift_samples[k]))
+        return self.windows(req)[i]
+
+    def classify(self, req: ClassificationRequest) -> Dict[str, Any]:
+        """Classify every shifted window and aggregate the scores."""
+        return self.classify_many([req])[0]
+
+    def classify_many(self, reqs: List[ClassificationRequest]) -> List[Dict[str, Any]]:
+        """classify() for several requests; results in request order.
+
+        With a parallel runner (one that has classify_many, e.g. the
+        inference pool) every uncached window of every request is dispatched
+        at once instead of one after the other.
+        """
+        if self.runner is None:
+            raise RuntimeError("classification runner not bound")
+        self.requests += len(reqs)
+        per_window: List[List[Optional[Dict[str, float]]]] = [[None] * len(self.shift_samples) for _ in reqs]
+        latencies: List[List[float]] = [[] for _ in reqs]
+        todo = []  # (request index, window index, window, cache key)
+        for i, req in enumerate(reqs):
+            for j, (shift_ms, w) in enumerate(zip(self.shifts_ms, self.windows(req))):
+                key = self.cache.key(w) if self.cache is not None else None
+                if key is not None:
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        per_window[i][j] = cached
+                        if req.trace is not None:
+                            req.trace.mark('cache_hit', shift_ms=shift_ms)
+                        continue
+                todo.append((i, j, w, key))
+        if todo:
+            for (i, j, _, key), (result, dt, t1) in zip(todo, self._infer([t[2] for t in todo])):
+                latencies[i].append(dt)
+                metrics.CLASSIFY_LATENCY.observe(dt)
+                if reqs[i].trace is not None:
+                    reqs[i].trace.add('inference', t1 - dt / 1000.0, t1, shift_ms=self.shifts_ms[j])
+                with self._lock:
+                    self._latencies.append(dt)
+                self.inferences += 1
+                scores = result.get('result', {}).get('classification', {})
+                if key is not None:
+                    self.cache.put(key, scores)
+                per_window[i][j] = scores
+        out = []
+        for i, req in enumerate(reqs):
+            scores = self._aggregate(per_window[i])
+            top_label = max(scores, key=scores.get) if scores else None
+            out.append({
+                'scores': scores,
+                'top_label': top_label,
+                'top_score': scores.get(top_label, 0.0) if top_label else 0.0,
+                'windows': per_window[i],
+                'shifts_ms': list(self.shifts_ms),
+                'latency_ms': latencies[i],
+                'coalesced': req.coalesced,
+            })
+        return out
+
+    def _infer(self, windows: List[np.ndarray]) -> List[Tuple[Dict[str, Any], float, float]]:
+        """(result, latency ms, monotonic end) per window, in parallel if the runner can."""
+        many = getattr(self.runner, 'classify_many', None)
+        if many is not None and len(windows) > 1:
+            results = many(windows)
+            t1 = time.monotonic()
+            # the pool reports the worker-side inference time
+            return [(r, float(r.get('latency_ms', 0.0)), t1) for r in results]
+        out = []
+        for w in windows:
+            t0 = time.perf_counter()
+            result = self.runner.classify(w)
+            dt = (time.perf_counter() - t0) * 1000.0
+            out.append((result, dt, time.monotonic()))
+        return out
+
+    def _aggregate(self, per_window: List[Dict[str, float]]) -> Dict[str, float]:
+        if not per_window:
+            return {}
+        if len(per_window) == 1:
+            return dict(per_window[0])
+        labels = per_window[0].keys()
+        fn = max if self.aggregate == 'max' else (lambda v: sum(v) / len(v))
+        return {k: float(fn([w.get(k, 0.0) for w in per_window])) for k in labels}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = np.asarray(self._latencies, dtype=np.float64)
+        out: Dict[str, Any] = {
+            'triggers': self.triggers,
+            'coalesced': self.coalesced,
+            'pending': len(self._pending),
+            'requests': self.requests,
+            'inferences': self.inferences,
+            'shifts_ms': list(self.shifts_ms),
+            'aggregate': self.aggregate,
+            'cache': self.cache.stats() if self.cache is not None else None,
+        }
+        if lat.size:
+            p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+            out['latency_ms'] = {
+                'count': int(lat.size), 'mean': float(lat.mean()), 'max': float(lat.max()),
+                'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            }
+        else:
+            out['latency_ms'] = None
+        return out
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from features import LogMelBands
+
+
+class SegmentFingerprint:
+    """Cheap audio fingerprint: quantized log-mel band energies, hashed.
+
+    The segment is cut into non-overlapping frames, each frame's power
+    spectrum is summed into mel-spaced bands and converted to dB. Values are
+    quantized in steps of tolerance_db before hashing, so segments whose band
+    energies differ by less than one step (typically) share a key. With
+    tolerance_db <= 0 the raw samples are hashed (exact match only).
+    """
+    def __init__(self, sample_rate: int = 16000, frame: int = 512, bands: int = 24,
+                 tolerance_db: float = 1.5, floor_db: float = -90.0):
+        self.sample_rate = int(sample_rate)
+        self.tolerance_db = float(tolerance_db)
+        self._bands = LogMelBands(sample_rate, frame, bands, floor_db)
+
+    def __call__(self, segment: np.ndarray) -> str:
+        if self.tolerance_db <= 0:
+            return hashlib.blake2b(np.ascontiguousarray(segment).tobytes(), digest_size=16).hexdigest()
+        q = np.round(self._bands(segment) / self.tolerance_db).astype(np.int16)
+        return hashlib.blake2b(q.tobytes(), digest_size=16).hexdigest()
+
+
+class ClassificationCache:
+    """LRU cache of classification results keyed by segment fingerprint.
+
+    Bounded by entry count and by the approximate size of stored results.
+    """
+    def __init__(self, fingerprint: SegmentFingerprint, max_entries: int = 1024,
+                 max_bytes: int = 4 * 1024 * 1024):
+        self.fingerprint = fingerprint
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._entries: 'OrderedDict[str, Tuple[Dict[str, Any], int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, env, sample_rate: int = 16000) -> Optional['ClassificationCache']:
+        """Cache configured by CLASSIFY_CACHE*, or None if disabled."""
+        if env.get('CLASSIFY_CACHE', '0') != '1':
+            return None
+        fp = SegmentFingerprint(sample_rate, tolerance_db=float(env.get('CLASSIFY_CACHE_TOLERANCE_DB', '1.5')))
+        return cls(
+            fp,
+            max_entries=int(env.get('CLASSIFY_CACHE_ENTRIES', '1024')),
+            max_bytes=int(float(env.get('CLASSIFY_CACHE_MB', '4')) * 1024 * 1024),
+        )
+
+    def key(self, segment: np.ndarray) -> str:
+        return self.fingerprint(segment)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        size = len(key) + len(json.dumps(result, default=str))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, (_, s) = self._entries.popitem(last=False)
+                self._bytes -= s
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'tolerance_db': self.fingerprint.tolerance_db,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else None,
+            }
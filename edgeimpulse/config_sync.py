@@ -0,0 +1,254 @@
+"""Firmware configuration sync: desired settings from .env, diffed against the board.
+
+The firmware keeps its settings in RAM only, so they are pushed after every
+connect and every reboot. ConfigSync compares the desired values with what
+the board currently holds and sends only the differences, all in one
+pipelined burst, then reads back what the firmware can report.
+
+Only gTrayEnabled reads a setting back. Bottle speed and tray positions are
+write-only: their actual value is the last one acknowledged in this serial
+session, or the firmware default once the board has been seen booting
+(state LOADING). Until then they are unknown and pushed.
+
+Desired values may be changed at runtime (PUT /api/config) or re-read from
+.env (POST /api/config/reload); both take effect with the next sync, which
+the API runs as a job.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from dotenv import dotenv_values, find_dotenv
+
+import logs
+
+log = logs.get('CFG')
+
+# Values after a firmware reset (see arduino/platform-io/src)
+FIRMWARE_DEFAULTS: Dict[str, Any] = {
+    'tray_enabled': False,
+    'bottle_speed_ms': 15,
+    'tray_pos_plastic': 11000,
+    'tray_pos_glas': 10000,
+    'tray_pos_can': 1200,
+}
+# Settings the firmware can report (getter command)
+READABLE = {'tray_enabled': 'gTrayEnabled'}
+# tray_pos_<name> -> type id of setTrayPos
+TRAY_POS_TYPES = {'tray_pos_plastic': 0, 'tray_pos_glas': 1, 'tray_pos_can': 2}
+# .env keys per setting; later keys win (the named tray keys over the numeric ones)
+ENV_KEYS: Dict[str, Tuple[str, ...]] = {
+    'tray_enabled': ('TRAY_ENABLED',),
+    'bottle_speed_ms': ('BOTTLE_SPEED_MS',),
+    'tray_pos_plastic': ('TRAY_POS_0', 'TRAY_POS_PLASTIC'),
+    'tray_pos_glas': ('TRAY_POS_1', 'TRAY_POS_GLAS'),
+    'tray_pos_can': ('TRAY_POS_2', 'TRAY_POS_CAN'),
+}
+
+
+def parse_setting(key: str, value: Any) -> Any:
+    """Validated value of one setting; raises ValueError."""
+    if key not in FIRMWARE_DEFAULTS:
+        raise ValueError(f"Unknown setting '{key}'")
+    if key == 'tray_enabled':
+        if isinstance(value, bool):
+            return value
+        v = str(value).strip().lower()
+        if v in ('1', 'true', 'on', 'yes'):
+            return True
+        if v in ('0', 'false', 'off', 'no'):
+            return False
+        raise ValueError(f"Invalid {key} '{value}' (0/1)")
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {key} '{value}' (integer)")
+    if key == 'bottle_speed_ms' and n <= 0:
+        raise ValueError(f"Invalid {key} {n} (> 0)")
+    if n < 0:
+        raise ValueError(f"Invalid {key} {n} (>= 0)")
+    return n
+
+
+def desired_from_env(env: Mapping[str, str]) -> Dict[str, Any]:
+    """Settings given in the environment; empty keys leave the firmware value alone."""
+    out: Dict[str, Any] = {}
+    for key, names in ENV_KEYS.items():
+        for name in names:
+            v = env.get(name)
+            if v is None or str(v).strip() == '':
+                continue
+            try:
+                out[key] = parse_setting(key, v)
+            except ValueError as e:
+                log.warning(f"ignoring {name}: {e}")
+    return out
+
+
+def current_env() -> Dict[str, str]:
+    """Process environment with the .env file re-read over it (for a reload at runtime)."""
+    env = dict(os.environ)
+    path = find_dotenv()
+    if path:
+        env.update({k: v for k, v in dotenv_values(path).items() if v is not None})
+    return env
+
+
+def _command(key: str, value: Any) -> Tuple[str, Any]:
+    if key == 'tray_enabled':
+        return 'setTrayEnabled', '1' if value else '0'
+    if key == 'bottle_speed_ms':
+        return 'setBottleSpeed', int(value)
+    return 'setTrayPos', f"{TRAY_POS_TYPES[key]}={int(value)}"
+
+
+class ConfigSync:
+    """Desired vs. actual firmware settings of one bin.
+
+    sync() runs on one thread at a time (the config phase or the job worker,
+    under the bin's cycle lock); the state event subscriber and stats() may
+    run on other threads.
+    """
+    def __init__(self, desired: Optional[Dict[str, Any]] = None,
+                 source: Optional[Callable[[], Dict[str, Any]]] = None, idle_timeout_s: float = 30.0):
+        self.desired: Dict[str, Any] = dict(desired or {})
+        self.revision = 0  # incremented on every change of the desired settings
+        self.source = source  # re-reads the desired settings for reload()
+        self.idle_timeout_s = float(idle_timeout_s)
+        self.actual: Dict[str, Any] = {}
+        self.origin: Dict[str, str] = {}  # per actual value: read, acked or default
+        self.last_sync: Optional[Dict[str, Any]] = None
+        self.syncs = 0
+        self.pushed = 0
+        self.boots = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str],
+                 source: Optional[Callable[[], Mapping[str, str]]] = None) -> 'ConfigSync':
+        return cls(desired_from_env(env),
+                   source=(lambda: desired_from_env(source())) if source is not None else None,
+                   idle_timeout_s=float(env.get('CONFIG_IDLE_TIMEOUT_S', '30')))
+
+    # Desired settings
+    def update(self, changes: Mapping[str, Any]) -> Dict[str, Any]:
+        """Merge settings into the desired ones (None = no longer managed); all or nothing."""
+        parsed = {k: (None if v is None else parse_setting(k, v)) for k, v in changes.items()}
+        with self._lock:
+            for k, v in parsed.items():
+                if v is None:
+                    self.desired.pop(k, None)
+                else:
+                    self.desired[k] = v
+            self.revision += 1
+            return dict(self.desired)
+
+    def reload(self) -> Dict[str, Any]:
+        """Desired settings re-read from the source (.env), dropping runtime changes."""
+        if self.source is None:
+            raise RuntimeError('no configuration source')
+        desired = self.source()
+        with self._lock:
+            self.desired = dict(desired)
+            self.revision += 1
+            return dict(self.desired)
+
+    # Actual settings
+    def attach(self, arduino) -> None:
+        """Track firmware reboots of a new serial session (call before the first sync)."""
+        with self._lock:
+            self.actual.clear()
+            self.origin.clear()
+        if any(h['state'] == 'LOADING' for h in arduino.history()):
+            self._on_boot()
+        arduino.subscribe(lambda state, prev: self._on_boot() if state == 'LOADING' else None)
+
+    def _on_boot(self) -> None:
+        # the board has just reset: everything is back at its defaults
+        with self._lock:
+            self.actual = dict(FIRMWARE_DEFAULTS)
+            self.origin = {k: 'default' for k in FIRMWARE_DEFAULTS}
+            self.boots += 1
+
+    def read(self, arduino) -> Dict[str, Any]:
+        """Query the settings the firmware reports; failed reads become unknown."""
+        values = {'tray_enabled': arduino.get_tray_enabled()}
+        with self._lock:
+            for k, v in values.items():
+                if v is None:
+                    self.actual.pop(k, None)
+                    self.origin.pop(k, None)
+                else:
+                    self.actual[k], self.origin[k] = v, 'read'
+        return values
+
+    def diff(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {k: {'desired': v, 'actual': self.actual.get(k)}
+                    for k, v in self.desired.items() if self.actual.get(k) != v}
+
+    def sync(self, arduino, force: bool = False) -> Dict[str, Any]:
+        """Read, diff, push the changes in one burst, verify. Returns the report."""
+        t0 = time.monotonic()
+        if arduino.last_state not in (None, 'IDLE'):
+            # the firmware reads commands only while IDLE (e.g. still calibrating after boot)
+            if arduino.wait_for_state(('IDLE',), timeout=self.idle_timeout_s) is None:
+                raise RuntimeError(f"firmware not IDLE after {self.idle_timeout_s:.0f}s (state {arduino.last_state})")
+        if self.desired.keys() & READABLE.keys():
+            self.read(arduino)
+        with self._lock:
+            desired = dict(self.desired)
+        changes = {k: v for k, v in desired.items() if force or self.actual.get(k) != v}
+        keys = list(changes)
+        acks = arduino.send_many([_command(k, changes[k]) for k in keys]) if keys else []
+        changed: List[str] = []
+        failed: Dict[str, Optional[str]] = {}
+        with self._lock:
+            for k, ack in zip(keys, acks):
+                if ack == 'OK':
+                    self.actual[k], self.origin[k] = changes[k], 'acked'
+                    changed.append(k)
+                else:
+                    # unknown now: pushed again on the next sync
+                    self.actual.pop(k, None)
+                    self.origin.pop(k, None)
+                    failed[k] = ack
+        # verify what can be read back
+        mismatch = []
+        if set(changed) & READABLE.keys():
+            back = self.read(arduino)
+            mismatch = [k for k in changed if k in back and back[k] != changes[k]]
+            for k in mismatch:
+                failed[k] = f"read back {back[k]}"
+                changed.remove(k)
+        report = {
+            'ts': time.time(),
+            'changed': {k: changes[k] for k in changed},
+            'failed': failed,
+            'unchanged': sorted(set(desired) - set(changes)),
+            'verified': not failed,
+            'duration_ms': round((time.monotonic() - t0) * 1000.0, 1),
+        }
+        with self._lock:
+            self.last_sync = report
+            self.syncs += 1
+            self.pushed += len(keys)
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        diff = self.diff()
+        with self._lock:
+            return {
+                'desired': dict(self.desired),
+                'revision': self.revision,
+                'actual': dict(self.actual),
+                'origin': dict(self.origin),
+                'diff': diff,
+                'in_sync': not diff,
+                'defaults': dict(FIRMWARE_DEFAULTS),
+                'last_sync': self.last_sync,
+                'syncs': self.syncs,
+                'pushed': self.pushed,
+                'boots': self.boots,
+            }
@@ -14,6 +14,7 @@ st.title('Trashcan Dashboard')
 # Sidebar: refresh + API base
 st.sidebar.header('Refresh')
 st.sidebar.button('Refresh now')
+live = st.sidebar.checkbox('Live updates (push)', value=True)
 
 st.sidebar.header('API')
 api_url = st.sidebar.text_input('Base URL', value=BASE_URL)
@@ -141,3 +142,25 @@ with cols[1]:
         st.info('Spectrogram not available')
 
 st.caption('This UI drives the daemon via HTTP and visualizes its latest state and results.')
+
+# Live mode: block on the daemon's event stream until state/result change, then rerun.
+# since only covers these two topics, so the stream must not deliver job/stream updates.
+def wait_for_update(since: int, max_wait_s: float = 60.0) -> None:
+    status = st.sidebar.empty()
+    t_end = time.time() + max_wait_s
+    try:
+        with requests.get(api_url + f'/api/events?since={since}&topics=state,result&keepalive_s=1', stream=True, timeout=(2.0, 5.0)) as r:
+            for line in r.iter_lines():
+                if line.startswith(b'data:'):
+                    return
+                # keep-alive: touching an element lets Streamlit interrupt us on widget input
+                status.caption(f"waiting for updates (v{since})")
+                if time.time() > t_end:
+                    return
+    except Exception:
+        time.sleep(2.0)
+
+if live:
+    version = max(int(state_obj.get('version') or 0), int(res.get('version') or 0))
+    wait_for_update(version)
+    st.rerun()
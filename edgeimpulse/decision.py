@@ -0,0 +1,362 @@
+"""Decision engine: classification result -> cycle, uncertain (retry) or reject.
+
+A trigger only starts a 30-45 s mechanical cycle if its top label clears the
+threshold of its class, leads the runner-up by a margin and wins enough of
+the shifted windows. Otherwise it is uncertain: no cycle, and its scores are
+held for DECISION_RETRY_S so the next trigger (the bottle knocked again or
+reinserted) is judged on both. Labels listed in DECISION_REJECT_LABELS
+(e.g. noise) and labels that name no type are rejected outright.
+
+Thresholds and the margin can be calibrated from archived segments whose
+true label has been reviewed, e.g. an export relabelled in Edge Impulse:
+
+    python edgeimpulse/archive.py export review_set --outcome ok
+    # correct the labels in review_set/info.labels (or list "id,label" in a CSV)
+    python edgeimpulse/decision.py calibrate review_set/info.labels --precision 0.97
+    python edgeimpulse/decision.py evaluate review_set/info.labels
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import logs
+from arduino import TYPE_NAME_BY_ID, label_type
+
+log = logs.get('DECIDE')
+
+DECISION_OUTCOMES = ('accept', 'uncertain', 'reject')
+
+
+def _parse_thresholds(spec: str) -> Dict[str, float]:
+    """'can:0.8,glas:0.75' -> {'can': 0.8, 'glas': 0.75}"""
+    out = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        label, _, value = part.partition(':')
+        if not value:
+            raise ValueError(f"Invalid DECISION_THRESHOLDS entry '{part}' (label:threshold)")
+        out[label.strip()] = float(value)
+    return out
+
+
+class DecisionEngine:
+    """Per-bin decision rules plus the held scores of the last uncertain trigger.
+
+    decide() is called by the bin's classify worker only; stats() may run on
+    any thread.
+    """
+    def __init__(self, threshold: float = 0.7, thresholds: Optional[Dict[str, float]] = None,
+                 margin: float = 0.1, min_agreement: float = 0.5, reject_labels: Sequence[str] = (),
+                 retry_s: float = 5.0, max_retries: int = 1, smoothing: float = 0.5,
+                 calibration_path: Optional[str] = None):
+        if not 0.0 <= smoothing < 1.0:
+            raise ValueError(f"Invalid DECISION_SMOOTHING {smoothing} (0 <= x < 1)")
+        self.threshold = float(threshold)
+        self.thresholds: Dict[str, float] = dict(thresholds or {})
+        self.margin = float(margin)
+        self.min_agreement = float(min_agreement)
+        self.reject_labels = {lbl.strip().lower() for lbl in reject_labels if lbl.strip()}
+        self.retry_s = float(retry_s)
+        self.max_retries = int(max_retries)
+        self.smoothing = float(smoothing)
+        self.calibration_path = calibration_path
+        self.calibration: Optional[Dict[str, Any]] = None
+        # explicit settings win over a calibration file
+        self._explicit_thresholds = dict(self.thresholds)
+        self._explicit_margin: Optional[float] = None
+        self._held: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self.outcomes: Dict[str, int] = {o: 0 for o in DECISION_OUTCOMES}
+        self.reasons: Dict[str, int] = {}
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls, env, base_dir: str) -> 'DecisionEngine':
+        margin = env.get('DECISION_MARGIN', '').strip()
+        engine = cls(
+            threshold=float(env.get('DECISION_THRESHOLD', '0.7')),
+            thresholds=_parse_thresholds(env.get('DECISION_THRESHOLDS', '')),
+            margin=float(margin) if margin else 0.1,
+            min_agreement=float(env.get('DECISION_MIN_AGREEMENT', '0.5')),
+            reject_labels=env.get('DECISION_REJECT_LABELS', 'noise,background,unknown').split(','),
+            retry_s=float(env.get('DECISION_RETRY_S', '5')),
+            max_retries=int(env.get('DECISION_MAX_RETRIES', '1')),
+            smoothing=float(env.get('DECISION_SMOOTHING', '0.5')),
+            calibration_path=os.path.join(base_dir, env.get('DECISION_CALIBRATION', 'decision_calibration.json')),
+        )
+        engine._explicit_margin = float(margin) if margin else None
+        engine.reload()
+        return engine
+
+    def reload(self) -> bool:
+        """(Re)apply the calibration file, if there is one; explicit env settings still win."""
+        path = self.calibration_path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r') as f:
+                cal = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"could not read calibration {path}: {e}")
+            return False
+        with self._lock:
+            self.calibration = cal
+            self.thresholds = {**{k: float(v) for k, v in cal.get('thresholds', {}).items()}, **self._explicit_thresholds}
+            if self._explicit_margin is None and 'margin' in cal:
+                self.margin = float(cal['margin'])
+        log.info(f"calibration loaded from {path}: thresholds={self.thresholds} margin={self.margin}")
+        return True
+
+    def reset(self) -> None:
+        """Forget the held scores (new stream)."""
+        self._held = None
+
+    def threshold_for(self, label: str) -> float:
+        return self.thresholds.get(label, self.threshold)
+
+    def evaluate(self, scores: Dict[str, float], windows: Optional[List[Dict[str, float]]] = None
+                 ) -> Tuple[str, str, Optional[str], float, float, float]:
+        """Stateless rules: (outcome, reason, label, score, margin, agreement)."""
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked:
+            return 'reject', 'no_scores', None, 0.0, 0.0, 0.0
+        label, score = ranked[0]
+        margin = score - (ranked[1][1] if len(ranked) > 1 else 0.0)
+        windows = [w for w in (windows or []) if w]
+        agreement = sum(max(w, key=w.get) == label for w in windows) / len(windows) if windows else 1.0
+        if label.lower() in self.reject_labels:
+            return 'reject', 'reject_label', label, score, margin, agreement
+        if label_type(label) is None:
+            return 'reject', 'unmapped', label, score, margin, agreement
+        if score < self.threshold_for(label):
+            return 'uncertain', 'below_threshold', label, score, margin, agreement
+        if margin < self.margin:
+            return 'uncertain', 'low_margin', label, score, margin, agreement
+        if agreement < self.min_agreement:
+            return 'uncertain', 'low_agreement', label, score, margin, agreement
+        return 'accept', 'confident', label, score, margin, agreement
+
+    def decide(self, result: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+        """Decision for one classification result (ClassificationService.classify())."""
+        now = time.monotonic() if now is None else now
+        scores = dict(result.get('scores') or {})
+        attempt = 0
+        held, self._held = self._held, None
+        if held is not None and now - held['t'] <= self.retry_s:
+            # temporal smoothing: the retry is judged on the held and the new evidence
+            w = self.smoothing
+            scores = {lbl: w * held['scores'].get(lbl, 0.0) + (1.0 - w) * scores.get(lbl, 0.0)
+                      for lbl in set(held['scores']) | set(scores)}
+            attempt = held['attempt'] + 1
+        outcome, reason, label, score, margin, agreement = self.evaluate(scores, result.get('windows'))
+        retry_pending = outcome == 'uncertain' and attempt < self.max_retries and self.retry_s > 0
+        if retry_pending:
+            self._held = {'t': now, 'scores': scores, 'attempt': attempt}
+        type_id = label_type(label) if outcome == 'accept' else None
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            if attempt:
+                self.retries += 1
+        return {
+            'outcome': outcome,
+            'reason': reason,
+            'label': label,
+            'score': score,
+            'margin': margin,
+            'agreement': agreement,
+            'threshold': self.threshold_for(label) if label else None,
+            'type_id': type_id,
+            'type_name': TYPE_NAME_BY_ID.get(type_id) if type_id is not None else None,
+            'attempt': attempt,
+            'retry_pending': retry_pending,
+            'scores': scores,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'thresholds': dict(self.thresholds),
+                'margin': self.margin,
+                'min_agreement': self.min_agreement,
+                'reject_labels': sorted(self.reject_labels),
+                'retry_s': self.retry_s,
+                'max_retries': self.max_retries,
+                'smoothing': self.smoothing,
+                'calibration': {k: v for k, v in self.calibration.items() if k != 'report'} if self.calibration else None,
+                'outcomes': dict(self.outcomes),
+                'reasons': dict(self.reasons),
+                'retries': self.retries,
+            }
+
+
+# Calibration
+def load_truth(path: str) -> Dict[int, str]:
+    """Reviewed labels by archive record id: an info.labels manifest (<label>.<id>) or a CSV of id,label."""
+    truth: Dict[int, str] = {}
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[0].strip().isdigit():
+                    truth[int(row[0])] = row[1].strip()
+        return truth
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    for entry in manifest.get('files', []):
+        name = entry.get('name') or os.path.splitext(os.path.basename(entry.get('path', '')))[0]
+        rec_id = name.rsplit('.', 1)[-1]
+        label = (entry.get('label') or {}).get('label')
+        if rec_id.isdigit() and label:
+            truth[int(rec_id)] = label
+    return truth
+
+
+def score_table(archive, truth: Dict[int, str]) -> List[Tuple[Dict[str, float], str]]:
+    """(archived scores, true label) for every reviewed record still in the archive."""
+    out = []
+    for rec_id, label in sorted(truth.items()):
+        try:
+            out.append((archive.scores(rec_id), label))
+        except KeyError:
+            continue
+    return out
+
+
+def report(engine: DecisionEngine, samples: List[Tuple[Dict[str, float], str]]) -> Dict[str, Any]:
+    """What the engine would have done with the samples (single window, no retries)."""
+    per_label: Dict[str, Dict[str, int]] = {}
+    totals = {o: 0 for o in DECISION_OUTCOMES}
+    wrong = 0
+    for scores, truth in samples:
+        outcome, _, label, _, _, _ = engine.evaluate(scores)
+        totals[outcome] += 1
+        row = per_label.setdefault(truth, {'support': 0, 'correct': 0, 'accepted': 0})
+        row['support'] += 1
+        if outcome == 'accept':
+            row['accepted'] += 1
+            if label_type(label) == label_type(truth):
+                row['correct'] += 1
+            else:
+                wrong += 1
+    accepted = totals['accept']
+    return {
+        'samples': len(samples),
+        'outcomes': totals,
+        'wrong_cycles': wrong,
+        'precision': (accepted - wrong) / accepted if accepted else None,
+        'coverage': accepted / len(samples) if samples else None,
+        'labels': {lbl: {**row, 'recall': row['correct'] / row['support']} for lbl, row in sorted(per_label.items())},
+    }
+
+
+def calibrate(samples: List[Tuple[Dict[str, float], str]], precision: float = 0.97, min_support: int = 5,
+              floor: float = 0.5, default: float = 0.7,
+              margins: Sequence[float] = tuple(m / 20.0 for m in range(11))) -> Dict[str, Any]:
+    """Per-label thresholds and one margin that keep every label's precision >= target.
+
+    For each candidate margin, each label gets the lowest threshold (not below
+    floor) at which the samples predicted as that label reach the precision;
+    the margin that accepts the most correct samples wins, ties go to the
+    smaller margin. Labels with fewer than min_support predictions keep the
+    default threshold.
+    """
+    best = None
+    for margin in margins:
+        thresholds: Dict[str, float] = {}
+        notes: Dict[str, str] = {}
+        correct = 0
+        by_label: Dict[str, List[Tuple[float, bool]]] = {}
+        for scores, truth in samples:
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+            if not ranked or label_type(ranked[0][0]) is None:
+                continue
+            if ranked[0][1] - (ranked[1][1] if len(ranked) > 1 else 0.0) < margin:
+                continue
+            by_label.setdefault(ranked[0][0], []).append((ranked[0][1], label_type(ranked[0][0]) == label_type(truth)))
+        for label, rows in by_label.items():
+            if len(rows) < min_support:
+                thresholds[label] = default
+                notes[label] = f'{len(rows)} predictions < {min_support}, default kept'
+                correct += sum(ok for s, ok in rows if s >= default)
+                continue
+            rows.sort(key=lambda r: r[0], reverse=True)
+            hits, pick, fallback = 0, None, None  # (threshold, correct, precision)
+            for n, (s, ok) in enumerate(rows, 1):
+                hits += ok
+                if s < floor:
+                    break
+                if hits / n >= precision:
+                    pick = (s, hits, hits / n)
+                if fallback is None or hits / n >= fallback[2]:
+                    fallback = (s, hits, hits / n)
+            if pick is None:
+                # target unreachable: the most precise threshold there is
+                pick = fallback or (1.0, 0, 0.0)
+                notes[label] = f'precision {precision} not reached, best {pick[2]:.3f}'
+            thresholds[label] = round(pick[0], 4)
+            correct += pick[1]
+        if best is None or correct > best['correct']:
+            best = {'margin': margin, 'thresholds': thresholds, 'notes': notes, 'correct': correct}
+    best = best or {'margin': 0.0, 'thresholds': {}, 'notes': {}, 'correct': 0}
+    return {
+        'created': time.time(),
+        'samples': len(samples),
+        'precision_target': precision,
+        'margin': best['margin'],
+        'thresholds': best['thresholds'],
+        'notes': best['notes'],
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Calibrate / evaluate the decision engine on reviewed archive segments')
+    ap.add_argument('--dir', default=None, help='archive directory (default: ARCHIVE_DIR)')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    for name in ('calibrate', 'evaluate'):
+        p = sub.add_parser(name)
+        p.add_argument('truth', help='info.labels manifest or CSV of id,label')
+        if name == 'calibrate':
+            p.add_argument('--precision', type=float, default=0.97, help='target precision per label')
+            p.add_argument('--min-support', type=int, default=5)
+            p.add_argument('--floor', type=float, default=0.5, help='lowest threshold considered')
+            p.add_argument('--out', default=None, help='calibration file (default: DECISION_CALIBRATION)')
+            p.add_argument('--dry-run', action='store_true', help='print, do not write')
+    args = ap.parse_args(argv)
+
+    from dotenv import load_dotenv, find_dotenv
+    from archive import SegmentArchive
+    load_dotenv(find_dotenv())
+    base = os.path.dirname(os.path.realpath(__file__))
+    archive = SegmentArchive(args.dir or os.path.join(base, os.environ.get('ARCHIVE_DIR', 'archive')), readonly=True)
+    samples = score_table(archive, load_truth(args.truth))
+    if not samples:
+        print(f"[DECIDE] no reviewed segment of {args.truth} found in {archive.root}")
+        return 1
+    engine = DecisionEngine.from_env(os.environ, base)
+    before = report(engine, samples)
+    if args.cmd == 'evaluate':
+        print(json.dumps(before, indent=2))
+        return 0
+    cal = calibrate(samples, args.precision, args.min_support, args.floor, engine.threshold)
+    engine.thresholds = {**cal['thresholds'], **engine._explicit_thresholds}
+    if engine._explicit_margin is None:
+        engine.margin = cal['margin']
+    cal['report'] = {'before': before, 'after': report(engine, samples)}
+    print(json.dumps(cal, indent=2))
+    if not args.dry_run:
+        out = args.out or engine.calibration_path
+        with open(out, 'w') as f:
+            json.dump(cal, f, indent=2)
+        print(f"[DECIDE] calibration written to {out} (POST /api/decision/reload or restart to apply)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+from typing import List, Optional
+
+import numpy as np
+
+from classifier import ClassificationRequest, ClassificationService
+from ringbuffer import Int16RingBuffer
+from trigger import TriggerEngine
+
+
+class SegmentDetector:
+    """Ring buffer + trigger engine + classifier windowing for one audio stream.
+
+    Shared by the live capture loop and the offline replay so both cut exactly
+    the same segments from the same blocks.
+    """
+    def __init__(self, trigger: TriggerEngine, classifier: ClassificationService,
+                 blocksize: int, buffer_size: int):
+        self.trigger = trigger
+        self.classifier = classifier
+        self.blocksize = int(blocksize)
+        # Span of all shifted windows plus two blocks of headroom (the post window ends mid-block)
+        self.ring = Int16RingBuffer(max(buffer_size, classifier.span_samples) + 2 * self.blocksize)
+        self.triggers = 0
+        self.new_onset: Optional[int] = None  # absolute onset index accepted in the last feed()
+
+    def feed(self, block: np.ndarray) -> List[ClassificationRequest]:
+        """Process one block; returns the windows that became complete with it."""
+        block_start = self.ring.total_written
+        self.ring.write(block)
+
+        # Trigger features (always computed so the noise floor keeps tracking)
+        onset = self.trigger.process(block)
+        self.new_onset = None
+        if onset is not None and len(self.ring) >= self.classifier.pre_samples:
+            self.triggers += 1
+            if self.classifier.add_trigger(block_start + onset):
+                self.new_onset = block_start + onset
+
+        # Every fully recorded window (onset-aligned, pre + post plus shifts)
+        return self.classifier.pop_ready(self.ring)
+
+    def flush(self) -> List[ClassificationRequest]:
+        """Pad with silence until every pending window is complete (end of a recording)."""
+        ready: List[ClassificationRequest] = []
+        pad = np.zeros(self.blocksize, dtype=np.int16)
+        for _ in range(self.classifier.span_after // self.blocksize + 1):
+            self.ring.write(pad)
+            ready.extend(self.classifier.pop_ready(self.ring))
+        return ready
@@ -0,0 +1,87 @@
+from typing import Dict
+
+import numpy as np
+
+
+class LogMelBands:
+    """Log-mel band energies of non-overlapping frames (dB re. int16 full scale).
+
+    Returns a (frames, bands) float32 matrix; shared by the segment
+    fingerprint and the NumPy inference backend.
+    """
+    def __init__(self, sample_rate: int = 16000, frame: int = 512, bands: int = 24,
+                 floor_db: float = -90.0):
+        self.sample_rate = int(sample_rate)
+        self.frame = int(frame)
+        self.bands = int(bands)
+        self.floor_db = float(floor_db)
+        bins = self.frame // 2 + 1
+        freqs = np.fft.rfftfreq(self.frame, d=1.0 / self.sample_rate)
+        mel = 2595.0 * np.log10(1.0 + freqs / 700.0)
+        edges_mel = np.linspace(mel[1], mel[-1], self.bands + 1)
+        edges = np.searchsorted(mel, edges_mel[:-1])
+        self._edges = np.unique(np.clip(edges, 1, bins - 1))  # skip DC
+        self._window = np.hanning(self.frame).astype(np.float32)
+        self._ref_db = 10.0 * np.log10(float(self.frame) * 32768.0 ** 2)
+
+    def __call__(self, segment: np.ndarray) -> np.ndarray:
+        n = (segment.size // self.frame) * self.frame
+        frames = segment[:n].reshape(-1, self.frame).astype(np.float32)
+        frames *= self._window
+        power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        band_power = np.add.reduceat(power, self._edges, axis=1)
+        db = 10.0 * np.log10(band_power + 1e-9) - self._ref_db
+        # floored so silence maps to a stable value
+        np.maximum(db, self.floor_db, out=db)
+        return db.astype(np.float32)
+
+
+class FrameCache:
+    """Log-mel rows of one audio stream, kept by absolute frame index.
+
+    Overlapping windows of a sliding classifier share most of their frames;
+    with window starts on the frame grid (multiples of bands.frame) only the
+    frames a window adds are computed, the rest are reused. Rows are
+    identical to LogMelBands over the whole window (frames are independent).
+    """
+    def __init__(self, bands: LogMelBands, max_frames: int = 256):
+        self.bands = bands
+        self.max_frames = int(max_frames)
+        self._rows: Dict[int, np.ndarray] = {}
+        self.computed = 0
+        self.reused = 0
+
+    def window(self, audio: np.ndarray, start_index: int) -> np.ndarray:
+        """(frames, bands) of audio, which starts at the absolute sample index start_index."""
+        frame = self.bands.frame
+        if start_index % frame:
+            raise ValueError(f"window start {start_index} is not on the {frame}-sample frame grid")
+        first = start_index // frame
+        n = audio.size // frame
+        out = np.empty((n, self.bands.bands), dtype=np.float32)
+        k = 0
+        while k < n:
+            row = self._rows.get(first + k)
+            if row is not None:
+                out[k] = row
+                self.reused += 1
+                k += 1
+                continue
+            # one batch for every consecutive missing frame (usually the new hop at the end)
+            end = k
+            while end < n and (first + end) not in self._rows:
+                end += 1
+            rows = self.bands(audio[k * frame:end * frame])
+            out[k:end] = rows
+            for i in range(end - k):
+                self._rows[first + k + i] = rows[i]
+            self.computed += end - k
+            k = end
+        # frames before this window are not needed again
+        if len(self._rows) > self.max_frames:
+            for idx in [i for i in self._rows if i < first]:
+                del self._rows[idx]
+        return out
+
+    def clear(self) -> None:
+        self._rows.clear()
@@ -0,0 +1,340 @@
+import concurrent.futures
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import logs
+from backends import InferenceBackend
+
+log = logs.get('MODEL')
+
+RESTART_BACKOFF_MAX_S = 60.0  # delay before restarting a worker doubles per failed start up to this
+
+
+def _worker_main(idx: int, env: Dict[str, str], model_path: str, shm_name: str, n_slots: int,
+                 slot_samples: int, tasks, results) -> None:
+    """Worker process: own backend instance, windows read from the shared slot array."""
+    from backends import create_backend
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((n_slots, slot_samples), dtype=np.int16, buffer=shm.buf)
+    backend = create_backend(env, model_path)
+    try:
+        info = backend.init()
+        freq = int(info['model_parameters'].get('frequency', 16000))
+        # warm-up: first inference pays for lazy allocations / the runner's first frame
+        t0 = time.perf_counter()
+        backend.classify(np.zeros(freq, dtype=np.int16))
+        results.put(('ready', idx, info, (time.perf_counter() - t0) * 1000.0))
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, slot, n = task
+            try:
+                t0 = time.perf_counter()
+                result = backend.classify(slots[slot, :n])
+                result['latency_ms'] = (time.perf_counter() - t0) * 1000.0
+                results.put(('ok', idx, task_id, result))
+            except Exception as e:
+                results.put(('error', idx, task_id, f"{type(e).__name__}: {e}"))
+    except Exception as e:
+        results.put(('failed', idx, f"{type(e).__name__}: {e}", None))
+    finally:
+        backend.close()
+        del slots
+        shm.close()
+
+
+class _Worker:
+    __slots__ = ('idx', 'process', 'tasks', 'task', 'served', 'restarts', 'warmup_ms', 'pid',
+                 'ready', 'failed_starts', 'restart_at', 'disabled', 'last_error')
+
+    def __init__(self, idx: int):
+        self.idx = idx
+        self.process = None
+        self.tasks = None
+        self.task: Optional[int] = None  # task id in progress
+        self.served = 0
+        self.restarts = 0
+        self.warmup_ms: Optional[float] = None
+        self.pid: Optional[int] = None
+        self.ready = False                        # reported ready since its last start
+        self.failed_starts = 0                    # consecutive starts that never got ready
+        self.restart_at: Optional[float] = None   # monotonic time of the next restart (backoff)
+        self.disabled = False                     # out of rotation after max_failed_starts
+        self.last_error: Optional[str] = None
+
+
+class InferencePool(InferenceBackend):
+    """Process pool of inference workers, each with its own backend instance.
+
+    Windows are copied into a shared-memory slot array (int16, one slot per
+    in-flight window) and only (task id, slot, length) goes through the
+    worker's pipe, so audio is never pickled. The parent dispatches tasks in
+    submission order to idle workers; classify() blocks like a plain backend,
+    classify_many() runs windows in parallel and returns results in input
+    order. A worker that dies fails its current window and is restarted.
+    A worker that dies before it is ready (e.g. the model fails to load) is
+    restarted with exponential backoff and taken out of rotation after
+    max_failed_starts consecutive failed starts; once no worker is left,
+    queued and new windows fail instead of waiting.
+    Results carry the worker-side inference time as 'latency_ms'.
+    """
+    name = 'pool'
+
+    def __init__(self, env: Dict[str, str], model_path: str, workers: int = 2,
+                 slot_samples: int = 48000, start_method: str = 'spawn', ready_timeout_s: float = 120.0,
+                 max_failed_starts: int = 5):
+        super().__init__()
+        self.env = {**dict(env), 'INFERENCE_WORKERS': '1'}  # workers run the plain backend
+        self.model_path = model_path
+        self.n_workers = max(1, int(workers))
+        self.slot_samples = int(slot_samples)
+        self.n_slots = 2 * self.n_workers
+        self.ready_timeout_s = float(ready_timeout_s)
+        self.max_failed_starts = max(1, int(max_failed_starts))
+        self.backend_name = self.env.get('INFERENCE_BACKEND', 'eim')
+        self._ctx = mp.get_context(start_method)
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._slots: Optional[np.ndarray] = None
+        self._free: queue.Queue = queue.Queue()
+        self._results = None
+        self._workers: List[_Worker] = []
+        self._idle: deque = deque()
+        self._backlog: deque = deque()  # (task_id, slot, n) waiting for an idle worker
+        self._pending: Dict[int, Any] = {}  # task id -> (future, slot)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._collector: Optional[threading.Thread] = None
+        self.errors = 0
+
+    @property
+    def workers(self) -> int:
+        return self.n_workers
+
+    def init(self) -> Dict[str, Any]:
+        self._shm = shared_memory.SharedMemory(create=True, size=self.n_slots * self.slot_samples * 2)
+        self._slots = np.ndarray((self.n_slots, self.slot_samples), dtype=np.int16, buffer=self._shm.buf)
+        for s in range(self.n_slots):
+            self._free.put(s)
+        self._results = self._ctx.Queue()
+        self._workers = [_Worker(i) for i in range(self.n_workers)]
+        for w in self._workers:
+            self._spawn(w)
+        info = None
+        deadline = time.monotonic() + self.ready_timeout_s
+        for _ in self._workers:
+            msg = None
+            while msg is None:
+                try:
+                    msg = self._results.get(timeout=0.5)
+                except queue.Empty:
+                    dead = [w.idx for w in self._workers if not w.process.is_alive()]
+                    if dead or time.monotonic() > deadline:
+                        self.close()
+                        why = f"worker {dead[0]} exited" if dead else f"no answer in {self.ready_timeout_s:.0f} s"
+                        raise RuntimeError(f"inference pool failed to start: {why}")
+            if msg[0] == 'failed':
+                self.close()
+                raise RuntimeError(f"inference worker {msg[1]} failed to start: {msg[2]}")
+            _, idx, winfo, warm_ms = msg
+            self._workers[idx].warmup_ms = warm_ms
+            self._workers[idx].ready = True
+            self._idle.append(self._workers[idx])
+            info = info or winfo
+        params = info['model_parameters']
+        self.labels = list(params.get('labels', []))
+        self.frequency = int(params.get('frequency', 16000))
+        if self.frequency > self.slot_samples:
+            log.warning(f"INFERENCE_SLOT_SAMPLES={self.slot_samples} is shorter than one second of audio")
+        self._collector = threading.Thread(target=self._collect, name='inference-pool', daemon=True)
+        self._collector.start()
+        warm = ', '.join(f"{w.warmup_ms:.0f}" for w in self._workers)
+        log.info(f"inference pool: {self.n_workers} x {self.backend_name}, warm-up ms: {warm}")
+        return info
+
+    def _spawn(self, w: _Worker) -> None:
+        w.ready = False
+        w.tasks = self._ctx.SimpleQueue()
+        w.process = self._ctx.Process(
+            target=_worker_main, name=f'inference-{w.idx}', daemon=True,
+            args=(w.idx, self.env, self.model_path, self._shm.name, self.n_slots, self.slot_samples,
+                  w.tasks, self._results))
+        w.process.start()
+        w.pid = w.process.pid
+
+    # Dispatch
+    def submit(self, window: np.ndarray) -> concurrent.futures.Future:
+        """Queue one window; the future resolves to the backend's result dict."""
+        if self._closed:
+            raise RuntimeError("inference pool closed")
+        if self._workers and all(w.disabled for w in self._workers):
+            raise RuntimeError("no inference worker left (every worker failed to start)")
+        n = int(window.size)
+        if n > self.slot_samples:
+            raise ValueError(f"window of {n} samples exceeds INFERENCE_SLOT_SAMPLES={self.slot_samples}")
+        slot = self._free.get()  # blocks while every slot is in flight
+        self._slots[slot, :n] = window
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = (fut, slot)
+            self._backlog.append((task_id, slot, n))
+            self._dispatch()
+        return fut
+
+    def _dispatch(self) -> None:
+        # caller holds _lock; FIFO so tasks start in submission order
+        while self._backlog and self._idle:
+            w = self._idle.popleft()
+            task = self._backlog.popleft()
+            w.task = task[0]
+            w.tasks.put(task)
+
+    def classify(self, segment: np.ndarray) -> Dict[str, Any]:
+        return self.submit(segment).result()
+
+    def classify_many(self, windows: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """Classify windows in parallel; results in input order."""
+        futures = [self.submit(w) for w in windows]
+        return [f.result() for f in futures]
+
+    def _finish(self, task_id: int, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        with self._lock:
+            entry = self._pending.pop(task_id, None)
+        if entry is None:
+            return
+        fut, slot = entry
+        self._free.put(slot)
+        if error is None:
+            fut.set_result(result)
+        else:
+            self.errors += 1
+            fut.set_exception(RuntimeError(error))
+
+    def _collect(self) -> None:
+        last_check = time.monotonic()
+        while not self._closed:
+            if time.monotonic() - last_check >= 1.0:
+                last_check = time.monotonic()
+                self._check_workers()
+            try:
+                msg = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            kind, idx = msg[0], msg[1]
+            w = self._workers[idx]
+            if kind == 'ready':  # a restarted worker
+                w.warmup_ms = msg[3]
+                w.ready = True
+                w.failed_starts = 0
+                with self._lock:
+                    self._idle.append(w)
+                    self._dispatch()
+                continue
+            if kind == 'failed':  # counted by _check_workers once the process has exited
+                w.last_error = msg[2]
+                log.error(f"inference worker {idx} failed: {msg[2]}", worker=idx)
+                continue
+            task_id = msg[2]
+            with self._lock:
+                w.task = None
+                w.served += 1
+                self._idle.append(w)
+                self._dispatch()
+            self._finish(task_id, msg[3] if kind == 'ok' else None, None if kind == 'ok' else msg[3])
+
+    def _check_workers(self) -> None:
+        now = time.monotonic()
+        for w in self._workers:
+            if self._closed or w.disabled or w.process is None or w.process.is_alive():
+                continue
+            if w.restart_at is None:  # newly exited
+                with self._lock:
+                    task_id, w.task = w.task, None
+                    if w in self._idle:
+                        self._idle.remove(w)
+                if task_id is not None:
+                    self._finish(task_id, None, f"inference worker {w.idx} died")
+                if not w.ready:
+                    w.failed_starts += 1
+                if w.failed_starts >= self.max_failed_starts:
+                    w.disabled = True
+                    log.error(f"inference worker {w.idx} failed to start {w.failed_starts} times in a row, "
+                              f"taken out of rotation: {w.last_error}", worker=w.idx, failed_starts=w.failed_starts)
+                    self._fail_if_no_workers()
+                    continue
+                delay = min(RESTART_BACKOFF_MAX_S, 2.0 ** (w.failed_starts - 1)) if w.failed_starts else 0.0
+                w.restart_at = now + delay
+                log.error(f"inference worker {w.idx} (pid {w.pid}) died (exit {w.process.exitcode}), "
+                          f"restarting in {delay:.0f} s", worker=w.idx, pid=w.pid, exitcode=w.process.exitcode,
+                          failed_starts=w.failed_starts)
+            if now >= w.restart_at:
+                w.restart_at = None
+                w.restarts += 1
+                self._spawn(w)
+
+    def _fail_if_no_workers(self) -> None:
+        """Every worker is out of rotation: fail the queued windows instead of letting them wait forever."""
+        if not all(w.disabled for w in self._workers):
+            return
+        with self._lock:
+            backlog, self._backlog = list(self._backlog), deque()
+        for task_id, _, _ in backlog:
+            self._finish(task_id, None, "no inference worker left (every worker failed to start)")
+
+    def close(self) -> None:
+        self._closed = True
+        for w in self._workers:
+            try:
+                if w.tasks is not None:
+                    w.tasks.put(None)
+            except Exception:
+                pass
+        for w in self._workers:
+            if w.process is not None:
+                w.process.join(timeout=5.0)
+                if w.process.is_alive():
+                    w.process.terminate()
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for fut, _ in pending:
+            if not fut.done():
+                fut.set_exception(RuntimeError("inference pool closed"))
+        if self._shm is not None:
+            self._slots = None
+            self._shm.close()
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'backend': self.backend_name,
+                'workers': [{'idx': w.idx, 'pid': w.pid, 'alive': bool(w.process and w.process.is_alive()),
+                             'busy': w.task is not None, 'served': w.served, 'restarts': w.restarts,
+                             'warmup_ms': w.warmup_ms, 'failed_starts': w.failed_starts, 'disabled': w.disabled,
+                             'restart_in_s': max(0.0, w.restart_at - now) if w.restart_at is not None else None,
+                             'last_error': w.last_error} for w in self._workers],
+                'disabled': sum(w.disabled for w in self._workers),
+                'max_failed_starts': self.max_failed_starts,
+                'backlog': len(self._backlog),
+                'in_flight': len(self._pending),
+                'slots': self.n_slots,
+                'slot_samples': self.slot_samples,
+                'errors': self.errors,
+            }
@@ -0,0 +1,145 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pipeline import DROP_NEWEST, DropQueue
+from state_store import StateStore
+
+# Job status values
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'params', 'status', 'result', 'error',
+                 't_created', 't_started', 't_finished', 'future')
+
+    def __init__(self, job_id: int, kind: str, params: Dict[str, Any]):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.t_created = time.time()
+        self.t_started: Optional[float] = None
+        self.t_finished: Optional[float] = None
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.kind, json.dumps(self.params, sort_keys=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id, 'kind': self.kind, 'params': self.params, 'status': self.status,
+            'result': self.result, 'error': self.error, 'created': self.t_created,
+            'started': self.t_started, 'finished': self.t_finished,
+        }
+
+
+class JobQueue:
+    """Long-running operations (e.g. a full mechanical cycle) run one at a time.
+
+    submit() returns immediately with a Job; an identical job (same kind and
+    params) that is still queued or running is returned instead of a new
+    one. A handler's return value becomes the job result, an exception marks
+    it failed. Every status change is published to the store's 'job' topic,
+    so /api/events streams job completion.
+    """
+    def __init__(self, maxsize: int = 8, history: int = 200, store: Optional[StateStore] = None):
+        self.pending = DropQueue('jobs', maxsize, DROP_NEWEST)
+        self.history = history
+        self.store = store
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._jobs: 'OrderedDict[int, Job]' = OrderedDict()
+        self._active: Dict[Tuple[str, str], Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name='job-worker', daemon=True)
+        self._thread.start()
+
+    def register(self, kind: str, handler: Callable[..., Any]) -> None:
+        """handler(**params) runs on the job worker thread."""
+        self._handlers[kind] = handler
+
+    @property
+    def kinds(self) -> List[str]:
+        return sorted(self._handlers)
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Job, bool]:
+        """Queue a job; returns (job, created). Raises ValueError/queue.Full."""
+        if kind not in self._handlers:
+            raise ValueError(f"Invalid job kind '{kind}'")
+        job = Job(0, kind, dict(params or {}))
+        with self._lock:
+            existing = self._active.get(job.key)
+            if existing is not None:
+                return existing, False
+            job.id = next(self._ids)
+            if not self.pending.put(job):
+                raise queue.Full(f"job queue full ({self.pending.maxsize})")
+            self._active[job.key] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                old_id, old = next(iter(self._jobs.items()))
+                if old.status in (QUEUED, RUNNING):
+                    break
+                del self._jobs[old_id]
+        self._publish(job)
+        return job, True
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [j.to_dict() for j in jobs]
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Await job completion for up to timeout seconds (returns the job either way)."""
+        if timeout > 0 and not job.future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def _publish(self, job: Job) -> None:
+        if self.store is not None:
+            self.store.update('job', job.to_dict())
+
+    def _loop(self) -> None:
+        while True:
+            job = self.pending.get()
+            job.status = RUNNING
+            job.t_started = time.time()
+            self._publish(job)
+            try:
+                job.result = self._handlers[job.kind](**job.params)
+                job.status = DONE
+            except Exception as e:
+                job.error = str(e)
+                job.status = FAILED
+            job.t_finished = time.time()
+            with self._lock:
+                self._active.pop(job.key, None)
+            self._publish(job)
+            job.future.set_result(job.status)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for j in self._jobs.values():
+                counts[j.status] = counts.get(j.status, 0) + 1
+        return {'kinds': self.kinds, 'status': counts, 'queue': self.pending.stats()}
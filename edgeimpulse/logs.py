@@ -0,0 +1,408 @@
+"""Logging: structured records, non-blocking output, per-category rate limits.
+
+print() writes to stdout synchronously. Under journald back-pressure this
+stalls whichever thread prints, including the trigger loop and the serial
+reader. Components log through get(component) instead:
+
+    log = logs.get('AUDIO')
+    log.info(f"{name}: trigger RMS={rms:.1f}", category='AUDIO.trigger', bin=name, rms=rms)
+
+setup() (daemon start) puts a bounded queue between callers and the
+output. Log records go to stderr, so stdout stays free for machine-readable
+output (JSON reports of the command-line tools).
+Records are handed over without blocking, and are dropped and counted when
+the queue is full. A listener thread formats and writes them, either as
+text ("[AUDIO] ...", as before) or as one JSON object per line
+(LOG_FORMAT=json) with component, category, bin, trace id and the keyword
+fields. Before setup(), and in the command-line tools, records are
+written synchronously as text.
+
+A category is the component or a finer name such as AUDIO.trigger.
+Settings for a name also cover its sub-categories. For each category:
+- a token bucket limits the rate (LOG_RATE_LIMIT, LOG_RATE_LIMITS)
+- a sampling fraction thins out expected high-frequency messages (LOG_SAMPLING)
+- records dropped by the limit are counted, and the next record that
+  passes reports how many were suppressed
+
+Levels can be changed per component at runtime (PUT /api/log).
+"""
+import atexit
+import json
+import logging
+import math
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Mapping, Optional
+
+ROOT = 'trashcan'
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+FORMATS = ('text', 'json')
+
+
+def parse_level(value: Any) -> int:
+    name = str(value).strip().upper()
+    if name == 'WARN':
+        name = 'WARNING'
+    if name not in LEVELS:
+        raise ValueError(f"Invalid log level '{value}' ({'/'.join(LEVELS)})")
+    return getattr(logging, name)
+
+
+def parse_map(spec: Optional[str], what: str) -> Dict[str, str]:
+    """'AUDIO.trigger:5,EVENT:20' -> {'AUDIO.trigger': '5', 'EVENT': '20'}"""
+    out: Dict[str, str] = {}
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        key, sep, value = part.rpartition(':')
+        if not sep or not key.strip():
+            raise ValueError(f"Invalid {what} entry '{part}' (name:value)")
+        out[key.strip()] = value.strip()
+    return out
+
+
+def _rate(value: Any) -> float:
+    rate = float(value)
+    if rate < 0:
+        raise ValueError(f"Invalid log rate {value} (records/s, 0 = unlimited)")
+    return rate
+
+
+def _fraction(value: Any) -> float:
+    f = float(value)
+    if not 0.0 <= f <= 1.0:
+        raise ValueError(f"Invalid log sampling {value} (0..1)")
+    return f
+
+
+def _lookup(table: Mapping[str, Any], category: str) -> Any:
+    # most specific entry: AUDIO.trigger, then AUDIO
+    name = category
+    while True:
+        if name in table:
+            return table[name]
+        if '.' not in name:
+            return None
+        name = name.rsplit('.', 1)[0]
+
+
+class RateLimiter:
+    """Token bucket and sampling per category; decides on the calling thread."""
+    def __init__(self, default_rate: float = 0.0, rates: Optional[Mapping[str, float]] = None,
+                 sampling: Optional[Mapping[str, float]] = None):
+        self._lock = threading.Lock()
+        self.default_rate = float(default_rate)  # records/s per category, 0 = unlimited
+        self.rates: Dict[str, float] = dict(rates or {})
+        self.sampling: Dict[str, float] = dict(sampling or {})
+        self._buckets: Dict[str, list] = {}  # category -> [tokens, last refill, rate]
+        self._seen: Dict[str, int] = {}      # category -> records offered to sampling
+        self._pending: Dict[str, int] = {}   # suppressed since the last record that passed
+        self.passed: Dict[str, int] = {}
+        self.suppressed: Dict[str, int] = {}
+        self.sampled: Dict[str, int] = {}
+
+    def configure(self, default_rate: Optional[float] = None, rates: Optional[Mapping[str, Optional[float]]] = None,
+                  sampling: Optional[Mapping[str, Optional[float]]] = None) -> None:
+        """Merge changes (None = remove the entry); buckets restart with the new rates."""
+        with self._lock:
+            if default_rate is not None:
+                self.default_rate = float(default_rate)
+            for table, changes in ((self.rates, rates), (self.sampling, sampling)):
+                for k, v in (changes or {}).items():
+                    if v is None:
+                        table.pop(k, None)
+                    else:
+                        table[k] = float(v)
+            self._buckets.clear()
+
+    def admit(self, category: str, now: Optional[float] = None) -> Optional[int]:
+        """None = drop the record; else how many of the category were suppressed before it."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            frac = _lookup(self.sampling, category)
+            if frac is not None and frac < 1.0:
+                n = self._seen.get(category, 0)
+                self._seen[category] = n + 1
+                # every 1/frac-th record, starting with the first
+                if math.floor(n * frac) == math.floor((n - 1) * frac):
+                    self.sampled[category] = self.sampled.get(category, 0) + 1
+                    return None
+            bucket = self._buckets.get(category)
+            if bucket is None:
+                rate = _lookup(self.rates, category)
+                rate = self.default_rate if rate is None else rate
+                bucket = self._buckets[category] = [max(rate, 1.0), now, rate]
+            rate = bucket[2]
+            if rate > 0:
+                # burst of one second's worth
+                bucket[0] = min(max(rate, 1.0), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] < 1.0:
+                    self.suppressed[category] = self.suppressed.get(category, 0) + 1
+                    self._pending[category] = self._pending.get(category, 0) + 1
+                    return None
+                bucket[0] -= 1.0
+            self.passed[category] = self.passed.get(category, 0) + 1
+            return self._pending.pop(category, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            names = set(self.passed) | set(self.suppressed) | set(self.sampled)
+            return {
+                'rate_limit': self.default_rate,
+                'rate_limits': dict(self.rates),
+                'sampling': dict(self.sampling),
+                'categories': {c: {'passed': self.passed.get(c, 0), 'suppressed': self.suppressed.get(c, 0),
+                                   'sampled_out': self.sampled.get(c, 0)} for c in sorted(names)},
+            }
+
+
+class _LimitFilter(logging.Filter):
+    def __init__(self, limiter: RateLimiter):
+        super().__init__()
+        self.limiter = limiter
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        n = self.limiter.admit(getattr(record, 'category', record.name))
+        if n is None:
+            return False
+        record.suppressed = n
+        return True
+
+
+class AsyncHandler(QueueHandler):
+    """Hands records to the listener thread; never blocks, drops when the queue is full.
+
+    A SimpleQueue (no Python-level locks) with an approximate bound: a record
+    is dropped when maxsize records are already waiting.
+    """
+    def __init__(self, maxsize: int = 10000):
+        super().__init__(queue.SimpleQueue())
+        self.maxsize = max(1, int(maxsize))
+        self.dropped = 0
+        self.high_water = 0
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # enqueue is thread-safe on its own: no handler lock around emit()
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # resolve what may change after the call; formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        depth = self.queue.qsize()
+        if depth >= self.maxsize:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+        if depth >= self.high_water:
+            self.high_water = depth + 1
+
+
+class StderrHandler(logging.StreamHandler):
+    """Writes to the current sys.stderr (follows redirect_stderr)."""
+    def __init__(self):
+        super().__init__(sys.stderr)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value) -> None:
+        pass
+
+
+class TextFormatter(logging.Formatter):
+    """[COMPONENT] message, the format of the former print() lines."""
+    def format(self, record: logging.LogRecord) -> str:
+        component = getattr(record, 'component', record.name)
+        level = '' if record.levelno == logging.INFO else f"{record.levelname}: "
+        line = f"[{component}] {level}{record.getMessage()}"
+        if getattr(record, 'suppressed', 0):
+            line += f" (+{record.suppressed} suppressed)"
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, component, category, msg, thread and the fields."""
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'component': getattr(record, 'component', record.name),
+            'category': getattr(record, 'category', record.name),
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        out.update(getattr(record, 'fields', None) or {})
+        if getattr(record, 'suppressed', 0):
+            out['suppressed'] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out['exc'] = record.exc_text
+        return json.dumps(out, default=str, separators=(',', ':'))
+
+
+class Log:
+    """Logger of one component; keyword fields (bin, trace_id, timings) go into JSON records."""
+    def __init__(self, component: str):
+        self.component = component.upper()
+        self.logger = logging.getLogger(f"{ROOT}.{component.lower()}")
+
+    def enabled(self, level: int = logging.DEBUG) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, msg: str, *args: Any, category: Optional[str] = None,
+            exc_info: Any = None, **fields: Any) -> None:
+        logger = self.logger
+        if not logger.isEnabledFor(level):
+            return
+        if exc_info and not isinstance(exc_info, tuple):
+            exc_info = sys.exc_info()
+        # no caller lookup (file/line are not logged): makeRecord + handle instead of Logger.log
+        record = logger.makeRecord(logger.name, level, '', 0, msg, args, exc_info or None)
+        record.component = self.component
+        record.category = category or self.component
+        record.fields = fields
+        logger.handle(record)
+
+    def debug(self, msg: str, *args: Any, **kw: Any) -> None:
+        self.log(logging.DEBUG, msg, *args, **kw)
+
+    def info(self, msg: str, *args: Any, **kw: Any) -> None:
+        self.log(logging.INFO, msg, *args, **kw)
+
+    def warning(self, msg: str, *args: Any, **kw: Any) -> None:
+        self.log(logging.WARNING, msg, *args, **kw)
+
+    def error(self, msg: str, *args: Any, **kw: Any) -> None:
+        self.log(logging.ERROR, msg, *args, **kw)
+
+
+# Module state: synchronous text output until setup()
+_root = logging.getLogger(ROOT)
+_root.setLevel(logging.INFO)
+_root.propagate = False
+_limiter = RateLimiter()
+_handler: logging.Handler = StderrHandler()
+_handler.setFormatter(TextFormatter())
+_handler.addFilter(_LimitFilter(_limiter))
+_root.addHandler(_handler)
+_listener: Optional[QueueListener] = None
+_format = 'text'
+_atexit = False
+_logs: Dict[str, Log] = {}
+_lock = threading.Lock()
+
+
+def get(component: str) -> Log:
+    log = _logs.get(component)
+    if log is None:
+        with _lock:
+            log = _logs.setdefault(component, Log(component))
+    return log
+
+
+def setup(env: Mapping[str, str]) -> None:
+    """Daemon logging from the environment: async output, format, levels, limits."""
+    global _handler, _listener, _format, _atexit
+    fmt = env.get('LOG_FORMAT', 'text').strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid LOG_FORMAT '{fmt}' ({'/'.join(FORMATS)})")
+    configure(
+        level=env.get('LOG_LEVEL', 'INFO'),
+        components=parse_map(env.get('LOG_LEVELS', ''), 'LOG_LEVELS'),
+        rate_limit=env.get('LOG_RATE_LIMIT', '50'),
+        rate_limits=parse_map(env.get('LOG_RATE_LIMITS', ''), 'LOG_RATE_LIMITS'),
+        sampling=parse_map(env.get('LOG_SAMPLING', ''), 'LOG_SAMPLING'),
+    )
+    handler = AsyncHandler(int(env.get('LOG_QUEUE_SIZE', '10000')))
+    handler.addFilter(_LimitFilter(_limiter))
+    with _lock:
+        shutdown()
+        _root.removeHandler(_handler)
+        _handler, _format = handler, fmt
+        out = StderrHandler()
+        out.setFormatter(_formatter())
+        _listener = QueueListener(handler.queue, out)
+        _listener.start()
+        _root.addHandler(handler)
+        if not _atexit:
+            atexit.register(shutdown)
+            _atexit = True
+
+
+def shutdown() -> None:
+    """Write what is queued and stop the listener thread (at exit); later records are written directly."""
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    sync = StderrHandler()
+    sync.setFormatter(_formatter())
+    sync.addFilter(_LimitFilter(_limiter))
+    _root.removeHandler(_handler)
+    _handler = sync
+    _root.addHandler(sync)
+
+
+def _formatter() -> logging.Formatter:
+    return JsonFormatter() if _format == 'json' else TextFormatter()
+
+
+def configure(level: Optional[Any] = None, components: Optional[Mapping[str, Any]] = None,
+              rate_limit: Optional[Any] = None, rate_limits: Optional[Mapping[str, Any]] = None,
+              sampling: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """Runtime changes (PUT /api/log); everything is validated before anything is applied.
+
+    components/rate_limits/sampling are merged, a None value removes the entry
+    (the component inherits the global level again).
+    """
+    root_level = parse_level(level) if level is not None else None
+    levels = {k.lower(): (None if v is None else parse_level(v)) for k, v in (components or {}).items()}
+    default_rate = _rate(rate_limit) if rate_limit is not None else None
+    rates = {k: (None if v is None else _rate(v)) for k, v in (rate_limits or {}).items()}
+    fractions = {k: (None if v is None else _fraction(v)) for k, v in (sampling or {}).items()}
+    if root_level is not None:
+        _root.setLevel(root_level)
+    for name, lvl in levels.items():
+        logging.getLogger(f"{ROOT}.{name}").setLevel(lvl if lvl is not None else logging.NOTSET)
+    _limiter.configure(default_rate, rates, fractions)
+    return stats()
+
+
+def stats() -> Dict[str, Any]:
+    components = {name[len(ROOT) + 1:].upper(): logging.getLevelName(lg.level)
+                  for name, lg in logging.root.manager.loggerDict.items()
+                  if name.startswith(ROOT + '.') and isinstance(lg, logging.Logger) and lg.level != logging.NOTSET}
+    out: Dict[str, Any] = {
+        'format': _format,
+        'level': logging.getLevelName(_root.level),
+        'components': components,
+        'async': _listener is not None,
+    }
+    if isinstance(_handler, AsyncHandler):
+        out['queue'] = {'size': _handler.maxsize, 'depth': _handler.queue.qsize(),
+                        'high_water': _handler.high_water, 'dropped': _handler.dropped}
+    out.update(_limiter.stats())
+    return out
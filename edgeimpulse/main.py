@@ -1,292 +1,47 @@
+import time
+_T_START = time.monotonic()  # module imports count towards the startup report
+import asyncio
+import concurrent.futures
+import io
 import os
+import queue
 import sys
 import signal
-import time
-from edge_impulse_linux.audio import AudioImpulseRunner
 import numpy as np
-from collections import deque
-import sounddevice as sd
-import queue
-import serial
 import threading
-from collections import defaultdict
 from dotenv import load_dotenv, find_dotenv
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
-import uvicorn
+from typing import TYPE_CHECKING, Optional, Dict, Any
 import json
+from pipeline import Pipeline
+from trigger import create_trigger
+from classifier import ClassificationRequest, ClassificationService
+from detector import SegmentDetector
+from backends import create_backend
+from arduino import Arduino, TYPE_NAME_BY_ID, normalize_type, run_automatic_cycle
+from config_sync import ConfigSync
+from transport import ack_timeouts_from_env
+from state_store import AsyncSubscription, StateStore
+from render import SegmentRenderer
+from archive import OUTCOMES as ARCHIVE_OUTCOMES, SegmentArchive
+from decision import DecisionEngine
+from streaming import StreamWindow, StreamingClassifier
+from jobs import JobQueue
+from station import Bin, Station
+from tracing import Tracer, chrome_trace
+from startup import Startup
+import logs
+import metrics
+
+# Heavy modules (FastAPI/uvicorn, sounddevice, scipy) are imported where they are used,
+# so the startup phases can load them side by side with the model
+if TYPE_CHECKING:
+    from fastapi import APIRouter
 
 runner = None
-
-# Protocol commands supported by the firmware
-PROTOCOL_COMMANDS = {
-    'start', 'mTray', 'mPosBottle', 'gPosBottle', 'gLimitTray', 'gState', 'gType', 'estop', 'ping',
-    'gDiagTray', 'gDiagBottle', 'setTrayPos', 'setBottleSpeed',
-    'gTrayEnabled', 'setTrayEnabled', 'recover', 'gLastError', 'gBottleAngle', 'mBottleAngle'
-}
-
-# Aliases and direct protocol names
-commands = {
-    "GetBottleStatus": "gPosBottle",
-    "MoveBottle": "mPosBottle",
-    "MoveTray": "mTray",
-    # direct protocol names allowed
-    "start": "start",
-    "mTray": "mTray",
-    "mPosBottle": "mPosBottle",
-    "gPosBottle": "gPosBottle",
-    "gLimitTray": "gLimitTray",
-    "gState": "gState",
-    "gType": "gType",
-    "estop": "estop",
-    "ping": "ping",
-    # diagnostics/settings
-    "gDiagTray": "gDiagTray",
-    "gDiagBottle": "gDiagBottle",
-    "setTrayPos": "setTrayPos",
-    "setBottleSpeed": "setBottleSpeed",
-    "gTrayEnabled": "gTrayEnabled",
-    "setTrayEnabled": "setTrayEnabled",
-    "recover": "recover",
-    "gLastError": "gLastError",
-    "gBottleAngle": "gBottleAngle",
-    "mBottleAngle": "mBottleAngle",
-}
-
-class Arduino:
-    """Serial interface with async event reader and per-command ack queues."""
-    def __init__(self, port: str, baud: int = 9600, timeout: float = 1.0):
-        self.ser = serial.Serial(port=port, baudrate=baud, timeout=timeout)
-        self._acks: Dict[str, queue.Queue] = defaultdict(queue.Queue)
-        self.last_state: Optional[str] = None
-        self.last_error: Optional[str] = None
-        self._running = True
-        self._lock = threading.Lock()
-        self._reader = threading.Thread(target=self._read_loop, name="arduino-reader", daemon=True)
-        self._reader.start()
-
-    def close(self) -> None:
-        self._running = False
-        try:
-            self.ser.close()
-        except Exception:
-            pass
-
-    def _read_loop(self) -> None:
-        while self._running:
-            try:
-                line = self.ser.readline()
-                if not line:
-                    continue
-                try:
-                    s = line.decode('utf-8', errors='replace').strip()
-                except Exception:
-                    continue
-                if not s:
-                    continue
-                # Async state events
-                if s.startswith('event::state::'):
-                    state = s.split('::', 2)[2]
-                    self.last_state = state
-                    print(f"[EVENT] state={state}")
-                    # persist state for dashboard
-                    try:
-                        out_path = os.path.join(os.path.dirname(__file__), 'last_state.json')
-                        with open(out_path, 'w') as f:
-                            json.dump({'state': state, 'ts': time.time(), 'error': self.last_error}, f)
-                    except Exception:
-                        pass
-                    continue
-                # Async error events
-                if s.startswith('event::error::'):
-                    code = s.split('::', 2)[2]
-                    self.last_error = code
-                    print(f"[EVENT] error={code}")
-                    # persist error for dashboard
-                    try:
-                        out_path = os.path.join(os.path.dirname(__file__), 'last_state.json')
-                        with open(out_path, 'w') as f:
-                            json.dump({'state': self.last_state, 'ts': time.time(), 'error': code}, f)
-                    except Exception:
-                        pass
-                    continue
-                # Acks: <cmd>::ack::<payload?>
-                parts = s.split('::')
-                if len(parts) >= 2 and parts[1] == 'ack':
-                    cmd = parts[0]
-                    payload = parts[2] if len(parts) > 2 else None
-                    self._acks[cmd].put(payload)
-                    continue
-                # Unknown lines
-                print(f"[SERIAL] {s}")
-            except Exception as e:
-                # do not crash on sporadic errors
-                print(f"[SERIAL-ERR] {e}")
-                time.sleep(0.05)
-
-    def send(self, command: str, value) -> Optional[str]:
-        if command not in commands:
-            raise ValueError(f"Invalid command '{command}'")
-        proto_cmd = commands[command]
-        line = f"{proto_cmd}::{value}\n"
-        with self._lock:
-            self.ser.write(line.encode('utf-8'))
-        try:
-            payload = self._acks[proto_cmd].get(timeout=2.0)
-            return payload
-        except queue.Empty:
-            print(f"[WARN] Ack timeout for {proto_cmd}")
-            return None
-
-    # Convenience methods
-    def ping(self) -> bool:
-        p = self.send('ping', 'x')
-        return p == 'pong'
-
-    def get_state(self) -> Optional[str]:
-        return self.send('gState', 'x')
-
-    def start(self, type_value: int | str) -> bool:
-        return self.send('start', type_value) == 'OK'
-
-    def move_tray(self, type_value: int | str) -> bool:
-        return self.send('mTray', type_value) == 'OK'
-
-    def move_bottle(self, pos: int) -> Optional[str]:
-        return self.send('mPosBottle', pos)
-
-    # Diagnostics: tray
-    def diag_tray(self) -> Optional[Dict[str, Any]]:
-        payload = self.send('gDiagTray', 'x')
-        if not payload:
-            return None
-        out: Dict[str, Any] = {}
-        try:
-            parts = [p.strip() for p in payload.split(',') if p.strip()]
-            for p in parts:
-                if '=' in p:
-                    k, v = p.split('=', 1)
-                    k = k.strip(); v = v.strip()
-                    if k in ('pos', 'target', 'dtg', 'speed'):
-                        try:
-                            out[k] = int(v)
-                        except Exception:
-                            out[k] = v
-                    elif k == 'state':
-                        out[k] = v
-            return out
-        except Exception:
-            return {'raw': payload}
-
-    # Diagnostics: bottle
-    def diag_bottle(self) -> Optional[int]:
-        payload = self.send('gDiagBottle', 'x')
-        if not payload:
-            return None
-        try:
-            if payload.startswith('state='):
-                return int(payload.split('=', 1)[1].strip())
-            return int(payload)
-        except Exception:
-            return None
-
-    # Settings
-    def set_tray_pos(self, type_value: int | str, steps: int) -> Optional[bool]:
-        ack = self.send('setTrayPos', f"{type_value}={int(steps)}")
-        return True if ack == 'OK' else (False if ack else None)
-
-    def set_bottle_speed(self, ms: int) -> Optional[bool]:
-        ack = self.send('setBottleSpeed', int(ms))
-        return True if ack == 'OK' else (False if ack else None)
-
-    # Settings and queries added
-    def get_tray_enabled(self) -> Optional[bool]:
-        val = self.send('gTrayEnabled', 'x')
-        if val is None:
-            return None
-        try:
-            return bool(int(val))
-        except Exception:
-            return None
-
-    def set_tray_enabled(self, enabled: bool) -> Optional[bool]:
-        v = '1' if enabled else '0'
-        ack = self.send('setTrayEnabled', v)
-        return True if ack == 'OK' else (False if ack else None)
-
-    def recover(self) -> Optional[bool]:
-        ack = self.send('recover', 'x')
-        return True if ack == 'OK' else (False if ack else None)
-
-    def get_last_error(self) -> Optional[str]:
-        return self.send('gLastError', 'x')
-
-    def get_bottle_angle(self) -> Optional[int]:
-        val = self.send('gBottleAngle', 'x')
-        try:
-            return int(val) if val is not None else None
-        except Exception:
-            return None
-
-    def set_bottle_angle(self, deg: int) -> Optional[int]:
-        val = self.send('mBottleAngle', int(deg))
-        try:
-            return int(val) if val is not None else None
-        except Exception:
-            return None
-
-# Type mapping helpers
-TYPE_NAME_BY_ID = {0: 'PLASTIC', 1: 'GLAS', 2: 'CAN'}
-ID_BY_NAME = {
-    'plastic': 0, 'plastik': 0,
-    'glas': 1, 'glass': 1,
-    'can': 2, 'dose': 2,
-}
-
-def normalize_type(value) -> Optional[int]:
-    try:
-        iv = int(value)
-        if iv in (0, 1, 2):
-            return iv
-    except Exception:
-        pass
-    if isinstance(value, str):
-        return ID_BY_NAME.get(value.strip().lower())
-    return None
-
-# Automatic cycle helpers
-
-def wait_for_idle(arduino: Arduino, timeout_s: float = 5.0) -> bool:
-    t0 = time.time()
-    while time.time() - t0 < timeout_s:
-        st = arduino.last_state or arduino.get_state()
-        if st == 'IDLE':
-            return True
-        time.sleep(0.2)
-    return False
-
-
-def run_automatic_cycle(arduino: Arduino, type_id: int, timeout_s: float = 30.0) -> bool:
-    if not wait_for_idle(arduino, timeout_s=5.0):
-        print('[AUTO] Not IDLE, aborting start')
-        return False
-    if not arduino.start(type_id):
-        print('[AUTO] start::<type> was not acknowledged')
-        return False
-    print(f"[AUTO] started, type {type_id}={TYPE_NAME_BY_ID.get(type_id)}")
-    t0 = time.time()
-    while time.time() - t0 < timeout_s:
-        if arduino.last_state == 'IDLE':
-            print('[AUTO] cycle completed (event)')
-            return True
-        st = arduino.get_state()
-        if st == 'IDLE':
-            print('[AUTO] cycle completed (poll)')
-            return True
-        time.sleep(0.3)
-    print('[AUTO] timeout while waiting for IDLE')
-    return False
+log_audio, log_classify, log_stream = logs.get('AUDIO'), logs.get('CLASSIFY'), logs.get('STREAM')
+log_serial, log_cfg, log_diag = logs.get('SERIAL'), logs.get('CFG'), logs.get('DIAG')
+log_pipe, log_model = logs.get('PIPE'), logs.get('MODEL')
+log_main = logs.get('MAIN')
 
 
 class Trashcan:
@@ -294,15 +49,15 @@ class Trashcan:
         pass
 
     def recvDetection(self, material_type):
-        print("Received detection", material_type)
+        log_main.info(f"Received detection {material_type}", material_type=material_type)
 
     def sendHome(self):
-        print("Sending home")
+        log_main.info("Sending home")
         # TODO: implement Arduino interaction here if needed
 
 
 def signal_handler(sig, frame):
-    print('Interrupted')
+    log_main.info('Interrupted')
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
@@ -310,314 +65,903 @@ signal.signal(signal.SIGINT, signal_handler)
 
 # --- HTTP API for dashboard ---
 
-def start_api_server(arduino_inst: Optional[Arduino]):
-    app = FastAPI(title="Trashcan Daemon API")
-
-    @app.get("/api/health")
-    def health():
+def _push_topics(topics: Optional[str]):
+    return [t.strip() for t in topics.split(',') if t.strip()] if topics else None
+
+
+def create_router(arduino_inst: Optional[Arduino], pipeline: Optional[Pipeline] = None,
+                  classifier: Optional[ClassificationService] = None, store: Optional[StateStore] = None,
+                  renderer: Optional[SegmentRenderer] = None, archive: Optional[SegmentArchive] = None,
+                  jobs: Optional[JobQueue] = None, tracer: Optional[Tracer] = None,
+                  decisions: Optional[DecisionEngine] = None, config: Optional[ConfigSync] = None,
+                  stream: Optional[StreamingClassifier] = None) -> 'APIRouter':
+    """Endpoints of one bin, mounted under /api (default bin) and /api/bins/<name>."""
+    from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import JSONResponse, Response, StreamingResponse
+    router = APIRouter()
+    if store is None:
+        store = arduino_inst.store if arduino_inst else StateStore()
+
+    @router.get("/pipeline")
+    def api_pipeline():
+        if pipeline is None:
+            raise HTTPException(status_code=503, detail="pipeline not running")
+        return pipeline.stats()
+
+    @router.get("/classifier")
+    def api_classifier():
+        if classifier is None:
+            raise HTTPException(status_code=503, detail="classifier not running")
+        return classifier.stats()
+
+    @router.post("/classifier/cache/clear")
+    def api_classifier_cache_clear():
+        if classifier is None or classifier.cache is None:
+            raise HTTPException(status_code=404, detail="cache disabled")
+        classifier.cache.clear()
         return {"ok": True}
 
-    @app.get("/api/state")
+    @router.get("/state")
     def api_state():
-        path = os.path.join(os.path.dirname(__file__), 'last_state.json')
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                return JSONResponse(content=json.load(f))
-        return JSONResponse(content={"state": None, "error": None, "ts": None})
+        return JSONResponse(content=store.get('state', {"state": None, "error": None, "ts": None, "version": 0}))
+
+    @router.get("/state/history")
+    def api_state_history(limit: int = 50):
+        if not arduino_inst:
+            raise HTTPException(status_code=503, detail="serial not connected")
+        return {"seq": arduino_inst.state_seq, "history": arduino_inst.history(limit)}
+
+    @router.get("/serial/stats")
+    def api_serial_stats():
+        if not arduino_inst:
+            raise HTTPException(status_code=503, detail="serial not connected")
+        return arduino_inst.transport.stats()
 
-    @app.get("/api/result")
+    @router.get("/result")
     def api_result():
-        path = os.path.join(os.path.dirname(__file__), 'last_result.json')
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                return JSONResponse(content=json.load(f))
-        return JSONResponse(content={})
-
-    @app.get("/api/segment/wave")
-    def api_wave():
-        fp = os.path.join(os.path.dirname(__file__), 'last_segment.png')
-        if not os.path.exists(fp):
-            raise HTTPException(status_code=404, detail="wave not found")
-        return FileResponse(fp, media_type='image/png')
-
-    @app.get("/api/segment/spec")
-    def api_spec():
-        fp = os.path.join(os.path.dirname(__file__), 'last_segment_spectrogram.png')
-        if not os.path.exists(fp):
-            raise HTTPException(status_code=404, detail="spec not found")
-        return FileResponse(fp, media_type='image/png')
-
-    @app.get("/api/segment/audio")
-    def api_audio():
-        fp = os.path.join(os.path.dirname(__file__), 'last_segment.wav')
-        if not os.path.exists(fp):
-            raise HTTPException(status_code=404, detail="audio not found")
-        return FileResponse(fp, media_type='audio/wav')
-
-    # Control endpoints (non-blocking)
-    @app.post("/api/control/start")
-    def api_start(payload: dict):
+        return JSONResponse(content=store.get('result', {}))
+
+    # Push: every store update as Server-Sent Event (id = store version, event = topic)
+    @router.get("/events")
+    async def api_events(request: Request, since: int = 0, topics: Optional[str] = None, keepalive_s: float = 15.0):
+        wanted = _push_topics(topics)
+        last_id = request.headers.get('last-event-id', '')
+        if last_id.isdigit():
+            since = max(since, int(last_id))
+        keepalive_s = min(max(keepalive_s, 0.5), 60.0)
+        sub = AsyncSubscription(store, asyncio.get_running_loop(), wanted)
+
+        async def _stream():
+            seen: Dict[str, int] = {}
+            try:
+                pending = store.snapshot(since, wanted)
+                while True:
+                    for topic, snap in sorted(pending.items(), key=lambda kv: kv[1]['version']):
+                        if snap['version'] > seen.get(topic, since):
+                            seen[topic] = snap['version']
+                            yield f"id: {snap['version']}\nevent: {topic}\ndata: {json.dumps(snap)}\n\n"
+                    if await request.is_disconnected():
+                        break
+                    pending = await sub.next(keepalive_s)
+                    if not pending:
+                        yield ": keep-alive\n\n"
+            finally:
+                sub.close()
+
+        return StreamingResponse(_stream(), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # Push: same updates as {"topic", "data"} JSON messages over a WebSocket
+    @router.websocket("/ws")
+    async def api_ws(ws: WebSocket, since: int = 0, topics: Optional[str] = None):
+        await ws.accept()
+        wanted = _push_topics(topics)
+        sub = AsyncSubscription(store, asyncio.get_running_loop(), wanted)
+        seen: Dict[str, int] = {}
+        try:
+            pending = store.snapshot(since, wanted)
+            while True:
+                for topic, snap in sorted(pending.items(), key=lambda kv: kv[1]['version']):
+                    if snap['version'] > seen.get(topic, since):
+                        seen[topic] = snap['version']
+                        await ws.send_json({'topic': topic, 'data': snap})
+                pending = await sub.next(15.0)
+                if not pending:
+                    await ws.send_json({'topic': 'keep-alive', 'data': {'version': store.version}})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sub.close()
+
+    # Segment artifacts: rendered on first request per segment, then served by ETag
+    def _segment_artifact(kind: str, media_type: str, request: Request):
+        art = renderer.get(kind) if renderer is not None else None
+        if art is None:
+            raise HTTPException(status_code=404, detail=f"{kind} not found")
+        etag, data = art
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=data, media_type=media_type, headers=headers)
+
+    @router.get("/segment")
+    def api_segment():
+        if renderer is None:
+            raise HTTPException(status_code=404, detail="visualization disabled")
+        return renderer.stats()
+
+    @router.get("/segment/wave")
+    def api_wave(request: Request):
+        return _segment_artifact('wave', 'image/png', request)
+
+    @router.get("/segment/spec")
+    def api_spec(request: Request):
+        return _segment_artifact('spec', 'image/png', request)
+
+    @router.get("/segment/audio")
+    def api_audio(request: Request):
+        return _segment_artifact('audio', 'audio/wav', request)
+
+    # Segment archive: index queries and single segments
+    def _archive():
+        if archive is None:
+            raise HTTPException(status_code=404, detail="archive disabled")
+        return archive
+
+    @router.get("/archive")
+    def api_archive():
+        return _archive().stats()
+
+    @router.get("/archive/segments")
+    def api_archive_segments(since: Optional[float] = None, until: Optional[float] = None,
+                             label: Optional[str] = None, outcome: Optional[str] = None,
+                             min_score: Optional[float] = None, limit: int = 100):
+        a = _archive()
+        if outcome is not None and outcome not in ARCHIVE_OUTCOMES:
+            raise HTTPException(status_code=400, detail=f"outcome must be one of {ARCHIVE_OUTCOMES}")
+        rows = a.query(since, until, label, None, outcome, min_score, limit)
+        return {"segments": [a.to_dict(r) for r in rows]}
+
+    @router.get("/archive/segments/{rec_id}/audio")
+    def api_archive_audio(rec_id: int):
+        a = _archive()
+        try:
+            row = a.row(rec_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="segment not found")
+        from scipy.io.wavfile import write as wavwrite
+        buf = io.BytesIO()
+        wavwrite(buf, a.sample_rate, np.asarray(a.read(row)))
+        return Response(content=buf.getvalue(), media_type='audio/wav')
+
+    # Control endpoints: async, the handler awaits the ack future resolved by the serial
+    # reader; an identical command still in flight is joined instead of sent twice
+    def _serial() -> Arduino:
         if not arduino_inst:
             raise HTTPException(status_code=503, detail="serial not connected")
+        return arduino_inst
+
+    @router.post("/control/start")
+    async def api_start(payload: dict):
+        a = _serial()
         t = payload.get('type')
         if t is None:
             raise HTTPException(status_code=400, detail="missing type")
-        ok = arduino_inst.start(t)
-        return {"ack": ok}
+        return {"ack": await a.send_async('start', t) == 'OK'}
 
-    @app.post("/api/control/mtray")
-    def api_mtray(payload: dict):
-        if not arduino_inst:
-            raise HTTPException(status_code=503, detail="serial not connected")
+    @router.post("/control/mtray")
+    async def api_mtray(payload: dict):
+        a = _serial()
         t = payload.get('type')
         if t is None:
             raise HTTPException(status_code=400, detail="missing type")
-        ok = arduino_inst.move_tray(t)
-        return {"ack": ok}
+        return {"ack": await a.send_async('mTray', t) == 'OK'}
 
-    @app.post("/api/control/mbottle")
-    def api_mbottle(payload: dict):
-        if not arduino_inst:
-            raise HTTPException(status_code=503, detail="serial not connected")
+    @router.post("/control/mbottle")
+    async def api_mbottle(payload: dict):
+        a = _serial()
         mode = payload.get('mode')
         if mode is None:
             raise HTTPException(status_code=400, detail="missing mode")
-        val = arduino_inst.move_bottle(int(mode))
+        val = await a.send_async('mPosBottle', int(mode))
         return {"ack": True if val is not None else False, "state": val}
 
-    @app.post("/api/control/estop")
-    def api_estop():
-        if not arduino_inst:
-            raise HTTPException(status_code=503, detail="serial not connected")
-        ok = (arduino_inst.send('estop', 'x') == 'OK')
-        return {"ack": ok}
+    @router.post("/control/estop")
+    async def api_estop():
+        # never deduplicated: every press must reach the firmware
+        return {"ack": await _serial().send_async('estop', 'x', dedup=False) == 'OK'}
 
-    @app.post("/api/control/recover")
-    def api_recover():
-        if not arduino_inst:
-            raise HTTPException(status_code=503, detail="serial not connected")
-        ok = arduino_inst.recover()
-        return {"ack": ok}
+    @router.post("/control/recover")
+    async def api_recover():
+        return {"ack": await _serial().send_async('recover', 'x') == 'OK'}
+
+    # Jobs: long operations (full cycle, ...) queued and run one at a time;
+    # status via GET /api/jobs/<id>?wait=<s> or streamed as topic 'job' on /api/events
+    def _jobs() -> JobQueue:
+        if jobs is None:
+            raise HTTPException(status_code=503, detail="job queue not running")
+        return jobs
+
+    def _submit_job(kind: str, params: Dict[str, Any]):
+        try:
+            job, created = _jobs().submit(kind, params)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except queue.Full as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        return JSONResponse(status_code=202, content={"job": job.to_dict(), "deduplicated": not created})
+
+    @router.post("/jobs")
+    def api_jobs_submit(payload: dict):
+        kind = payload.get('kind')
+        if not kind:
+            raise HTTPException(status_code=400, detail="missing kind")
+        return _submit_job(kind, payload.get('params') or {})
+
+    @router.post("/control/cycle")
+    def api_cycle(payload: dict):
+        t = normalize_type(payload.get('type'))
+        if t is None:
+            raise HTTPException(status_code=400, detail="missing or invalid type")
+        return _submit_job('cycle', {'type_id': t})
+
+    @router.get("/jobs")
+    def api_jobs(limit: int = 50):
+        q = _jobs()
+        return {"jobs": q.list(limit), **q.stats()}
+
+    @router.get("/jobs/{job_id}")
+    async def api_job(job_id: int, wait: float = 0.0):
+        q = _jobs()
+        job = q.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job not found")
+        await q.wait(job, min(max(wait, 0.0), 60.0))
+        return job.to_dict()
+
+    # Decision engine: thresholds, outcome counters, calibration
+    def _decisions() -> DecisionEngine:
+        if decisions is None:
+            raise HTTPException(status_code=503, detail="decision engine not running")
+        return decisions
+
+    @router.get("/decision")
+    def api_decision():
+        return _decisions().stats()
+
+    @router.post("/decision/reload")
+    def api_decision_reload():
+        d = _decisions()
+        if not d.reload():
+            raise HTTPException(status_code=404, detail=f"no calibration at {d.calibration_path}")
+        return d.stats()
+
+    # Firmware settings: desired vs. actual; changes are pushed by a 'config' job
+    def _config() -> ConfigSync:
+        if config is None:
+            raise HTTPException(status_code=503, detail="config sync not running")
+        return config
+
+    @router.get("/config")
+    def api_config():
+        return _config().stats()
+
+    @router.put("/config")
+    def api_config_put(payload: dict):
+        c = _config()
+        try:
+            c.update(payload)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # the revision keeps a sync that is already running from absorbing this one
+        return _submit_job('config', {'revision': c.revision})
+
+    @router.post("/config/reload")
+    def api_config_reload():
+        c = _config()
+        c.reload()
+        return _submit_job('config', {'revision': c.revision})
+
+    @router.post("/config/sync")
+    def api_config_sync(force: bool = False):
+        return _submit_job('config', {'force': force})
+
+    # Streaming classification (CLASSIFY_MODE=stream|both) and its comparison with the trigger path
+    @router.get("/stream")
+    def api_stream():
+        if stream is None:
+            raise HTTPException(status_code=404, detail="streaming classification off (CLASSIFY_MODE=trigger)")
+        return stream.stats()
+
+    # Latency traces: onset -> segment -> classify -> cycle -> state events
+    def _tracer() -> Tracer:
+        if tracer is None:
+            raise HTTPException(status_code=404, detail="tracing disabled")
+        return tracer
+
+    @router.get("/traces")
+    def api_traces(limit: int = 20):
+        t = _tracer()
+        return {"traces": [tr.summary() for tr in t.recent(limit)], **t.stats()}
+
+    @router.get("/traces/chrome")
+    def api_traces_chrome(limit: int = 50):
+        # load in chrome://tracing or ui.perfetto.dev
+        return JSONResponse(content=chrome_trace(_tracer().recent(limit)),
+                            headers={'Content-Disposition': 'attachment; filename="trashcan-traces.json"'})
+
+    @router.get("/traces/{trace_id}")
+    def api_trace(trace_id: int):
+        tr = _tracer().get(trace_id)
+        if tr is None:
+            raise HTTPException(status_code=404, detail="trace not found")
+        return tr.to_dict()
+
+    return router
+
+
+def start_api_server(arduino_inst: Optional[Arduino], pipeline: Optional[Pipeline] = None,
+                     classifier: Optional[ClassificationService] = None, store: Optional[StateStore] = None,
+                     renderer: Optional[SegmentRenderer] = None, archive: Optional[SegmentArchive] = None,
+                     jobs: Optional[JobQueue] = None, tracer: Optional[Tracer] = None,
+                     station: Optional[Station] = None, decisions: Optional[DecisionEngine] = None,
+                     startup: Optional[Startup] = None, config: Optional[ConfigSync] = None,
+                     wait_s: float = 0.0) -> bool:
+    """Serve the given bin under /api and, with a station, every bin under /api/bins/<name>.
+
+    Returns whether the server is listening after up to wait_s seconds.
+    """
+    import uvicorn
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import Response
+    app = FastAPI(title="Trashcan Daemon API")
+
+    @app.get("/api/health")
+    def health():
+        return {"ok": True}
+
+    @app.get("/api/metrics")
+    def api_metrics():
+        return Response(content=metrics.REGISTRY.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.get("/api/bins")
+    def api_bins():
+        if station is None:
+            raise HTTPException(status_code=404, detail="no station")
+        return station.stats()
+
+    @app.get("/api/startup")
+    def api_startup():
+        if startup is None:
+            raise HTTPException(status_code=404, detail="no startup report")
+        return startup.stats()
+
+    # Logging: levels, rate limits, sampling (process-wide, changed at runtime)
+    @app.get("/api/log")
+    def api_log():
+        return logs.stats()
+
+    @app.put("/api/log")
+    def api_log_update(payload: dict):
+        try:
+            return logs.configure(level=payload.get('level'), components=payload.get('components'),
+                                  rate_limit=payload.get('rate_limit'), rate_limits=payload.get('rate_limits'),
+                                  sampling=payload.get('sampling'))
+        except (TypeError, ValueError, AttributeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    app.include_router(create_router(arduino_inst, pipeline, classifier, store, renderer, archive, jobs, tracer,
+                                     decisions, config, station.default.stream if station is not None else None),
+                       prefix='/api')
+    for name, b in (station.bins.items() if station is not None else ()):
+        app.include_router(create_router(b.arduino, b.pipeline, b.classifier, b.store, b.renderer,
+                                         b.archive, b.jobs, b.tracer, b.decisions, b.config, b.stream),
+                           prefix=f'/api/bins/{name}')
 
     host = os.environ.get('DASH_HOST', '127.0.0.1')
     port = int(os.environ.get('DASH_PORT', '8008'))
 
-    def _run():
-        uvicorn.run(app, host=host, port=port, log_level="warning")
-
-    threading.Thread(target=_run, name='api-server', daemon=True).start()
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, name='api-server', daemon=True).start()
+    deadline = time.monotonic() + wait_s
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return server.started
 
 
-def main(model: str, selected_device_id: Optional[int] = None):
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    modelfile = os.path.join(dir_path, model)
 
-    # Open serial (9600 baud). Port via .env
-    serial_port = os.environ.get('TRASHCAN_SERIAL_PORT')
-    if not serial_port:
+def connect_bin(b: Bin, autodetect: bool = True) -> None:
+    """Open the bin's serial port (9600 baud) and set up its job queue."""
+    env = b.env
+    serial_port = b.serial_port
+    if not serial_port and autodetect:
         for p in ('/dev/ttyACM0', '/dev/ttyUSB0', '/dev/cu.usbserial-21230'):
             if os.path.exists(p):
                 serial_port = p
                 break
-    arduino: Optional[Arduino] = None
-    if serial_port:
-        try:
-            arduino = Arduino(serial_port, baud=9600, timeout=1.0)
-            print(f"[SERIAL] connected: {serial_port}")
-            if not arduino.ping():
-                print('[SERIAL] ping failed (continuing)')
-            # start HTTP API server for dashboard
-            start_api_server(arduino)
-            # Apply tray enabled setting if provided
-            tray_enabled_env = os.environ.get('TRAY_ENABLED')
-            if tray_enabled_env is not None and tray_enabled_env != '':
-                te = tray_enabled_env.strip().lower() in ('1', 'true', 'on', 'yes')
-                ok = arduino.set_tray_enabled(te)
-                print(f"[CFG] setTrayEnabled={te} -> {ok}")
-            # Optional diagnostic thread
-            diag_enabled = os.environ.get('DIAG_ENABLED', '0') == '1'
-            if diag_enabled:
-                diag_interval = float(os.environ.get('DIAG_INTERVAL_S', '10'))
-                def _diag_loop():
-                    while True:
-                        try:
-                            t = arduino.diag_tray()
-                            b = arduino.diag_bottle()
-                            if t is not None:
-                                print(f"[DIAG] Tray pos={t.get('pos')} tgt={t.get('target')} dtg={t.get('dtg')} spd={t.get('speed')} state={t.get('state')}")
-                            if b is not None:
-                                print(f"[DIAG] Bottle state={b}")
-                        except Exception as e:
-                            print(f"[DIAG] error: {e}")
-                        time.sleep(diag_interval)
-                threading.Thread(target=_diag_loop, name='diag-thread', daemon=True).start()
-
-            # Optional startup configuration from .env
-            def _env_int(name: str) -> Optional[int]:
-                v = os.environ.get(name)
-                if not v:
-                    return None
+    if not serial_port:
+        log_serial.error(f"{b.name}: no port found – set TRASHCAN_SERIAL_PORT in .env", bin=b.name)
+        return
+    b.serial_port = serial_port
+    try:
+        arduino = Arduino(serial_port, baud=9600, timeout=1.0,
+                          ack_timeout=float(env.get('ACK_TIMEOUT_S', '2.0')),
+                          ack_timeouts=ack_timeouts_from_env(env), store=b.store, name=b.name)
+    except Exception as e:
+        log_serial.error(f"{b.name}: connection failed: {e}", bin=b.name, port=serial_port)
+        return
+    log_serial.info(f"{b.name}: connected: {serial_port}", bin=b.name, port=serial_port)
+    tracer = b.tracer
+    if tracer is not None:
+        # state transitions of the running cycle end up on its trace
+        arduino.subscribe(lambda state, prev: tracer.mark_active(f"state::{state}"))
+    # before the handshake: a board reset by opening the port boots with its defaults
+    b.config.attach(arduino)
+    if not arduino.ping():
+        log_serial.warning(f"{b.name}: ping failed (continuing)", bin=b.name)
+    # Long operations for the API, run on the job worker
+    jobs = JobQueue(maxsize=int(env.get('JOB_QUEUE_SIZE', '8')), store=b.store)
+
+    def _cycle_job(type_id: int):
+        with b.cycle_lock:
+            if not run_automatic_cycle(arduino, int(type_id), timeout_s=45.0):
+                raise RuntimeError(f"cycle failed: {arduino.last_error or 'timeout'}")
+        return {'state': arduino.last_state}
+
+    def _recover_job():
+        if not arduino.recover():
+            raise RuntimeError('recover not acknowledged')
+        return {'state': arduino.wait_for_state(('IDLE',), timeout=30.0)}
+
+    def _config_job(force: bool = False, revision: Optional[int] = None):
+        with b.cycle_lock:
+            report = b.config.sync(arduino, force=bool(force))
+        if not report['verified']:
+            raise RuntimeError(f"config not applied: {report['failed']}")
+        return report
+
+    jobs.register('cycle', _cycle_job)
+    jobs.register('recover', _recover_job)
+    jobs.register('config', _config_job)
+
+    def _on_reboot(state: str, prev: Optional[str]) -> None:
+        # firmware reset while running (watchdog, brown-out): its settings are gone
+        if state == 'LOADING' and b.config.syncs:
+            log_cfg.warning(f"{b.name}: firmware rebooted, pushing configuration", bin=b.name)
+            try:
+                jobs.submit('config', {})
+            except Exception as e:
+                log_cfg.error(f"{b.name}: {e}", bin=b.name)
+    arduino.subscribe(_on_reboot)
+    b.arduino, b.jobs = arduino, jobs
+
+
+def configure_bin(b: Bin) -> None:
+    """Firmware settings from the bin's .env view (as a diff) and the optional diagnostic thread."""
+    env, arduino = b.env, b.arduino
+    if arduino is None:
+        return
+    try:
+        # Only settings that differ from the board are pushed, in one burst
+        report = b.config.sync(arduino)
+        changed = ' '.join(f"{k}={v}" for k, v in report['changed'].items()) or 'none'
+        log_cfg.info(f"{b.name}: changed {changed}, unchanged {len(report['unchanged'])}"
+                     f" in {report['duration_ms']:.0f} ms", bin=b.name, changed=report['changed'],
+                     duration_ms=report['duration_ms'])
+        if report['failed']:
+            log_cfg.error(f"{b.name}: not applied: {report['failed']}", bin=b.name, failed=report['failed'])
+    except Exception as e:
+        log_serial.error(f"{b.name}: configuration failed: {e}", bin=b.name)
+    # Optional diagnostic thread
+    if env.get('DIAG_ENABLED', '0') == '1':
+        diag_interval = float(env.get('DIAG_INTERVAL_S', '10'))
+        def _diag_loop():
+            while True:
                 try:
-                    return int(v)
-                except Exception:
-                    return None
-            spd = _env_int('BOTTLE_SPEED_MS')
-            if spd is not None:
-                ok = arduino.set_bottle_speed(spd)
-                print(f"[CFG] setBottleSpeed={spd} -> {ok}")
-            for key, tid in ((
-                ('TRAY_POS_0', 0), ('TRAY_POS_1', 1), ('TRAY_POS_2', 2),
-                ('TRAY_POS_PLASTIC', 0), ('TRAY_POS_GLAS', 1), ('TRAY_POS_CAN', 2)
-            )):
-                steps = _env_int(key)
-                if steps is not None:
-                    ok = arduino.set_tray_pos(tid, steps)
-                    print(f"[CFG] setTrayPos type={tid} steps={steps} -> {ok}")
-        except Exception as e:
-            print(f"[SERIAL] connection failed: {e}")
-            arduino = None
-    else:
-        print('[SERIAL] no port found – set TRASHCAN_SERIAL_PORT in .env')
-
-    with AudioImpulseRunner(str(modelfile)) as runner:
+                    t = arduino.diag_tray()
+                    bt = arduino.diag_bottle()
+                    if t is not None:
+                        log_diag.info(f"{b.name}: Tray pos={t.get('pos')} tgt={t.get('target')} dtg={t.get('dtg')} spd={t.get('speed')} state={t.get('state')}",
+                                      category='DIAG.tray', bin=b.name, **t)
+                    if bt is not None:
+                        log_diag.info(f"{b.name}: Bottle state={bt}", category='DIAG.bottle', bin=b.name, state=bt)
+                except Exception as e:
+                    log_diag.error(f"{b.name}: {e}", bin=b.name)
+                time.sleep(diag_interval)
+        threading.Thread(target=_diag_loop, name=f'diag-{b.name}', daemon=True).start()
+
+
+def open_audio(b: Bin, sample_rate: int):
+    """Open (not start) the bin's input stream; the callback feeds pipeline.audio."""
+    import sounddevice as sd
+    blocksize = max(128, int(sample_rate * 0.02))  # ~20 ms
+    # polled by the trigger loop at a quarter block, no lock shared with the callback
+    ring = b.pipeline.open_audio(blocksize, poll_s=blocksize / float(sample_rate) / 4)
+
+    # Capture: the PortAudio callback copies into a preallocated slot and returns; it never
+    # blocks, allocates no sample buffers and prints nothing (overruns/status flags are counted)
+    def audio_callback(indata, frames, time_info, status):
+        if status:
+            ring.put_status(status)
+        ring.put(indata[:, 0] if indata.ndim == 2 else indata)
+
+    return sd.InputStream(samplerate=sample_rate, channels=1, dtype='int16', blocksize=blocksize,
+                          callback=audio_callback, device=b.device_id)
+
+
+def run_bin(b: Bin, runner, sample_rate: int, labels, stream=None) -> None:
+    """Workers and the capture/trigger loop of one bin; blocks while its stream runs.
+
+    stream is the bin's input stream from open_audio() (opened during startup);
+    b.listening is set once the stream runs.
+    """
+    env, pipeline, classifier, store = b.env, b.pipeline, b.classifier, b.store
+    renderer, archive, tracer, decisions = b.renderer, b.archive, b.tracer, b.decisions
+    mode, streamer = b.classify_mode, b.stream
+
+    buffer_duration = 1.0  # seconds
+    buffer_size = int(sample_rate * buffer_duration)
+    blocksize = max(128, int(sample_rate * 0.02))  # ~20 ms
+    classifier.bind(runner, sample_rate)
+    if renderer is not None:
+        renderer.bind(sample_rate)
+    if archive is not None:
+        archive.bind(labels, sample_rate)
+
+    # Configurable trigger params (pre/post/cooldown are applied by the classifier)
+    trigger = create_trigger(env, sample_rate, blocksize)
+    detector = SegmentDetector(trigger, classifier, blocksize, buffer_size)
+    log_audio.info(f"{b.name}: trigger mode={trigger.name}, shifts={classifier.shifts_ms} ms, device={b.device_id}",
+                   bin=b.name)
+    if streamer is not None:
+        streamer.bind(runner, sample_rate, classifier.window_samples)
+        log_stream.info(f"{b.name}: mode={mode}, hop={streamer.effective_hop_ms:.0f} ms, sustain={streamer.sustain}, "
+                        f"features={'incremental' if streamer.frames is not None else 'in runner'}", bin=b.name)
+
+    # Classification worker: classify, map to type, persist, hand off to actuator
+    def classify_segment(req: ClassificationRequest) -> None:
+        trace = req.trace
+        t_classify = time.monotonic()
+        if trace is not None:
+            trace.add('queue.segments', req.t_ready, t_classify)
+        segment = classifier.primary_window(req)
+        trace_id = trace.id if trace is not None else None
+        log_audio.debug(f"{b.name}: classifying segment len={len(segment)} windows={len(classifier.shift_samples)} "
+                        f"coalesced={req.coalesced}", bin=b.name, trace_id=trace_id)
+
+        # Classify all shifted windows, scores aggregated
+        result = classifier.classify(req)
+        t_map = time.monotonic()
+        if trace is not None:
+            trace.add('classify', t_classify, t_map, windows=len(classifier.shift_samples))
+        # full result only at DEBUG (formatted only then)
+        log_classify.debug("%s: result: %s", b.name, result, category='CLASSIFY.result', bin=b.name, trace_id=trace_id)
+
+        # shit best label
+        scores = result['scores']
+        top_label = result['top_label']
+        top_score = result['top_score']
+        latency_ms = max(result['latency_ms']) if result['latency_ms'] else None
+        latency = f"{latency_ms:.0f}ms" if latency_ms is not None else 'cached'
+        log_classify.info(f"{b.name}: top={top_label} score={top_score:.2f} latency={latency}", bin=b.name,
+                          trace_id=trace_id, top_label=top_label, score=round(top_score, 3), latency_ms=latency_ms,
+                          windows=len(result['latency_ms']), coalesced=req.coalesced)
+
+        # Decide: per-class threshold, top-1/top-2 margin, window agreement, retry on uncertain
+        decision = decisions.decide(result)
+        type_id = decision['type_id']
+        if streamer is not None:
+            # onset-to-decision: post-roll, queue wait, inference
+            streamer.compare.add('trigger', req.onset_index, TYPE_NAME_BY_ID.get(type_id),
+                               classifier.span_after * 1000.0 / sample_rate + (time.monotonic() - req.t_ready) * 1000.0)
+        if trace is not None:
+            trace.add('decide', t_map, time.monotonic(), outcome=decision['outcome'], reason=decision['reason'])
+            trace.args.update(label=top_label, score=round(top_score, 3), type=TYPE_NAME_BY_ID.get(type_id),
+                              decision=decision['outcome'])
+
+        arduino = b.arduino  # the serial phase may still be connecting while audio already runs
+        cycle = type_id is not None and arduino is not None
+        rec_id = None
+        if archive is not None:
+            outcome = 'pending' if cycle else ('uncertain' if decision['outcome'] == 'uncertain' else 'none')
+            rec_id = archive.submit(segment, top_label, scores, type_id, outcome=outcome)
+
+        metrics.DECISIONS.labels(b.name, top_label, TYPE_NAME_BY_ID.get(type_id, 'NONE')).inc()
+        metrics.DECISION_OUTCOMES.labels(b.name, decision['outcome'], decision['reason']).inc()
+        if type_id is not None:
+            log_classify.info(f"{b.name}: mapped type: {TYPE_NAME_BY_ID.get(type_id)}", bin=b.name, trace_id=trace_id,
+                              type=TYPE_NAME_BY_ID.get(type_id))
+            if arduino is not None:
+                if not pipeline.actions.put((type_id, rec_id, trace, time.monotonic())):
+                    log_pipe.warning(f"{b.name}: actuator busy – dropping cycle request", bin=b.name, trace_id=trace_id)
+                    if rec_id is not None:
+                        archive.set_outcome(rec_id, 'none')
+                    if tracer is not None:
+                        tracer.finish(trace, 'dropped')
+            else:
+                log_serial.warning(f"{b.name}: no connection – skipping automatic cycle", bin=b.name, trace_id=trace_id)
+                if tracer is not None:
+                    tracer.finish(trace, 'no_serial')
+        else:
+            retry = ', waiting for a retry' if decision['retry_pending'] else ''
+            log_classify.info(f"{b.name}: {decision['outcome']} ({decision['reason']}: {decision['label']} "
+                              f"score={decision['score']:.2f} margin={decision['margin']:.2f} "
+                              f"agreement={decision['agreement']:.2f}){retry}; skipping", bin=b.name,
+                              trace_id=trace_id, outcome=decision['outcome'], reason=decision['reason'])
+            if tracer is not None:
+                tracer.finish(trace, decision['outcome'])
+
+        # Publish classification summary for dashboard (pushed to SSE/WebSocket clients)
+        store.update('result', {
+            'scores': scores,
+            'top_label': top_label,
+            'top_score': top_score,
+            'type_id': type_id,
+            'type_name': TYPE_NAME_BY_ID.get(type_id) if type_id is not None else None,
+            'decision': {k: decision[k] for k in ('outcome', 'reason', 'margin', 'agreement', 'threshold',
+                                                  'attempt', 'retry_pending')},
+            'trace_id': trace.id if trace is not None else None,
+            'ts': time.time()
+        })
+
+        # Optional visualization/export (copied and handed to the render worker)
+        if renderer is not None:
+            renderer.submit(segment, top_label=top_label, top_score=top_score)
+
+    # Actuator worker: one mechanical cycle at a time
+    def actuate(item) -> None:
+        type_id, rec_id, trace, t_queued = item
+        with b.cycle_lock:
+            if trace is not None:
+                trace.add('queue.actions', t_queued, time.monotonic())
+                tracer.bind(trace)
+            ok = run_automatic_cycle(b.arduino, type_id, timeout_s=45.0, trace=trace)
+            if tracer is not None:
+                tracer.finish(trace, 'ok' if ok else 'failed')
+        if rec_id is not None:
+            archive.set_outcome(rec_id, 'ok' if ok else 'failed')
+
+    # Stream worker: one window per hop; with CLASSIFY_MODE=stream its decisions start the cycle
+    def stream_segment(win: StreamWindow) -> None:
+        result = streamer.classify(win)
+        decision = streamer.decide(result, win)
+        if decision is None:
+            return
+        latency = f"{decision['latency_ms']:.0f} ms after onset" if decision['latency_ms'] is not None else 'no onset'
+        log_stream.info(f"{b.name}: {decision['label']} sustained over {decision['hops']} hops "
+                        f"(score={decision['score']:.2f}), {latency}", bin=b.name, label=decision['label'],
+                        hops=decision['hops'], score=round(decision['score'], 3), latency_ms=decision['latency_ms'])
+        store.update('stream', decision)
+        if mode != 'stream':
+            return
+        arduino = b.arduino
+        type_id = decision['type_id']
+        metrics.DECISIONS.labels(b.name, decision['label'], TYPE_NAME_BY_ID.get(type_id, 'NONE')).inc()
+        metrics.DECISION_OUTCOMES.labels(b.name, decision['outcome'], decision['reason']).inc()
+        trace = None
+        if tracer is not None:
+            t_onset = (win.t_ready - (win.end_index - win.onset_index) / sample_rate
+                       if win.onset_index is not None else win.t_ready)
+            trace = tracer.start('stream', t0=t_onset, onset_index=win.onset_index, label=decision['label'],
+                                 type=decision['type_name'], hops=decision['hops'])
+            t_classify = win.t_ready + result['wait_ms'] / 1000.0
+            trace.add('window', t_onset, win.t_ready)
+            trace.add('queue.stream', win.t_ready, t_classify)
+            trace.add('classify', t_classify, t_classify + result['latency_ms'] / 1000.0)
+        rec_id = None
+        if archive is not None:
+            rec_id = archive.submit(win.audio, decision['label'], result['scores'], type_id,
+                                    outcome='pending' if arduino is not None else 'none')
+        store.update('result', {
+            'scores': result['scores'],
+            'top_label': decision['label'],
+            'top_score': decision['score'],
+            'type_id': type_id,
+            'type_name': decision['type_name'],
+            'decision': {k: decision[k] for k in ('outcome', 'reason', 'margin', 'hops')},
+            'trace_id': trace.id if trace is not None else None,
+            'ts': time.time()
+        })
+        trace_id = trace.id if trace is not None else None
+        if arduino is None:
+            log_serial.warning(f"{b.name}: no connection – skipping automatic cycle", bin=b.name, trace_id=trace_id)
+            if tracer is not None:
+                tracer.finish(trace, 'no_serial')
+        elif not pipeline.actions.put((type_id, rec_id, trace, time.monotonic())):
+            log_pipe.warning(f"{b.name}: actuator busy – dropping cycle request", bin=b.name, trace_id=trace_id)
+            if rec_id is not None:
+                archive.set_outcome(rec_id, 'none')
+            if tracer is not None:
+                tracer.finish(trace, 'dropped')
+
+    pipeline.start(classify_segment, actuate, stream_segment if streamer is not None else None)
+
+    # Trigger detector (this thread)
+    m_blocks, m_rms, m_triggers = metrics.AUDIO_BLOCKS.labels(b.name), metrics.BLOCK_RMS.labels(b.name), metrics.TRIGGERS.labels(b.name)
+    stats_interval_s = float(env.get('PIPE_STATS_INTERVAL_S', '60'))
+    last_stats_ts = time.time()
+    last_dropped = 0
+    last_status: Dict[str, int] = {}
+    onset_traces: Dict[int, Any] = {}  # onset index -> (trace, detection time) until its window is cut
+
+    if stream is None:
+        stream = open_audio(b, sample_rate)
+    with stream:
+        b.listening.set()
+        while True:
+            # view into the ring, valid until the next get(); the detector copies what it keeps
+            audio_np = pipeline.audio.get()
+
+            # Ring buffer + trigger; returns every fully recorded window
+            # (onset-aligned, 200 ms pre + 800 ms post plus shifts)
+            ready = detector.feed(audio_np)
+            pipeline.triggers = detector.triggers
+            if streamer is not None:
+                if detector.new_onset is not None:
+                    streamer.note_onset(detector.new_onset)
+                win = streamer.pop_ready(detector.ring)
+                if win is not None:
+                    pipeline.stream.put(win)
+                if mode == 'stream':
+                    # onsets only mark the stream windows; their one-shot windows are not classified
+                    ready = []
+            m_blocks.inc()
+            m_rms.observe(trigger.features.get('rms', 0.0))
+            if detector.new_onset is not None:
+                m_triggers.inc()
+                rms = float(trigger.features.get('rms', 0.0))
+                trace = None
+                if tracer is not None and mode != 'stream':
+                    # onset time estimated from the samples recorded after it
+                    t_detect = time.monotonic()
+                    t_onset = t_detect - (detector.ring.total_written - detector.new_onset) / sample_rate
+                    trace = tracer.start('trigger', t0=t_onset, onset_index=detector.new_onset, rms=round(rms, 1))
+                    trace.add('detect', t_onset, t_detect)
+                    onset_traces[detector.new_onset] = (trace, t_detect)
+                    while len(onset_traces) > 16:
+                        tracer.finish(onset_traces.pop(next(iter(onset_traces)))[0], 'lost')
+                offset = detector.new_onset - (detector.ring.total_written - audio_np.size)
+                log_audio.info(f"{b.name}: trigger RMS={rms:.1f} onset=+{offset}", category='AUDIO.trigger', bin=b.name,
+                               trace_id=trace.id if trace is not None else None, rms=round(rms, 1),
+                               onset_index=detector.new_onset)
+
+            now = time.time()
+            for req in ready:
+                if onset_traces:
+                    trace, t_detect = onset_traces.pop(req.onset_index, (None, None))
+                    if trace is not None:
+                        trace.add('segment', t_detect, req.t_ready, coalesced=req.coalesced)
+                        req.trace = trace
+                if not pipeline.segments.put(req):
+                    log_pipe.warning(f"{b.name}: classifier busy – dropping segment", bin=b.name,
+                                     trace_id=req.trace.id if req.trace is not None else None)
+                    if tracer is not None:
+                        tracer.finish(req.trace, 'dropped')
+
+            # Periodic drop report
+            if stats_interval_s > 0 and now - last_stats_ts >= stats_interval_s:
+                last_stats_ts = now
+                dropped = pipeline.total_dropped()
+                if dropped != last_dropped:
+                    last_dropped = dropped
+                    qs = ' '.join(f"{q['name']}={q['dropped']}+{q['expired']}" for q in pipeline.stats()['queues'])
+                    log_pipe.warning(f"{b.name}: dropped/expired: {qs}", bin=b.name, dropped=dropped)
+                status = {k: v for k, v in pipeline.audio.status.items() if v}
+                if status != last_status:
+                    last_status = status
+                    log_audio.warning(f"{b.name}: callback status {status}, ring overruns {pipeline.audio.dropped}",
+                                      bin=b.name, status=status, overruns=pipeline.audio.dropped)
+
+
+def load_model(env, modelfile: str):
+    """Backend initialised and warmed up: (runner, model info, warm-up ms)."""
+    runner = create_backend(env, modelfile)
+    try:
         model_info = runner.init()
+        # the first inference pays for lazy allocations in the runner; do it before the first bottle
+        freq = int(model_info['model_parameters'].get('frequency', 16000))
+        t0 = time.perf_counter()
+        runner.classify(np.zeros(freq, dtype=np.int16))
+        warm_ms = (time.perf_counter() - t0) * 1000.0
+    except Exception:
+        runner.close()
+        raise
+    return runner, model_info, warm_ms
+
+
+def _import_web() -> None:
+    import fastapi  # noqa: F401
+    import uvicorn  # noqa: F401
+
+
+def _connect_phase(b: Bin, autodetect: bool) -> None:
+    connect_bin(b, autodetect)
+    if b.arduino is None:
+        raise RuntimeError('not connected')
+
+
+def _config_phase(b: Bin) -> None:
+    # audio may already be live: no bottle cycle while the settings are pushed
+    with b.cycle_lock:
+        configure_bin(b)
+
+
+def _api_phase(d: Bin, station: Station, startup: Startup) -> None:
+    if not start_api_server(d.arduino, d.pipeline, d.classifier, d.store, d.renderer, d.archive, d.jobs,
+                            d.tracer, station=station, decisions=d.decisions, startup=startup, config=d.config,
+                            wait_s=10.0):
+        raise RuntimeError('server not listening after 10 s')
+
+
+def main(model: str, selected_device_id: Optional[int] = None):
+    startup = Startup(t0=_T_START)
+    startup.record('imports', _T_START, time.monotonic())
+    # from here on log records are written by a background thread, not by the audio/serial threads
+    logs.setup(os.environ)
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    modelfile = os.path.join(dir_path, model)
+
+    # One bin (microphone + serial port) per BINS entry, or the single 'main' bin
+    station = Station(os.environ, dir_path)
+    if selected_device_id is not None and len(station.bins) == 1:
+        station.default.device_id = selected_device_id
+    bins = list(station.bins.values())
+    # Queue depths/drops, classifier and serial counters are read when /api/metrics is scraped
+    metrics.REGISTRY.add_collector(lambda: metrics.pipeline_metrics({b.name: b.pipeline for b in bins}))
+    metrics.REGISTRY.add_collector(lambda: metrics.classifier_metrics({b.name: b.classifier for b in bins}))
+    metrics.REGISTRY.add_collector(
+        lambda: metrics.transport_metrics({b.name: b.arduino.transport for b in bins if b.arduino is not None}))
+    metrics.REGISTRY.add_collector(lambda: metrics.log_metrics(logs.stats()))
+
+    # Startup phases run side by side: model load + warm-up, audio devices, serial handshake
+    # and configuration, web stack; the API starts once the serial ports are open
+    rate = int(os.environ.get('AUDIO_SAMPLE_RATE', '16000'))
+    f_model = startup.run('model', load_model, os.environ, str(modelfile))
+    f_audio = {b.name: startup.run(f'audio:{b.name}', open_audio, b, rate) for b in bins}
+    f_web = startup.run('imports:web', _import_web)
+    f_serial, f_config = {}, []
+    for b in bins:
+        # the port search only makes sense with a single device
+        f_serial[b.name] = startup.run(f'serial:{b.name}', _connect_phase, b, len(bins) == 1)
+        f_config.append(startup.run(f'config:{b.name}', _config_phase, b, after=[f_serial[b.name]]))
+    # HTTP API for the dashboard (default bin under /api, every bin under /api/bins/<name>)
+    f_api = startup.run('api', _api_phase, station.default, station, startup, after=[f_web, *f_serial.values()])
+
+    runner, model_info, warm_ms = f_model.result()
+    with runner:
         labels = model_info['model_parameters']['labels']
-        print('Loaded runner for "' + model_info['project']['owner'] + ' / ' + model_info['project']['name'] + '"')
+        log_model.info(f"backend={runner.name}, warm-up inference {warm_ms:.0f} ms", backend=runner.name,
+                       warmup_ms=round(warm_ms, 1))
+        log_model.info(f"loaded runner for \"{model_info['project']['owner']} / {model_info['project']['name']}\"")
 
         # Pull frequency from the model
         sample_rate = model_info['model_parameters'].get('frequency', 16000)
-        buffer_duration = 1.0  # seconds
-        buffer_size = int(sample_rate * buffer_duration)
-        audio_buffer = deque(maxlen=buffer_size)
-
-        # Configurable trigger params
-        threshold = int(os.environ.get('AUDIO_RMS_THRESHOLD', '1200'))  # int16 RMS
-        pre_ms = float(os.environ.get('PRE_MS', '200'))
-        post_ms = float(os.environ.get('POST_MS', '800'))
-        cooldown_s = float(os.environ.get('TRIGGER_COOLDOWN_S', '0.3'))
-        visualize = os.environ.get('VISUALIZE', '1') == '1'
-
-        triggered = False
-        post_trigger_samples = int(sample_rate * (post_ms / 1000.0))
-        pre_trigger_samples = int(sample_rate * (pre_ms / 1000.0))
-        post_trigger_count = 0
-        last_trigger_ts = 0.0
-
-        # Audio callback and queue
-        q = queue.Queue(maxsize=50)
-        def audio_callback(indata, frames, time_info, status):
-            if status:
-                print(str(status), file=sys.stderr)
-            data = indata[:, 0].copy() if indata.ndim == 2 else indata.copy()
-            q.put(data)
-
-        blocksize = max(128, int(sample_rate * 0.02))  # ~20 ms
-
-        with sd.InputStream(samplerate=sample_rate, channels=1, dtype='int16', blocksize=blocksize, callback=audio_callback, device=selected_device_id):
-            while True:
-                block = q.get()
-                audio_np = np.asarray(block, dtype=np.int16)
-
-                # Fill ring buffer
-                audio_buffer.extend(audio_np.tolist())
-
-                # Compute RMS in float32 to avoid overflow
-                rms = float(np.sqrt(np.mean(np.square(audio_np.astype(np.float32))))) if audio_np.size > 0 else 0.0
-
-                now = time.time()
-                if not triggered and (now - last_trigger_ts) >= cooldown_s and rms > threshold and len(audio_buffer) >= pre_trigger_samples:
-                    triggered = True
-                    post_trigger_count = 0
-                    last_trigger_ts = now
-                    print(f"[AUDIO] trigger RMS={rms:.1f}")
-
-                if triggered:
-                    # collect post window (800 ms default)
-                    post_trigger_count += audio_np.size
-                    if post_trigger_count >= post_trigger_samples:
-                        # Build 1s snapshot from ring buffer (>=200 ms pre + 800 ms post)
-                        segment = list(audio_buffer)
-                        if len(segment) < buffer_size:
-                            segment = ([0] * (buffer_size - len(segment))) + segment
-                        elif len(segment) > buffer_size:
-                            segment = segment[-buffer_size:]
-                        segment = np.asarray(segment, dtype=np.int16)
-                        print("[AUDIO] classifying segment len=", len(segment))
-
-                        # Classify once
-                        result = runner.classify(segment)
-                        print("[CLASSIFY] result:", result)
-
-                        # shit best label
-                        scores = result.get('result', {}).get('classification', {})
-                        top_label = max(scores, key=scores.get) if scores else None
-                        top_score = scores.get(top_label, 0.0) if top_label else 0.0
-                        print(f"[CLASSIFY] top={top_label} score={top_score:.2f}")
-
-                        # Map to type
-                        type_id = None
-                        if top_label and top_score >= 0.7:
-                            type_id = normalize_type(top_label)
-                        if type_id is None and top_label:
-                            lbl = top_label.lower()
-                            if 'plast' in lbl:
-                                type_id = 0
-                            elif 'glas' in lbl or 'glass' in lbl:
-                                type_id = 1
-                            elif 'can' in lbl or 'dose' in lbl or 'metal' in lbl:
-                                type_id = 2
-
-                        if type_id is not None:
-                            print(f"[CLASSIFY] mapped type: {TYPE_NAME_BY_ID.get(type_id)}")
-                            if arduino is not None:
-                                run_automatic_cycle(arduino, type_id, timeout_s=45.0)
-                            else:
-                                print('[SERIAL] no connection – skipping automatic cycle')
-                        else:
-                            print('[CLASSIFY] no confident type detected; skipping')
-
-                        # Reset trigger and buffer
-                        triggered = False
-                        post_trigger_count = 0
-                        audio_buffer.clear()
-
-                        # Persist classification summary for dashboard
-                        try:
-                            out_path = os.path.join(os.path.dirname(__file__), 'last_result.json')
-                            payload = {
-                                'scores': scores,
-                                'top_label': top_label,
-                                'top_score': top_score,
-                                'type_id': type_id,
-                                'type_name': TYPE_NAME_BY_ID.get(type_id) if type_id is not None else None,
-                                'ts': time.time()
-                            }
-                            with open(out_path, 'w') as f:
-                                json.dump(payload, f)
-                        except Exception:
-                            pass
-
-                        # Optional visualization/export
-                        if visualize:
-                            try:
-                                import matplotlib.pyplot as plt
-                                from scipy.io.wavfile import write as wavwrite
-                                base = os.path.dirname(__file__)
-                                plt.figure(figsize=(10, 3))
-                                plt.plot(segment, linewidth=0.8)
-                                plt.title("Audio segment for classification")
-                                plt.xlabel("Sample")
-                                plt.ylabel("Amplitude")
-                                plt.tight_layout(); plt.savefig(os.path.join(base, "last_segment.png")); plt.close()
-                                plt.figure(figsize=(10, 4))
-                                plt.specgram(segment, Fs=sample_rate, NFFT=512, noverlap=256, cmap='magma')
-                                plt.title("Spectrogram of audio segment")
-                                plt.xlabel("Time [s]"); plt.ylabel("Freq [Hz]")
-                                plt.colorbar(label='dB')
-                                plt.tight_layout(); plt.savefig(os.path.join(base, "last_segment_spectrogram.png")); plt.close()
-                                wavwrite(os.path.join(base, "last_segment.wav"), sample_rate, segment)
-                            except Exception as e:
-                                print(f"[VIS] error: {e}")
+        streams = {}
+        for b in bins:
+            stream = f_audio[b.name].result()
+            if int(sample_rate) != rate:
+                log_audio.warning(f"{b.name}: model expects {sample_rate} Hz, AUDIO_SAMPLE_RATE={rate}; reopening",
+                                  bin=b.name)
+                stream.close()
+                stream = open_audio(b, sample_rate)
+            streams[b.name] = stream
+
+        # Ready (READY=1 for systemd) once every phase has ended and every bin is listening;
+        # a failed serial/API phase leaves the daemon running, reported as degraded
+        def _wait_ready():
+            concurrent.futures.wait([*f_serial.values(), *f_config, f_api])
+            for b in bins:
+                b.listening.wait()
+            startup.ready()
+        threading.Thread(target=_wait_ready, name='startup-ready', daemon=True).start()
+
+        # One model for all bins: several bins are served round-robin by one scheduler
+        runners = station.bind(runner)
+        for b in bins[1:]:
+            threading.Thread(target=run_bin, args=(b, runners[b.name], sample_rate, labels, streams[b.name]),
+                             name=f'capture-{b.name}', daemon=True).start()
+        run_bin(bins[0], runners[bins[0].name], sample_rate, labels, streams[bins[0].name])
+
 
 if __name__ == '__main__':
     # Daemon mode: no CLI args, read config from .env
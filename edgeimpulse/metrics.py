@@ -0,0 +1,287 @@
+"""Minimal Prometheus-style metrics (text exposition format 0.0.4).
+
+Counters and histograms are plain Python objects updated in place under a
+per-series lock, so recording costs about a microsecond and is safe from
+the 20 ms audio loop. Values that components already track (queue depths,
+serial counters and RTT histograms, cache statistics) are not recorded
+twice: collectors read them when /api/metrics is scraped.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+def _fmt(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+def _escape(v: str) -> str:
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def render(self, name: str, names: Sequence[str], key: LabelValues) -> List[str]:
+        return [f"{name}{_labels(names, key)} {_fmt(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+
+    def load(self, counts: Sequence[int], total: float, count: int) -> None:
+        """Copy per-bucket (non-cumulative) counts kept elsewhere."""
+        self.counts = list(counts)
+        self.sum = float(total)
+        self.count = int(count)
+
+    def render(self, name: str, names: Sequence[str], key: LabelValues) -> List[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        acc = 0
+        for bound, c in zip(list(self.bounds) + [float('inf')], counts):
+            acc += c
+            le = 'le="' + _fmt(bound) + '"'
+            lines.append(f"{name}_bucket{_labels(names, key, le)} {acc}")
+        lines.append(f"{name}_sum{_labels(names, key)} {_fmt(total)}")
+        lines.append(f"{name}_count{_labels(names, key)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(float(b) for b in buckets)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, v: float) -> None:
+        self.labels().observe(v)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable[_Metric]]) -> None:
+        """fn() builds metrics from existing component stats at scrape time."""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            try:
+                for m in fn():
+                    lines.extend(m.render())
+            except Exception as e:
+                lines.append(f"# collector error: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Hot-path metrics
+AUDIO_BLOCKS = REGISTRY.register(Counter(
+    'trashcan_audio_blocks_total', 'Audio blocks processed by the trigger loop', ['bin']))
+BLOCK_RMS = REGISTRY.register(Histogram(
+    'trashcan_audio_block_rms', 'int16 RMS per 20 ms audio block',
+    (30, 100, 300, 600, 1000, 1500, 2500, 4000, 7000, 12000, 20000), ['bin']))
+TRIGGERS = REGISTRY.register(Counter(
+    'trashcan_triggers_total', 'Trigger onsets (rate = trigger rate)', ['bin']))
+CLASSIFY_LATENCY = REGISTRY.register(Histogram(
+    'trashcan_classify_latency_ms', 'Inference latency per window in ms',
+    (5, 10, 20, 50, 100, 200, 500, 1000, 2000)))
+DECISIONS = REGISTRY.register(Counter(
+    'trashcan_decisions_total', 'Classification decisions by top label and mapped type', ['bin', 'label', 'type']))
+STARTUP_PHASE = REGISTRY.register(Gauge(
+    'trashcan_startup_phase_seconds', 'Duration of each startup phase of this process (ready = until listening)', ['phase']))
+DECISION_OUTCOMES = REGISTRY.register(Counter(
+    'trashcan_decision_outcomes_total', 'Decision engine outcomes (accept/uncertain/reject) by reason', ['bin', 'outcome', 'reason']))
+STATE_DURATION = REGISTRY.register(Histogram(
+    'trashcan_state_duration_seconds', 'Time spent in a firmware state before the next transition',
+    (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 45), ['bin', 'state']))
+CYCLES = REGISTRY.register(Histogram(
+    'trashcan_cycle_seconds', 'Automatic cycle duration from start ack to IDLE/failure',
+    (1, 2, 5, 10, 15, 20, 30, 45), ['bin', 'outcome']))
+CYCLE_FAILURES = REGISTRY.register(Counter(
+    'trashcan_cycle_failures_total', 'Failed automatic cycles by error code', ['bin', 'error']))
+FIRMWARE_ERRORS = REGISTRY.register(Counter(
+    'trashcan_firmware_errors_total', 'event::error:: codes reported by the firmware', ['bin', 'code']))
+
+
+# Scrape-time collectors (one label set per bin of the station)
+def pipeline_metrics(pipelines: Dict[str, object]) -> List[_Metric]:
+    depth = Gauge('trashcan_queue_depth', 'Current pipeline queue depth', ['bin', 'queue'])
+    high = Gauge('trashcan_queue_high_water', 'Highest pipeline queue depth seen', ['bin', 'queue'])
+    dropped = Counter('trashcan_queue_dropped_total', 'Items dropped on overflow', ['bin', 'queue'])
+    expired = Counter('trashcan_queue_expired_total', 'Items discarded as too old', ['bin', 'queue'])
+    # counted by the audio callback in its block ring, read here instead of on the audio thread
+    status = Counter('trashcan_audio_callback_status_total', 'PortAudio callback status flags (overruns etc.)',
+                     ['bin', 'flag'])
+    overrun = Counter('trashcan_audio_overrun_samples_total', 'Samples dropped because the audio ring was full',
+                      ['bin'])
+    for name, pipeline in pipelines.items():
+        for q in pipeline.stats()['queues']:
+            depth.labels(name, q['name']).set(q['depth'])
+            high.labels(name, q['name']).set(q['high_water'])
+            dropped.labels(name, q['name']).set(q['dropped'])
+            expired.labels(name, q['name']).set(q['expired'])
+        ring = pipeline.audio
+        if ring is not None:
+            for flag, n in ring.status.items():
+                status.labels(name, flag).set(n)
+            overrun.labels(name).set(ring.overrun_samples)
+    return [depth, high, dropped, expired, status, overrun]
+
+
+def transport_metrics(transports: Dict[str, object]) -> List[_Metric]:
+    from transport import RTT_BUCKETS_MS
+    rtt = Histogram('trashcan_serial_ack_latency_ms', 'Serial command round trip until its ack in ms',
+                    RTT_BUCKETS_MS, ['bin', 'cmd'])
+    counters = {k: Counter(f'trashcan_serial_{name}_total', help, ['bin', 'cmd']) for k, name, help in (
+        ('sent', 'sent', 'Serial commands written'),
+        ('acked', 'acked', 'Serial commands acknowledged in time'),
+        ('timeouts', 'ack_timeouts', 'Serial commands without ack within their timeout'),
+        ('stale', 'stale_acks', 'Acks with no command in flight'),
+        ('late', 'late_acks', 'Acks that arrived after their command timed out'),
+        ('deduped', 'deduped', 'Commands joined to an identical one in flight'),
+    )}
+    inflight = Gauge('trashcan_serial_in_flight', 'Serial commands waiting for their ack', ['bin'])
+    for name, transport in transports.items():
+        stats = transport.stats()
+        inflight.labels(name).set(stats['in_flight'])
+        for cmd, c in stats['commands'].items():
+            for k, m in counters.items():
+                m.labels(name, cmd).set(c.get(k, 0))
+            h = c['rtt']
+            if h['count']:
+                rtt.labels(name, cmd).load(list(h['buckets'].values()), (h['mean_ms'] or 0.0) * h['count'], h['count'])
+    return [rtt, inflight, *counters.values()]
+
+
+def classifier_metrics(classifiers: Dict[str, object]) -> List[_Metric]:
+    out: Dict[str, _Metric] = {}
+    for name, classifier in classifiers.items():
+        stats = classifier.stats()
+        for k in ('triggers', 'coalesced', 'requests', 'inferences'):
+            m = out.setdefault(k, Counter(f'trashcan_classifier_{k}_total', f'Classifier {k}', ['bin']))
+            m.labels(name).set(stats[k])
+        cache: Optional[Dict] = stats.get('cache')
+        if cache:
+            for k in ('hits', 'misses', 'evictions'):
+                m = out.setdefault('cache_' + k, Counter(f'trashcan_classify_cache_{k}_total',
+                                                         f'Classification cache {k}', ['bin']))
+                m.labels(name).set(cache[k])
+    return list(out.values())
+
+
+def log_metrics(stats: Dict) -> List[_Metric]:
+    passed = Counter('trashcan_log_records_total', 'Log records written per category', ['category'])
+    suppressed = Counter('trashcan_log_suppressed_total', 'Log records dropped by the rate limit or sampling',
+                         ['category', 'reason'])
+    dropped = Counter('trashcan_log_dropped_total', 'Log records dropped because the log queue was full')
+    depth = Gauge('trashcan_log_queue_depth', 'Log records waiting for the writer thread')
+    for category, c in stats['categories'].items():
+        passed.labels(category).set(c['passed'])
+        suppressed.labels(category, 'rate').set(c['suppressed'])
+        suppressed.labels(category, 'sampled').set(c['sampled_out'])
+    q = stats.get('queue')
+    if q:
+        dropped.labels().set(q['dropped'])
+        depth.labels().set(q['depth'])
+    return [passed, suppressed, dropped, depth]
@@ -0,0 +1,201 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import logs
+from ringbuffer import BlockRing
+
+log = logs.get('PIPE')
+
+# Overflow policies for DropQueue
+DROP_OLDEST = 'drop_oldest'   # evict the oldest queued item, keep the new one
+DROP_NEWEST = 'drop_newest'   # reject the new item, keep what is queued
+BLOCK = 'block'               # wait up to block_timeout_s, then reject the new item
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class DropQueue:
+    """Bounded hand-off queue with an explicit overflow policy and drop counters.
+
+    put() never blocks for DROP_OLDEST/DROP_NEWEST, so it is safe to call from
+    the PortAudio callback. Items older than max_age_s are discarded on get()
+    and counted as expired.
+    """
+    def __init__(self, name: str, maxsize: int, policy: str = DROP_OLDEST,
+                 block_timeout_s: float = 0.1, max_age_s: Optional[float] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid queue policy '{policy}'")
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+        self.max_age_s = max_age_s
+        self._q: queue.Queue = queue.Queue(maxsize=self.maxsize)
+        self.put_count = 0
+        self.dropped = 0
+        self.expired = 0
+        self.high_water = 0
+
+    def put(self, item: Any) -> bool:
+        """Enqueue item; returns False if the item itself was dropped."""
+        entry = (time.monotonic(), item)
+        self.put_count += 1
+        try:
+            if self.policy == BLOCK:
+                self._q.put(entry, timeout=self.block_timeout_s)
+            else:
+                self._q.put_nowait(entry)
+        except queue.Full:
+            if self.policy != DROP_OLDEST:
+                self.dropped += 1
+                return False
+            try:
+                self._q.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._q.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        depth = self._q.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Blocking get; raises queue.Empty on timeout. Skips expired items."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            t_put, item = self._q.get(timeout=remaining)
+            if self.max_age_s is not None and time.monotonic() - t_put > self.max_age_s:
+                self.expired += 1
+                continue
+            return item
+
+    def qsize(self) -> int:
+        return self._q.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'depth': self._q.qsize(),
+            'high_water': self.high_water,
+            'put': self.put_count,
+            'dropped': self.dropped,
+            'expired': self.expired,
+        }
+
+
+class Stage:
+    """Worker thread draining one DropQueue into a handler."""
+    def __init__(self, name: str, inbox: DropQueue, handler: Callable[[Any], None]):
+        self.name = name
+        self.inbox = inbox
+        self.handler = handler
+        self.processed = 0
+        self.errors = 0
+        self.busy = False
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def _loop(self) -> None:
+        while self._running:
+            try:
+                item = self.inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.busy = True
+            try:
+                self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                log.error(f"{self.name} error: {e}", stage=self.name, exc_info=True)
+            finally:
+                self.busy = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {'name': self.name, 'processed': self.processed, 'errors': self.errors, 'busy': self.busy}
+
+
+class Pipeline:
+    """capture -> trigger -> classify -> actuate, connected by bounded DropQueues.
+
+    The capture stage is the audio callback (put into `audio`, a lock-free
+    block ring created by open_audio() once the block size is known), the
+    trigger stage is the caller's loop draining `audio`; classification and
+    the mechanical cycle run on their own worker threads.
+    """
+    def __init__(self, audio_size: int = 50, segment_size: int = 4, action_size: int = 1,
+                 action_max_age_s: Optional[float] = 60.0, stream_size: int = 2):
+        # Audio: preallocated slots, the callback never blocks; overruns drop the new block
+        self.audio_slots = max(2, int(audio_size))
+        self.audio: Optional[BlockRing] = None
+        # Segments: a backlog of stale segments is useless, keep the newest
+        self.segments = DropQueue('segments', segment_size, DROP_OLDEST)
+        # Actions: one bottle at a time; while a cycle runs, further bottles are rejected
+        self.actions = DropQueue('actions', action_size, DROP_NEWEST, max_age_s=action_max_age_s)
+        # Stream hops (CLASSIFY_MODE=stream|both): only the newest windows matter
+        self.stream_size = max(1, int(stream_size))
+        self.stream: Optional[DropQueue] = None
+        self.stages: List[Stage] = []
+        self.triggers = 0
+
+    @classmethod
+    def from_env(cls, env) -> 'Pipeline':
+        max_age = float(env.get('PIPE_ACTION_MAX_AGE_S', '60'))
+        return cls(
+            audio_size=int(env.get('PIPE_AUDIO_QUEUE', '50')),
+            segment_size=int(env.get('PIPE_SEGMENT_QUEUE', '4')),
+            action_size=int(env.get('PIPE_ACTION_QUEUE', '1')),
+            action_max_age_s=max_age if max_age > 0 else None,
+            stream_size=int(env.get('PIPE_STREAM_QUEUE', '2')),
+        )
+
+    def open_audio(self, blocksize: int, poll_s: float = 0.005) -> BlockRing:
+        """(Re)create the audio ring for blocks of `blocksize` samples; before capture starts."""
+        self.audio = BlockRing(self.audio_slots, blocksize, poll_s)
+        return self.audio
+
+    def _queues(self) -> list:
+        return [q for q in (self.audio, self.segments, self.actions, self.stream) if q is not None]
+
+    def start(self, classify: Callable[[Any], None], actuate: Callable[[Any], None],
+              stream: Optional[Callable[[Any], None]] = None) -> None:
+        self.stages = [
+            Stage('classify-worker', self.segments, classify),
+            Stage('actuator-worker', self.actions, actuate),
+        ]
+        if stream is not None:
+            self.stream = DropQueue('stream', self.stream_size, DROP_OLDEST)
+            self.stages.append(Stage('stream-worker', self.stream, stream))
+        for s in self.stages:
+            s.start()
+
+    def stop(self) -> None:
+        for s in self.stages:
+            s.stop()
+
+    def total_dropped(self) -> int:
+        return sum(q.dropped + q.expired for q in self._queues())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'triggers': self.triggers,
+            'queues': [q.stats() for q in self._queues()],
+            'stages': [s.stats() for s in self.stages],
+        }
@@ -0,0 +1,169 @@
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+import logs
+from pipeline import DROP_OLDEST, DropQueue
+
+log = logs.get('VIS')
+
+_mpl = None  # (Figure, FigureCanvasAgg), imported once on first render
+
+
+def _agg():
+    global _mpl
+    if _mpl is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        _mpl = (Figure, FigureCanvasAgg)
+    return _mpl
+
+
+def spectrogram_db(segment: np.ndarray, sample_rate: int, nfft: int = 512,
+                   hop: int = 256) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Power spectrogram in dB, (freqs, times, (freqs x frames)) like plt.specgram."""
+    x = np.asarray(segment, dtype=np.float32)
+    if x.size < nfft:
+        x = np.pad(x, (0, nfft - x.size))
+    n_frames = 1 + (x.size - nfft) // hop
+    idx = np.arange(nfft)[None, :] + hop * np.arange(n_frames)[:, None]
+    window = np.hanning(nfft).astype(np.float32)
+    power = np.abs(np.fft.rfft(x[idx] * window, axis=1)) ** 2
+    power /= sample_rate * float(np.sum(window ** 2))
+    db = 10.0 * np.log10(power.T + 1e-12)
+    freqs = np.fft.rfftfreq(nfft, d=1.0 / sample_rate)
+    times = (np.arange(n_frames) * hop + nfft / 2) / float(sample_rate)
+    return freqs, times, db
+
+
+class SegmentRenderer:
+    """Keeps the last classified segment and renders its artifacts off the hot path.
+
+    submit() only hands a copy of the segment to a bounded queue (older
+    pending segments are dropped); the render worker writes last_segment.wav
+    and invalidates the cached images. Waveform and spectrogram PNGs are
+    rendered lazily on the first request for a segment and cached with an
+    ETag until the next one arrives.
+    """
+    KINDS = ('wave', 'spec', 'audio')
+
+    def __init__(self, sample_rate: int = 16000, out_dir: Optional[str] = None, queue_size: int = 2):
+        self.sample_rate = int(sample_rate)
+        self.out_dir = out_dir
+        self.jobs = DropQueue('render', queue_size, DROP_OLDEST)
+        self.seq = 0
+        self.segment: Optional[np.ndarray] = None
+        self.meta: Dict[str, Any] = {}
+        self._cache: Dict[str, Tuple[str, bytes]] = {}
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self.rendered = 0
+        self.cache_hits = 0
+        self.render_ms_max = 0.0
+        self._thread = threading.Thread(target=self._loop, name='render-worker', daemon=True)
+        self._thread.start()
+
+    def bind(self, sample_rate: int) -> None:
+        """Set the model sample rate once the runner is loaded."""
+        self.sample_rate = int(sample_rate)
+
+    def submit(self, segment: np.ndarray, **meta: Any) -> bool:
+        """Queue a copy of segment (the ring buffer view is overwritten later)."""
+        return self.jobs.put((np.array(segment, dtype=np.int16, copy=True), meta))
+
+    def _loop(self) -> None:
+        while True:
+            segment, meta = self.jobs.get()
+            with self._lock:
+                self.seq += 1
+                seq = self.seq
+                self.segment = segment
+                self.meta = {**meta, 'id': seq, 'ts': meta.get('ts', time.time()), 'samples': int(segment.size)}
+                self._cache.clear()
+            if self.out_dir:
+                try:
+                    wav = self._render('audio', segment)
+                    with self._lock:
+                        if self.seq == seq:
+                            self._cache['audio'] = (f'"{seq}-audio"', wav)
+                    tmp = os.path.join(self.out_dir, 'last_segment.wav.tmp')
+                    with open(tmp, 'wb') as f:
+                        f.write(wav)
+                    os.replace(tmp, os.path.join(self.out_dir, 'last_segment.wav'))
+                except Exception as e:
+                    log.error(f"{e}")
+
+    def get(self, kind: str) -> Optional[Tuple[str, bytes]]:
+        """(etag, bytes) of the current segment's artifact, rendered on first use."""
+        if kind not in self.KINDS:
+            raise ValueError(f"Invalid artifact '{kind}'")
+        with self._lock:
+            seq, segment = self.seq, self.segment
+            hit = self._cache.get(kind)
+        if segment is None:
+            return None
+        if hit is not None:
+            self.cache_hits += 1
+            return hit
+        with self._render_lock:
+            with self._lock:
+                hit = self._cache.get(kind) if self.seq == seq else None
+            if hit is not None:  # rendered by a concurrent request
+                self.cache_hits += 1
+                return hit
+            t0 = time.perf_counter()
+            data = self._render(kind, segment)
+            ms = (time.perf_counter() - t0) * 1000.0
+            self.rendered += 1
+            self.render_ms_max = max(self.render_ms_max, ms)
+        entry = (f'"{seq}-{kind}"', data)
+        with self._lock:
+            if self.seq == seq:
+                self._cache[kind] = entry
+        return entry
+
+    def _render(self, kind: str, segment: np.ndarray) -> bytes:
+        buf = io.BytesIO()
+        if kind == 'audio':
+            from scipy.io.wavfile import write as wavwrite
+            wavwrite(buf, self.sample_rate, segment)
+            return buf.getvalue()
+        Figure, FigureCanvasAgg = _agg()
+        if kind == 'wave':
+            fig = Figure(figsize=(10, 3))
+            ax = fig.add_subplot()
+            ax.plot(segment, linewidth=0.8)
+            ax.set_title("Audio segment for classification")
+            ax.set_xlabel("Sample")
+            ax.set_ylabel("Amplitude")
+        else:
+            freqs, times, db = spectrogram_db(segment, self.sample_rate)
+            fig = Figure(figsize=(10, 4))
+            ax = fig.add_subplot()
+            im = ax.pcolormesh(times, freqs, db, shading='auto', cmap='magma')
+            ax.set_title("Spectrogram of audio segment")
+            ax.set_xlabel("Time [s]")
+            ax.set_ylabel("Freq [Hz]")
+            fig.colorbar(im, ax=ax, label='dB')
+        fig.tight_layout()
+        FigureCanvasAgg(fig).print_png(buf)
+        return buf.getvalue()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            meta = dict(self.meta)
+            cached = sorted(self._cache)
+        return {
+            'segment': meta or None,
+            'cached': cached,
+            'rendered': self.rendered,
+            'cache_hits': self.cache_hits,
+            'render_ms_max': self.render_ms_max,
+            'queue': self.jobs.stats(),
+        }
@@ -0,0 +1,223 @@
+"""Offline replay: run WAV recordings through the daemon's trigger + classify path.
+
+Files are memory-mapped and streamed in 20 ms blocks through the same
+SegmentDetector (ring buffer, trigger engine, windowing) and
+ClassificationService as the live daemon, as fast as the CPU allows.
+Per file a CSV and/or JSON report of triggers, labels, scores and timings
+is written. With CLASSIFY_MODE=stream|both the sliding-window classifier
+runs on the same blocks; its decisions go to <file>.stream.csv and the
+report compares both paths per onset (label agreement, latency).
+
+    python edgeimpulse/replay.py recordings/ --out replay_out --set AUDIO_RMS_THRESHOLD=900
+    python edgeimpulse/replay.py recordings/ --set CLASSIFY_MODE=both --set STREAM_HOP_MS=250
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from scipy.io import wavfile
+
+from backends import create_backend
+from classifier import ClassificationService
+from decision import DecisionEngine
+from detector import SegmentDetector
+from streaming import StreamingClassifier
+from trigger import create_trigger
+
+
+def iter_wav_files(paths: List[str]) -> Iterator[str]:
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                for name in sorted(files):
+                    if name.lower().endswith('.wav'):
+                        yield os.path.join(root, name)
+        elif p.lower().endswith('.wav'):
+            yield p
+
+
+def read_wav(path: str, sample_rate: int) -> np.ndarray:
+    """Memory-mapped mono int16 samples of a PCM WAV file."""
+    sr, data = wavfile.read(path, mmap=True)
+    if sr != sample_rate:
+        raise ValueError(f"{path}: sample rate {sr} Hz, model expects {sample_rate} Hz")
+    if data.dtype != np.int16:
+        raise ValueError(f"{path}: {data.dtype} samples, expected int16 PCM")
+    return data[:, 0] if data.ndim == 2 else data
+
+
+def replay_file(path: str, env, classifier: ClassificationService, sample_rate: int,
+                decisions: Optional[DecisionEngine] = None,
+                stream: Optional[StreamingClassifier] = None) -> Dict[str, Any]:
+    """Stream one file through a fresh detector; classification (and decision) runs inline."""
+    samples = read_wav(path, sample_rate)
+    blocksize = max(128, int(sample_rate * 0.02))
+    buffer_size = int(sample_rate * 1.0)
+    classifier.reset_triggers()
+    if decisions is not None:
+        decisions.reset()
+    if stream is not None:
+        stream.reset()
+        stream.compare.reset()
+    detector = SegmentDetector(create_trigger(env, sample_rate, blocksize), classifier, blocksize, buffer_size)
+    post_ms = classifier.span_after * 1000.0 / sample_rate
+
+    events: List[Dict[str, Any]] = []
+    stream_events: List[Dict[str, Any]] = []
+
+    def _classify(reqs) -> None:
+        if not reqs:
+            return
+        # one batch per block: an inference pool runs the windows side by side
+        t0 = time.perf_counter()
+        for req, result in zip(reqs, classifier.classify_many(reqs)):
+            # recording time, so DECISION_RETRY_S spans the same audio as live
+            decision = decisions.decide(result, now=req.onset_index / float(sample_rate)) if decisions else None
+            if stream is not None:
+                type_name = decision['type_name'] if decision else None
+                stream.compare.add('trigger', req.onset_index, type_name, post_ms + max(result['latency_ms'], default=0.0))
+            events.append({
+                'onset_s': round(req.onset_index / float(sample_rate), 4),
+                'coalesced': req.coalesced,
+                'top_label': result['top_label'],
+                'top_score': result['top_score'],
+                'scores': result['scores'],
+                'decision': decision['outcome'] if decision else None,
+                'reason': decision['reason'] if decision else None,
+                'type_name': decision['type_name'] if decision else None,
+                'inference_ms': result['latency_ms'],
+                'total_ms': (time.perf_counter() - t0) * 1000.0,
+            })
+
+    def _stream() -> None:
+        if detector.new_onset is not None:
+            stream.note_onset(detector.new_onset)
+        win = stream.pop_ready(detector.ring)
+        if win is None:
+            return
+        result = stream.classify(win)
+        decision = stream.decide(result, win)
+        if decision is not None:
+            stream_events.append({
+                'decided_s': round(win.end_index / float(sample_rate), 4),
+                'onset_s': round(win.onset_index / float(sample_rate), 4) if win.onset_index is not None else None,
+                'label': decision['label'],
+                'score': decision['score'],
+                'type_name': decision['type_name'],
+                'hops': decision['hops'],
+                'latency_ms': decision['latency_ms'],
+            })
+
+    t0 = time.perf_counter()
+    for i in range(0, samples.size, blocksize):
+        ready = detector.feed(np.asarray(samples[i:i + blocksize]))
+        if stream is not None:
+            _stream()
+        _classify(ready)
+    _classify(detector.flush())
+    wall = time.perf_counter() - t0
+    duration = samples.size / float(sample_rate)
+    report = {
+        'file': path,
+        'duration_s': duration,
+        'wall_s': wall,
+        'realtime_factor': (duration / wall) if wall > 0 else None,
+        'triggers': detector.triggers,
+        'windows': len(events),
+        'events': events,
+    }
+    if stream is not None:
+        report['stream_events'] = stream_events
+        report['compare'] = stream.compare.stats(recent=0)
+    return report
+
+
+def write_reports(report: Dict[str, Any], out_dir: str, fmt: str) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, os.path.splitext(os.path.basename(report['file']))[0])
+    if fmt in ('json', 'both'):
+        with open(base + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+    if fmt in ('csv', 'both'):
+        with open(base + '.csv', 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['onset_s', 'coalesced', 'top_label', 'top_score', 'decision', 'reason', 'type_name',
+                        'scores', 'inference_ms', 'total_ms'])
+            for e in report['events']:
+                w.writerow([e['onset_s'], e['coalesced'], e['top_label'], f"{e['top_score']:.4f}",
+                            e['decision'], e['reason'], e['type_name'],
+                            json.dumps(e['scores']), ';'.join(f"{x:.2f}" for x in e['inference_ms']),
+                            f"{e['total_ms']:.2f}"])
+        if 'stream_events' in report:
+            with open(base + '.stream.csv', 'w', newline='') as f:
+                w = csv.writer(f)
+                w.writerow(['decided_s', 'onset_s', 'label', 'score', 'type_name', 'hops', 'latency_ms'])
+                for e in report['stream_events']:
+                    w.writerow([e['decided_s'], e['onset_s'], e['label'], f"{e['score']:.4f}", e['type_name'],
+                                e['hops'], f"{e['latency_ms']:.1f}" if e['latency_ms'] is not None else ''])
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Replay WAV recordings through trigger + classification')
+    ap.add_argument('paths', nargs='+', help='WAV files or directories')
+    ap.add_argument('--out', default='replay_out', help='report directory')
+    ap.add_argument('--format', choices=('csv', 'json', 'both'), default='both')
+    ap.add_argument('--model', default=None, help='.eim path (default: MODEL_EIM_PATH)')
+    ap.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                    help='override a .env setting, e.g. AUDIO_RMS_THRESHOLD=900')
+    args = ap.parse_args(argv)
+
+    load_dotenv(find_dotenv())
+    env = dict(os.environ)
+    for kv in args.set:
+        k, _, v = kv.partition('=')
+        env[k.strip()] = v.strip()
+
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    modelfile = os.path.join(dir_path, args.model or env.get('MODEL_EIM_PATH', 'model/modelmac.eim'))
+
+    totals = {'files': 0, 'duration_s': 0.0, 'wall_s': 0.0, 'triggers': 0, 'windows': 0}
+    with create_backend(env, str(modelfile)) as runner:
+        model_info = runner.init()
+        sample_rate = model_info['model_parameters'].get('frequency', 16000)
+        classifier = ClassificationService.from_env(env)
+        classifier.bind(runner, sample_rate)
+        decisions = DecisionEngine.from_env(env, dir_path)
+        stream = None
+        if env.get('CLASSIFY_MODE', 'trigger').strip().lower() != 'trigger':
+            stream = StreamingClassifier.from_env(env, decisions)
+            stream.bind(runner, sample_rate, classifier.window_samples)
+        for path in iter_wav_files(args.paths):
+            try:
+                report = replay_file(path, env, classifier, sample_rate, decisions, stream)
+            except Exception as e:
+                print(f"[REPLAY] {path}: {e}", file=sys.stderr)
+                continue
+            write_reports(report, args.out, args.format)
+            print(f"[REPLAY] {path}: {report['duration_s']:.1f}s audio in {report['wall_s']:.2f}s, "
+                  f"triggers={report['triggers']} windows={report['windows']}")
+            if stream is not None:
+                c = report['compare']
+                print(f"[REPLAY] {path}: stream decisions={len(report['stream_events'])} paired={c['paired']} "
+                      f"agree={c['agree']} latency p50 trigger={c['trigger_latency_ms']['p50']} "
+                      f"stream={c['stream_latency_ms']['p50']} ms")
+            totals['files'] += 1
+            for k in ('duration_s', 'wall_s', 'triggers', 'windows'):
+                totals[k] += report[k]
+        print(f"[REPLAY] summary: {json.dumps(totals)}")
+        print(f"[REPLAY] classifier: {json.dumps(classifier.stats())}")
+        print(f"[REPLAY] decisions: {json.dumps(decisions.stats()['outcomes'])}")
+        if stream is not None:
+            st = stream.stats()
+            print(f"[REPLAY] stream: {json.dumps({k: st[k] for k in ('hop_ms', 'hops', 'hop_outcomes', 'decided', 'features')})}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
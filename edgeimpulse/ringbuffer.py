@@ -0,0 +1,204 @@
+import queue
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class Int16RingBuffer:
+    """Fixed-size int16 ring buffer with zero-copy snapshots of the newest samples.
+
+    Every sample is stored twice (at i and i + capacity), so the last N samples
+    are always one contiguous slice of the backing array and can be handed out
+    as a view without concatenating the wrapped halves.
+    """
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        self.capacity = int(capacity)
+        self._buf = np.zeros(2 * self.capacity, dtype=np.int16)
+        self._write = 0      # next write index in [0, capacity)
+        self._filled = 0     # valid samples, capped at capacity
+        self.total_written = 0  # monotonic sample counter (never reset by clear)
+
+    def __len__(self) -> int:
+        return self._filled
+
+    def write(self, block: np.ndarray) -> None:
+        """Append a block of samples, overwriting the oldest ones on wraparound."""
+        block = np.asarray(block, dtype=np.int16).reshape(-1)
+        n = block.size
+        if n == 0:
+            return
+        self.total_written += n
+        cap = self.capacity
+        if n >= cap:
+            block = block[-cap:]
+            n = cap
+        buf = self._buf
+        w = self._write
+        end = w + n
+        if end <= cap:
+            buf[w:end] = block
+            buf[w + cap:end + cap] = block
+        else:
+            first = cap - w
+            rest = n - first
+            buf[w:cap] = block[:first]
+            buf[w + cap:] = block[:first]
+            buf[:rest] = block[first:]
+            buf[cap:cap + rest] = block[first:]
+        self._write = end % cap
+        self._filled = min(cap, self._filled + n)
+
+    def latest(self, n: int) -> np.ndarray:
+        """Read-only view of the newest n samples (oldest first).
+
+        Missing history (after construction or clear()) reads as zeros, i.e. the
+        snapshot is left zero-padded. The view is invalidated by later writes;
+        copy it if it has to outlive the next write().
+        """
+        if n <= 0:
+            return self._buf[:0]
+        if n > self.capacity:
+            raise ValueError(f"requested {n} samples, capacity is {self.capacity}")
+        end = self._write + self.capacity
+        view = self._buf[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def window(self, start_index: int, n: int) -> np.ndarray:
+        """Read-only view of n samples starting at the absolute index start_index.
+
+        start_index may lie before the first recorded sample (reads as zeros) but
+        not more than capacity samples back from the write position.
+        """
+        back = self.total_written - int(start_index)
+        if back > self.capacity:
+            raise ValueError(f"sample {start_index} already overwritten")
+        if back < n:
+            raise ValueError(f"samples up to {start_index + n} not written yet")
+        end = self._write + self.capacity - back + n
+        view = self._buf[end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def since(self, sample_index: int) -> np.ndarray:
+        """View of all samples written at or after the absolute index sample_index."""
+        n = self.total_written - int(sample_index)
+        return self.latest(max(0, min(n, self._filled)))
+
+    def clear(self) -> None:
+        self._buf.fill(0)
+        self._write = 0
+        self._filled = 0
+
+
+class BlockRing:
+    """Single-producer/single-consumer ring of fixed-size int16 audio blocks.
+
+    The PortAudio callback (producer) copies each block into a preallocated
+    slot and advances `head`; the trigger loop (consumer) reads the slot as a
+    view and advances `tail`. Each index has exactly one writer and a plain
+    int assignment is atomic under the GIL, so neither side takes a lock:
+    put() never blocks and allocates no sample buffers, get() polls.
+
+    When the consumer falls behind and every slot is full, the new block is
+    dropped and counted as an overrun (blocks and samples) instead of
+    overwriting data the consumer may be reading. PortAudio status flags are
+    counted here as well, so they can be reported off the audio thread.
+    """
+    STATUS_FLAGS = ('input_overflow', 'input_underflow', 'output_overflow', 'output_underflow')
+
+    def __init__(self, slots: int, blocksize: int, poll_s: float = 0.005):
+        if slots < 2:
+            raise ValueError("slots must be >= 2")
+        if blocksize <= 0:
+            raise ValueError("blocksize must be > 0")
+        self.name = 'audio'
+        self.slots = int(slots)
+        self.blocksize = int(blocksize)
+        self.poll_s = float(poll_s)
+        self._buf = np.zeros((self.slots, self.blocksize), dtype=np.int16)
+        self._rows = [self._buf[i] for i in range(self.slots)]  # writable slot views (producer)
+        self._views = [self._buf[i] for i in range(self.slots)]  # read-only slot views (consumer)
+        for v in self._views:
+            v.flags.writeable = False
+        self._lengths = [self.blocksize] * self.slots
+        self.head = 0   # blocks written (producer only)
+        self.tail = 0   # blocks released (consumer only)
+        self._holding = False  # consumer still reads slot `tail`
+        # Producer-side counters
+        self.put_count = 0
+        self.dropped = 0          # overrun blocks
+        self.overrun_samples = 0
+        self.high_water = 0
+        self.status = {flag: 0 for flag in self.STATUS_FLAGS}
+        self.expired = 0  # DropQueue-compatible: blocks never expire
+
+    # Producer (audio callback)
+    def put(self, samples: np.ndarray) -> bool:
+        """Copy one block of samples into the next free slot(s); False on overrun."""
+        n = samples.shape[0]
+        ok = True
+        for start in range(0, n, self.blocksize):
+            m = min(self.blocksize, n - start)
+            head = self.head
+            depth = head - self.tail
+            if depth >= self.slots:
+                self.dropped += 1
+                self.overrun_samples += m
+                ok = False
+                continue
+            i = head % self.slots
+            if m == self.blocksize and start == 0 and n == m:
+                np.copyto(self._rows[i], samples)
+            else:
+                np.copyto(self._rows[i][:m], samples[start:start + m])
+            self._lengths[i] = m
+            self.head = head + 1  # publish after the samples are in place
+            self.put_count += 1
+            if depth + 1 > self.high_water:
+                self.high_water = depth + 1
+        return ok
+
+    def put_status(self, status) -> None:
+        """Count the flags of a PortAudio CallbackFlags object."""
+        for flag in self.STATUS_FLAGS:
+            if getattr(status, flag, False):
+                self.status[flag] += 1
+
+    # Consumer (trigger loop)
+    def get(self, timeout: Optional[float] = None) -> np.ndarray:
+        """Read-only view of the next block, valid until the next get(); raises queue.Empty on timeout."""
+        if self._holding:
+            self.tail += 1  # the previous view is no longer read: hand its slot back
+            self._holding = False
+        if self.head == self.tail:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.head == self.tail:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise queue.Empty
+                time.sleep(self.poll_s)
+        i = self.tail % self.slots
+        self._holding = True
+        n = self._lengths[i]
+        return self._views[i] if n == self.blocksize else self._views[i][:n]
+
+    def qsize(self) -> int:
+        return self.head - self.tail
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'policy': 'spsc_ring',
+            'maxsize': self.slots,
+            'depth': self.head - self.tail,
+            'high_water': self.high_water,
+            'put': self.put_count,
+            'dropped': self.dropped,
+            'expired': 0,
+            'blocksize': self.blocksize,
+            'overrun_samples': self.overrun_samples,
+            'status': dict(self.status),
+        }
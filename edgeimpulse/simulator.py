@@ -0,0 +1,465 @@
+"""Virtual firmware: the trashcan state machine from arduino/platform-io behind a pty.
+
+FirmwareSim mirrors src/main.cpp (states, error codes, acks, diagnostics,
+commands only read while IDLE) with configurable motion delays; PtyLink
+exposes it as a pseudo terminal so the daemon's Arduino class talks to it
+exactly like to /dev/ttyACM0.
+
+    # serve a virtual port for the daemon (TRASHCAN_SERIAL_PORT=<printed path>)
+    python edgeimpulse/simulator.py serve --tray-enabled
+    # drive cycles through run_automatic_cycle and report throughput/ack latency
+    python edgeimpulse/simulator.py load --cycles 2000 --time-scale 0.001
+    # start cycles through a running daemon's HTTP API (daemon connected to `serve`)
+    python edgeimpulse/simulator.py load --cycles 200 --api http://127.0.0.1:8008
+"""
+import argparse
+import json
+import os
+import random
+import select
+import sys
+import threading
+import time
+import tty
+from typing import Callable, Dict, List, Optional
+
+TYPE_NAMES = ('PLASTIC', 'GLAS', 'CAN')
+TYPE_BY_NAME = {'plastic': 0, 'plastik': 0, 'glass': 1, 'glas': 1, 'can': 2, 'dose': 2}
+# BottleState numbers as reported by gPosBottle / gDiagBottle
+INIT_STATE, DROP_HOLE1_STATE, DROP_HOLE2_STATE, MOVING_STATE, UNKNOWN_STATE = range(5)
+HOME_ANGLE, HOLE1_ANGLE, HOLE2_ANGLE = 45, 0, 135
+
+
+class FirmwareSim:
+    """Pure-Python model of the firmware's main loop.
+
+    Durations are in seconds of firmware time and multiplied by time_scale,
+    so time_scale=0.001 runs a ~4 s cycle in ~4 ms. fail_rate injects a
+    random cycle error (the codes the firmware can raise in that phase).
+    main.cpp only reads serial input in IDLE, so a `recover` sent in
+    EMO_MOOD never arrives although the state is documented as "waiting
+    for recover"; only reset() (the reset button) leaves it. strict=False
+    also reads commands in EMO_MOOD, which the real firmware does not.
+    """
+    def __init__(self, write_line: Callable[[str], None], tray_enabled: bool = False,
+                 time_scale: float = 1.0, calibrate_s: float = 2.0, tray_move_s: float = 3.0,
+                 bottle_move_s: float = 1.0, dwell_s: float = 1.0, fail_rate: float = 0.0,
+                 seed: Optional[int] = None, strict: bool = True):
+        self.write_line = write_line
+        self.strict = strict
+        self.tray_enabled = tray_enabled
+        self.time_scale = float(time_scale)
+        self.durations = {
+            'LOADING': calibrate_s,
+            'WAITING_FOR_TRAY': tray_move_s,
+            'MOVING_BOTTLE_TO_TRAY': bottle_move_s,
+            'BOTTLE_IN_TRAY': dwell_s,
+            'MOVING_TO_IDLE': bottle_move_s,
+        }
+        self.fail_rate = float(fail_rate)
+        self._rng = random.Random(seed)
+        self.state = 'LOADING'
+        self.last_error = 'NONE'
+        self.trash_type = 0
+        self.tray_positions = {0: 11000, 1: 10000, 2: 1200}
+        self.tray_pos = 0
+        self.tray_target = 0
+        self.tray_state = 'READY'
+        self.bottle_state = INIT_STATE
+        self.bottle_angle = HOME_ANGLE
+        self.bottle_speed_ms = 15
+        self.cycles = 0
+        self.errors = 0
+        self._state_until = 0.0
+        self._fail_in: Optional[str] = None
+        self._inbox: List[str] = []
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    # I/O
+    def feed(self, line: str) -> None:
+        """Queue a received command line; it is handled once the sim reads input."""
+        with self._lock:
+            self._inbox.append(line)
+
+    def start(self) -> None:
+        self._running = True
+        self._emit_state()
+        self._enter('LOADING', force=True)
+        self._thread = threading.Thread(target=self._loop, name='firmware-sim', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def reset(self) -> None:
+        """Board reset: pending input is lost and the firmware boots again (LOADING -> IDLE)."""
+        with self._lock:
+            self._inbox.clear()
+        self._fail_in = None
+        self.state = 'LOADING'
+        self._emit_state()
+        self._enter('LOADING', force=True)
+
+    def _loop(self) -> None:
+        while self._running:
+            self.tick()
+            time.sleep(min(0.001, self.time_scale * 0.01))
+
+    # State machine
+    def _emit_state(self) -> None:
+        self.write_line(f"event::state::{self.state}")
+
+    def _enter(self, state: str, force: bool = False) -> None:
+        if self.state == state and not force:
+            return
+        self.state = state
+        self._state_until = time.monotonic() + self.durations.get(state, 0.0) * self.time_scale
+        if not force:
+            self._emit_state()
+
+    def _raise(self, code: str) -> None:
+        self.last_error = code
+        self.errors += 1
+        self.write_line(f"event::error::{code}")
+        self._enter('EMO_MOOD')
+
+    def tick(self) -> None:
+        now = time.monotonic()
+        st = self.state
+        if st == 'LOADING':
+            if not self.tray_enabled or now >= self._state_until:
+                self.tray_pos = self.tray_target = 0
+                self._enter('IDLE')
+        elif st == 'IDLE' or (st == 'EMO_MOOD' and not self.strict):
+            with self._lock:
+                line = self._inbox.pop(0) if self._inbox else None
+            if line:
+                self.handle(line.strip())
+        elif st == 'CONTAINS_BOTTLE':
+            self.bottle_state = INIT_STATE
+            self.bottle_angle = HOME_ANGLE
+            if self.fail_rate and self._rng.random() < self.fail_rate:
+                codes = ['BOTTLE_TIMEOUT', 'BOTTLE_HOME_TIMEOUT']
+                if self.tray_enabled:
+                    codes += ['PRECONDITIONS_FAIL', 'TRAY_TIMEOUT', 'TRAY_NOT_READY']
+                self._fail_in = self._rng.choice(codes)
+                if self._fail_in == 'PRECONDITIONS_FAIL':
+                    self._fail_in = None
+                    self._raise('PRECONDITIONS_FAIL')
+                    return
+            self._enter('WAITING_FOR_TRAY' if self.tray_enabled else 'TRAY_IN_POSITION')
+            if self.tray_enabled:
+                self.tray_target = self.tray_positions[self.trash_type]
+                self.tray_state = 'MOVING'
+        elif st == 'WAITING_FOR_TRAY':
+            if self._fail_in == 'TRAY_TIMEOUT':
+                self._fail_in = None
+                self._raise('TRAY_TIMEOUT')
+            elif now >= self._state_until:
+                self.tray_pos = self.tray_target
+                self.tray_state = 'READY'
+                self._enter('TRAY_IN_POSITION')
+        elif st == 'TRAY_IN_POSITION':
+            if self._fail_in == 'TRAY_NOT_READY':
+                self._fail_in = None
+                self._raise('TRAY_NOT_READY')
+            else:
+                self.bottle_state = MOVING_STATE
+                self._enter('MOVING_BOTTLE_TO_TRAY')
+        elif st == 'MOVING_BOTTLE_TO_TRAY':
+            if self._fail_in == 'BOTTLE_TIMEOUT':
+                self._fail_in = None
+                self._raise('BOTTLE_TIMEOUT')
+            elif now >= self._state_until:
+                hole2 = self.trash_type == 1
+                self.bottle_state = DROP_HOLE2_STATE if hole2 else DROP_HOLE1_STATE
+                self.bottle_angle = HOLE2_ANGLE if hole2 else HOLE1_ANGLE
+                self._enter('BOTTLE_IN_TRAY')
+        elif st == 'BOTTLE_IN_TRAY':
+            if now >= self._state_until:
+                self.bottle_state = MOVING_STATE
+                self._enter('MOVING_TO_IDLE')
+        elif st == 'MOVING_TO_IDLE':
+            if self._fail_in == 'BOTTLE_HOME_TIMEOUT':
+                self._fail_in = None
+                self._raise('BOTTLE_HOME_TIMEOUT')
+            elif now >= self._state_until:
+                self.bottle_state = INIT_STATE
+                self.bottle_angle = HOME_ANGLE
+                self.cycles += 1
+                self._enter('IDLE')
+        # EMO_MOOD (strict): nothing is read, only a reset helps
+
+    # Commands (only read while IDLE, like the firmware)
+    def _ack(self, cmd: str, value) -> None:
+        self.write_line(f"{cmd}::ack::{value}")
+
+    @staticmethod
+    def _parse_type(raw: str) -> Optional[int]:
+        if len(raw) == 1 and raw.isdigit():
+            v = int(raw)
+            return v if v in (0, 1, 2) else None
+        return TYPE_BY_NAME.get(raw.lower())
+
+    def handle(self, line: str) -> None:
+        if '::' not in line:
+            return
+        func, val = line.split('::', 1)
+        if func in ('start', 'mTray'):
+            t = self._parse_type(val)
+            if t is None:
+                return self._ack(func, 'ERR_BAD_TYPE')
+            if self.state != 'IDLE':
+                return self._ack(func, 'ERR_BUSY')
+            self.write_line(f">bottle{t}")
+            self.trash_type = t
+            self._enter('CONTAINS_BOTTLE')
+            self._ack(func, 'OK')
+        elif func == 'gPosBottle':
+            self._ack(func, self.bottle_state)
+        elif func == 'mPosBottle':
+            m = int(val) if val.strip().lstrip('-').isdigit() else 0
+            if m == 1:
+                hole2 = self.trash_type == 1
+                self.bottle_state = DROP_HOLE2_STATE if hole2 else DROP_HOLE1_STATE
+                self.bottle_angle = HOLE2_ANGLE if hole2 else HOLE1_ANGLE
+            elif m == 2:
+                self.bottle_state = INIT_STATE
+                self.bottle_angle = HOME_ANGLE
+            self._ack(func, self.bottle_state)
+        elif func == 'gLimitTray':
+            self._ack(func, 'PRESSED' if self.tray_pos == 0 else 'RELEASED')
+        elif func == 'gState':
+            self._ack(func, self.state)
+        elif func == 'gType':
+            self._ack(func, TYPE_NAMES[self.trash_type])
+        elif func == 'gTrayEnabled':
+            self._ack(func, 1 if self.tray_enabled else 0)
+        elif func == 'setTrayEnabled':
+            v = val.lower()
+            if v in ('1', 'on', 'true'):
+                self.tray_enabled = True
+            elif v in ('0', 'off', 'false'):
+                self.tray_enabled = False
+            else:
+                return self._ack(func, 'ERR_BAD_ARG')
+            self._ack(func, 'OK')
+        elif func == 'estop':
+            self.tray_target = self.tray_pos
+            self._raise('ESTOP')
+            self._ack(func, 'OK')
+        elif func == 'ping':
+            self._ack(func, 'pong')
+        elif func == 'recover':
+            self.tray_target = self.tray_pos
+            self.tray_state = 'READY'
+            self.bottle_state = INIT_STATE
+            self.bottle_angle = HOME_ANGLE
+            self._enter('IDLE')
+            self._ack(func, 'OK')
+        elif func == 'gLastError':
+            self._ack(func, self.last_error)
+        elif func == 'gDiagTray':
+            dtg = self.tray_target - self.tray_pos
+            speed = 0.0 if dtg == 0 else 1000.0
+            self._ack(func, f"pos={self.tray_pos},target={self.tray_target},dtg={dtg},speed={speed:.2f},state={self.tray_state}")
+        elif func == 'gDiagBottle':
+            self._ack(func, f"state={self.bottle_state}")
+        elif func == 'gBottleAngle':
+            self._ack(func, self.bottle_angle)
+        elif func == 'mBottleAngle':
+            deg = int(val) if val.strip().lstrip('-').isdigit() else -1
+            if deg < 0 or deg > 180:
+                return self._ack(func, 'ERR_RANGE')
+            self.bottle_angle = deg
+            self.bottle_state = UNKNOWN_STATE
+            self._ack(func, deg)
+        elif func == 'setTrayPos':
+            if '=' not in val or val.index('=') < 1:
+                return self._ack(func, 'ERR_BAD_ARG')
+            t_raw, steps = val.split('=', 1)
+            t = self._parse_type(t_raw)
+            if t is None:
+                return self._ack(func, 'ERR_BAD_TYPE')
+            try:
+                self.tray_positions[t] = int(steps)
+            except ValueError:
+                self.tray_positions[t] = 0  # String::toInt() semantics
+            self._ack(func, 'OK')
+        elif func == 'setBottleSpeed':
+            try:
+                self.bottle_speed_ms = int(val)
+            except ValueError:
+                self.bottle_speed_ms = 0
+            self._ack(func, 'OK')
+
+    def stats(self) -> Dict[str, int]:
+        return {'cycles': self.cycles, 'errors': self.errors}
+
+
+class PtyLink:
+    """Exposes a FirmwareSim on a pseudo terminal; `port` is the device path to open."""
+    def __init__(self, sim_factory: Callable[[Callable[[str], None]], FirmwareSim]):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._wlock = threading.Lock()
+        self.sim = sim_factory(self._write_line)
+        self._running = False
+
+    def _write_line(self, line: str) -> None:
+        data = (line + "\r\n").encode('utf-8')
+        with self._wlock:
+            os.write(self._master, data)
+
+    def start(self) -> 'PtyLink':
+        self._running = True
+        threading.Thread(target=self._read_loop, name='pty-reader', daemon=True).start()
+        self.sim.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self.sim.stop()
+
+    def _read_loop(self) -> None:
+        buf = b''
+        while self._running:
+            r, _, _ = select.select([self._master], [], [], 0.1)
+            if not r:
+                continue
+            try:
+                buf += os.read(self._master, 4096)
+            except OSError:
+                break
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                self.sim.feed(line.decode('utf-8', errors='replace').strip())
+
+
+def _sim_kwargs(args) -> Dict:
+    return dict(tray_enabled=args.tray_enabled, time_scale=args.time_scale, fail_rate=args.fail_rate, seed=args.seed,
+                strict=not args.lenient)
+
+
+def _wait_idle(arduino, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if arduino.last_state == 'IDLE' or arduino.get_state() == 'IDLE':
+            return True
+        arduino.wait_for_state(('IDLE',), timeout=min(0.5, max(0.0, deadline - time.monotonic())))
+    return False
+
+
+def _serve(args) -> int:
+    link = PtyLink(lambda w: FirmwareSim(w, **_sim_kwargs(args))).start()
+    print(f"[SIM] virtual firmware on {link.port} (TRASHCAN_SERIAL_PORT={link.port}), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[SIM] {json.dumps(link.sim.stats())}")
+    except KeyboardInterrupt:
+        pass
+    link.stop()
+    return 0
+
+
+def _load(args) -> int:
+    from arduino import Arduino, run_automatic_cycle
+    link = None
+    ok = failed = 0
+    durations: List[float] = []
+    if args.api:
+        # the daemon owns the serial link (run `serve` and point TRASHCAN_SERIAL_PORT at it)
+        import requests
+        t_start = time.perf_counter()
+        for i in range(args.cycles):
+            t0 = time.perf_counter()
+            r = requests.post(args.api + '/api/control/start', json={'type': i % 3}, timeout=5)
+            done = r.ok and r.json().get('ack')
+            while done:
+                st = requests.get(args.api + '/api/state', timeout=5).json().get('state')
+                if st in ('IDLE', 'EMO_MOOD'):
+                    done = st == 'IDLE'
+                    break
+                time.sleep(0.005)
+            if done:
+                ok += 1
+            else:
+                failed += 1
+                requests.post(args.api + '/api/control/recover', json={}, timeout=5)
+            durations.append(time.perf_counter() - t0)
+        serial_stats = None
+    else:
+        link = PtyLink(lambda w: FirmwareSim(w, **_sim_kwargs(args))).start()
+        arduino = Arduino(link.port, baud=9600, timeout=0.1)
+        # the boot IDLE event may be written before the reader is attached: ask for the state
+        if not _wait_idle(arduino, 10.0):
+            print("[SIM] firmware did not reach IDLE", file=sys.stderr)
+            arduino.close()
+            link.stop()
+            return 1
+        t_start = time.perf_counter()
+        for i in range(args.cycles):
+            t0 = time.perf_counter()
+            if run_automatic_cycle(arduino, i % 3, timeout_s=args.cycle_timeout):
+                ok += 1
+            else:
+                failed += 1
+                # main.cpp never reads recover in EMO_MOOD: press reset like an operator would
+                if link.sim.strict:
+                    link.sim.reset()
+                else:
+                    arduino.recover()
+                if not _wait_idle(arduino, args.cycle_timeout):
+                    print(f"[SIM] firmware stuck after cycle {i}", file=sys.stderr)
+            durations.append(time.perf_counter() - t0)
+        serial_stats = arduino.transport.stats()
+        arduino.close()
+    wall = time.perf_counter() - t_start
+    if link is not None:
+        link.stop()
+    durations.sort()
+    report = {
+        'cycles': args.cycles, 'ok': ok, 'failed': failed, 'wall_s': wall,
+        'cycles_per_min': args.cycles / wall * 60.0 if wall > 0 else None,
+        'cycle_ms': {
+            'p50': durations[len(durations) // 2] * 1000.0 if durations else None,
+            'p99': durations[int(len(durations) * 0.99) - 1] * 1000.0 if durations else None,
+            'max': durations[-1] * 1000.0 if durations else None,
+        },
+        'firmware': link.sim.stats() if link is not None else None,
+        'serial': serial_stats,
+    }
+    if args.out in (None, '-'):
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if failed == 0 or args.fail_rate > 0 else 1
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description='Virtual trashcan firmware on a pty')
+    sub = ap.add_subparsers(dest='mode', required=True)
+    for name in ('serve', 'load'):
+        p = sub.add_parser(name)
+        p.add_argument('--tray-enabled', action='store_true')
+        p.add_argument('--time-scale', type=float, default=1.0, help='multiplier for all motion delays')
+        p.add_argument('--fail-rate', type=float, default=0.0, help='probability of an injected cycle error')
+        p.add_argument('--seed', type=int, default=None)
+        p.add_argument('--lenient', action='store_true',
+                       help='also read commands in EMO_MOOD (main.cpp only reads them in IDLE)')
+        if name == 'load':
+            p.add_argument('--cycles', type=int, default=100)
+            p.add_argument('--cycle-timeout', type=float, default=45.0)
+            p.add_argument('--api', default=None, help='daemon base URL; cycles are started over HTTP')
+            p.add_argument('--out', default=None, help='write the JSON report to this file instead of stdout')
+    args = ap.parse_args(argv)
+    return _serve(args) if args.mode == 'serve' else _load(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Startup sequencer: init phases run side by side, per-phase timings, readiness.
+
+The daemon has independent slow steps (model load, opening the audio
+device, serial handshake and configuration, importing the web stack).
+Startup.run() starts each as a named phase on its own thread, optionally
+after other phases; ready() is called once every bin is listening and
+reports the breakdown to the log, /api/startup, the metrics and systemd
+(READY=1 over $NOTIFY_SOCKET for Type=notify units).
+"""
+import concurrent.futures
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import logs
+import metrics
+
+log = logs.get('START')
+
+
+def sd_notify(state: str) -> bool:
+    """Send state lines (e.g. 'READY=1', 'STATUS=...') to systemd; no-op without NOTIFY_SOCKET."""
+    addr = os.environ.get('NOTIFY_SOCKET')
+    if not addr:
+        return False
+    if addr[0] == '@':  # abstract namespace
+        addr = '\0' + addr[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+            s.connect(addr)
+            s.sendall(state.encode())
+        return True
+    except OSError as e:
+        log.warning(f"sd_notify failed: {e}")
+        return False
+
+
+class Startup:
+    """Named startup phases with start/end times relative to t0 (process start)."""
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = time.monotonic() if t0 is None else t0
+        self.phases: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.ready_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: float, ok: bool = True, error: Optional[str] = None) -> None:
+        """A phase measured elsewhere (e.g. module imports before main())."""
+        with self._lock:
+            self.phases[name] = {'start': start, 'end': end, 'ok': ok, 'error': error}
+        metrics.STARTUP_PHASE.labels(name).set(end - start)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Dict[str, Any]]:
+        """with startup.phase('model'): ... in the calling thread."""
+        rec: Dict[str, Any] = {'start': time.monotonic(), 'end': None, 'ok': None, 'error': None}
+        with self._lock:
+            self.phases[name] = rec
+        sd_notify(f"STATUS=starting: {name}")
+        try:
+            yield rec
+            rec['ok'] = True
+        except Exception as e:
+            rec['ok'], rec['error'] = False, f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            rec['end'] = time.monotonic()
+            metrics.STARTUP_PHASE.labels(name).set(rec['end'] - rec['start'])
+            status = 'done' if rec['ok'] else f"failed ({rec['error']})"
+            log.log(logging.INFO if rec['ok'] else logging.ERROR, f"{name} {status} in {rec['end'] - rec['start']:.2f}s",
+                    phase=name, duration_s=round(rec['end'] - rec['start'], 3))
+
+    def run(self, name: str, fn: Callable[..., Any], *args: Any,
+            after: Sequence[concurrent.futures.Future] = ()) -> concurrent.futures.Future:
+        """Run fn(*args) as a phase on its own thread once the `after` phases have ended."""
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+
+        def _target():
+            concurrent.futures.wait(after)
+            try:
+                with self.phase(name):
+                    result = fn(*args)
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+        threading.Thread(target=_target, name=f'start-{name}', daemon=True).start()
+        return fut
+
+    def failed(self) -> List[str]:
+        with self._lock:
+            return [n for n, p in self.phases.items() if p['ok'] is False]
+
+    def ready(self) -> None:
+        """Every bin is listening: log the breakdown and tell systemd."""
+        self.ready_at = time.monotonic()
+        total = self.ready_at - self.t0
+        metrics.STARTUP_PHASE.labels('ready').set(total)
+        with self._lock:
+            parts = ' '.join(f"{n}={p['end'] - p['start']:.2f}s" for n, p in self.phases.items() if p['end'])
+        failed = self.failed()
+        note = f", degraded: {', '.join(failed)}" if failed else ''
+        log.info(f"ready after {total:.2f}s ({parts}){note}", ready_s=round(total, 3), failed=failed)
+        sd_notify(f"READY=1\nSTATUS=listening, ready after {total:.1f}s{note}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = [{
+                'name': n,
+                'start_s': round(p['start'] - self.t0, 3),
+                'end_s': round(p['end'] - self.t0, 3) if p['end'] else None,
+                'duration_s': round(p['end'] - p['start'], 3) if p['end'] else None,
+                'ok': p['ok'],
+                'error': p['error'],
+            } for n, p in self.phases.items()]
+        return {
+            'ready': self.ready_at is not None,
+            'ready_s': round(self.ready_at - self.t0, 3) if self.ready_at else None,
+            'phases': phases,
+        }
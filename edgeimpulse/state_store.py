@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import logs
+
+log = logs.get('STATE')
+
+
+class StateStore:
+    """Thread-safe in-process store for the latest state/result snapshots.
+
+    Each topic ('state', 'result', ...) holds one dict snapshot. Every update
+    bumps a store-wide version that is stamped into the snapshot, so clients
+    can ask for everything newer than the version they last saw. Writers
+    (serial reader, classifier) never touch the disk: with persist_dir set, a
+    write-behind thread flushes changed topics to their JSON file
+    (last_state.json, last_result.json) at most every persist_interval_s via
+    atomic rename, so external tools still find them without one SD card
+    write per event.
+    """
+    def __init__(self, persist_dir: Optional[str] = None, persist_interval_s: float = 1.0,
+                 files: Optional[Dict[str, str]] = None):
+        self.version = 0
+        self._topics: Dict[str, Dict[str, Any]] = {}
+        self._cv = threading.Condition()
+        self._subscribers: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.persist_dir = persist_dir
+        self.persist_interval_s = float(persist_interval_s)
+        self.files = dict(files or {'state': 'last_state.json', 'result': 'last_result.json'})
+        self._dirty: set = set()
+        self.persist_writes = 0
+        self.persist_errors = 0
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if self.persist_dir and self.persist_interval_s > 0:
+            self._writer = threading.Thread(target=self._persist_loop, name='state-writer', daemon=True)
+            self._writer.start()
+
+    @classmethod
+    def from_env(cls, env, persist_dir: Optional[str] = None) -> 'StateStore':
+        interval = float(env.get('STATE_PERSIST_INTERVAL_S', '1.0'))
+        return cls(persist_dir if interval > 0 else None, interval)
+
+    def close(self) -> None:
+        """Stop the write-behind thread after a final flush."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join(timeout=2.0)
+        self.flush()
+
+    # Writers
+    def update(self, topic: str, data: Dict[str, Any], merge: bool = False) -> Dict[str, Any]:
+        """Replace (or with merge=True update) a topic; returns the new snapshot."""
+        with self._cv:
+            base = dict(self._topics.get(topic, {})) if merge else {}
+            base.update(data)
+            self.version += 1
+            base['version'] = self.version
+            base['ts'] = data.get('ts', time.time())
+            self._topics[topic] = base
+            self._dirty.add(topic)
+            self._cv.notify_all()
+            subscribers = list(self._subscribers)
+        for cb in subscribers:
+            try:
+                cb(topic, base)
+            except Exception as e:
+                log.error(f"subscriber error: {e}", topic=topic)
+        return base
+
+    # Readers
+    def get(self, topic: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        with self._cv:
+            snap = self._topics.get(topic)
+            return dict(snap) if snap is not None else default
+
+    def snapshot(self, since: int = 0, topics: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """All topics (or the given ones) changed after version since."""
+        wanted = set(topics) if topics else None
+        with self._cv:
+            return {t: dict(s) for t, s in self._topics.items()
+                    if s['version'] > since and (wanted is None or t in wanted)}
+
+    def wait(self, since: int, timeout: float) -> int:
+        """Block until the store version exceeds since; returns the current version."""
+        deadline = time.monotonic() + timeout
+        with self._cv:
+            while self.version <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cv.wait(remaining)
+            return self.version
+
+    def subscribe(self, callback: Callable[[str, Dict[str, Any]], None]) -> Callable[[], None]:
+        """Call callback(topic, snapshot) on every update (in the writer's thread).
+
+        Returns a function that removes the subscription.
+        """
+        with self._cv:
+            self._subscribers.append(callback)
+
+        def _unsubscribe() -> None:
+            with self._cv:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return _unsubscribe
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cv:
+            return {
+                'version': self.version,
+                'topics': {t: s['version'] for t, s in self._topics.items()},
+                'subscribers': len(self._subscribers),
+                'persist_dir': self.persist_dir,
+                'persist_writes': self.persist_writes,
+                'persist_errors': self.persist_errors,
+            }
+
+    # Write-behind persistence
+    def _persist_loop(self) -> None:
+        while not self._stop.wait(self.persist_interval_s):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.persist_dir:
+            return
+        with self._cv:
+            dirty = [(t, dict(self._topics[t])) for t in self._dirty if t in self.files]
+            self._dirty.clear()
+        for topic, snap in dirty:
+            path = os.path.join(self.persist_dir, self.files[topic])
+            try:
+                tmp = path + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(snap, f)
+                os.replace(tmp, path)
+                self.persist_writes += 1
+            except Exception as e:
+                self.persist_errors += 1
+                log.error(f"persist {topic} failed: {e}", topic=topic)
+
+
+class AsyncSubscription:
+    """Bridges store updates into an asyncio loop for SSE/WebSocket clients.
+
+    Only the newest snapshot per topic is kept, so a slow client skips
+    intermediate versions instead of growing a queue.
+    """
+    def __init__(self, store: StateStore, loop: asyncio.AbstractEventLoop,
+                 topics: Optional[Iterable[str]] = None):
+        self.store = store
+        self.topics = set(topics) if topics else None
+        self._loop = loop
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._event = asyncio.Event()
+        self._unsubscribe = store.subscribe(self._on_update)
+
+    def _on_update(self, topic: str, snap: Dict[str, Any]) -> None:
+        if self.topics is not None and topic not in self.topics:
+            return
+        with self._lock:
+            self._pending[topic] = snap
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def next(self, timeout: float) -> Dict[str, Dict[str, Any]]:
+        """Pending snapshots by topic; empty after timeout (time for a keep-alive)."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._event.clear()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def close(self) -> None:
+        self._unsubscribe()
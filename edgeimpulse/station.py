@@ -0,0 +1,227 @@
+import concurrent.futures
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from archive import SegmentArchive
+from classifier import ClassificationService
+from config_sync import ConfigSync, current_env
+from decision import DecisionEngine
+from pipeline import Pipeline
+from render import SegmentRenderer
+from state_store import StateStore
+from streaming import CLASSIFY_MODES, StreamingClassifier
+from tracing import Tracer
+
+_BIN_NAME = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+def bin_names(env) -> List[str]:
+    """Bins from BINS (e.g. 'left,right'); a single bin 'main' if unset."""
+    names = [n.strip() for n in env.get('BINS', '').split(',') if n.strip()]
+    for n in names:
+        if not _BIN_NAME.match(n):
+            raise ValueError(f"Invalid bin name '{n}' (letters, digits, _)")
+    if len(set(n.lower() for n in names)) != len(names):
+        raise ValueError(f"Duplicate bin name in BINS={env.get('BINS')}")
+    return names or ['main']
+
+
+def bin_env(env, name: str) -> Dict[str, str]:
+    """The environment as seen by one bin: BIN_<NAME>_<KEY> overrides <KEY>.
+
+    e.g. BIN_LEFT_TRASHCAN_SERIAL_PORT=/dev/ttyACM1 or BIN_LEFT_AUDIO_RMS_THRESHOLD=900.
+    """
+    prefix = f"BIN_{name.upper()}_"
+    out = dict(env)
+    for k, v in env.items():
+        if k.startswith(prefix) and len(k) > len(prefix):
+            out[k[len(prefix):]] = v
+    return out
+
+
+class FairInference:
+    """One loaded inference backend shared by the classify workers of several bins.
+
+    Every bin gets a client whose classify() queues the window under the
+    bin's name and waits for the result. A single worker serves the bins
+    round-robin, one window per bin and turn, so a bin with a burst of
+    triggers (or many shifted windows) cannot starve the others, and the
+    backend only ever sees one call at a time.
+    """
+    def __init__(self, runner):
+        self.runner = runner
+        self.name = getattr(runner, 'name', 'runner')
+        self._queues: 'OrderedDict[str, deque]' = OrderedDict()
+        self._cv = threading.Condition()
+        self._turn = 0
+        self.served: Dict[str, int] = {}
+        self.wait_ms_max: Dict[str, float] = {}
+        self._thread = threading.Thread(target=self._loop, name='inference-scheduler', daemon=True)
+        self._thread.start()
+
+    def client(self, bin_name: str) -> 'InferenceClient':
+        with self._cv:
+            self._queues.setdefault(bin_name, deque())
+            self.served.setdefault(bin_name, 0)
+            self.wait_ms_max.setdefault(bin_name, 0.0)
+        return InferenceClient(self, bin_name)
+
+    def submit(self, bin_name: str, window: np.ndarray) -> concurrent.futures.Future:
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        with self._cv:
+            self._queues[bin_name].append((time.monotonic(), window, fut))
+            self._cv.notify()
+        return fut
+
+    def _next(self):
+        """Oldest window of the next bin (in rotation) that has one, else None."""
+        names = list(self._queues)
+        for i in range(len(names)):
+            name = names[(self._turn + i) % len(names)]
+            q = self._queues[name]
+            if q:
+                self._turn = (self._turn + i + 1) % len(names)
+                return name, q.popleft()
+        return None
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                item = self._next()
+                while item is None:
+                    self._cv.wait()
+                    item = self._next()
+            name, (t_queued, window, fut) = item
+            wait_ms = (time.monotonic() - t_queued) * 1000.0
+            try:
+                result = self.runner.classify(window)
+            except Exception as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+            with self._cv:
+                self.served[name] += 1
+                if wait_ms > self.wait_ms_max[name]:
+                    self.wait_ms_max[name] = wait_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cv:
+            return {
+                'backend': self.name,
+                'bins': {n: {'queued': len(q), 'served': self.served[n], 'wait_ms_max': self.wait_ms_max[n]}
+                         for n, q in self._queues.items()},
+            }
+
+
+class InferenceClient:
+    """Runner stand-in handed to one bin's ClassificationService."""
+    def __init__(self, pool: FairInference, bin_name: str):
+        self.pool = pool
+        self.bin_name = bin_name
+        self.name = pool.name
+
+    def classify(self, window: np.ndarray) -> Dict[str, Any]:
+        # the window is a view into the request's audio; the caller waits, so no copy is needed
+        return self.pool.submit(self.bin_name, window).result()
+
+
+class Bin:
+    """One trashcan of the station: microphone, serial port and their pipeline.
+
+    Each bin has its own queues, trigger/classifier state, state store, archive,
+    traces and cycle lock, configured from its view of the environment (see
+    bin_env). The model is shared through the station.
+    """
+    def __init__(self, name: str, env: Dict[str, str], data_dir: str):
+        self.name = name
+        self.env = env
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.serial_port: Optional[str] = env.get('TRASHCAN_SERIAL_PORT') or None
+        dev = env.get('AUDIO_DEVICE_ID')
+        self.device_id: Optional[int] = int(dev) if (dev and dev.isdigit()) else None
+        # Bounded queues between capture, trigger, classification and actuator
+        self.pipeline = Pipeline.from_env(env)
+        # Coalesces triggers and runs (shifted) windows through the runner once it is loaded
+        self.classifier = ClassificationService.from_env(env)
+        # Thresholds/margin/agreement per class, held scores of the last uncertain trigger
+        self.decisions = DecisionEngine.from_env(env, data_dir)
+        # Firmware settings: desired (.env, API) vs. what the board holds, pushed as a diff
+        self.config = ConfigSync.from_env(env, source=lambda: bin_env(current_env(), name))
+        # Trigger path, sliding windows or both (the stream then runs alongside for comparison)
+        self.classify_mode = env.get('CLASSIFY_MODE', 'trigger').strip().lower()
+        if self.classify_mode not in CLASSIFY_MODES:
+            raise ValueError(f"Invalid CLASSIFY_MODE '{self.classify_mode}' ({'|'.join(CLASSIFY_MODES)})")
+        self.stream = StreamingClassifier.from_env(env, self.decisions) if self.classify_mode != 'trigger' else None
+        # Latest state/result shared by serial reader, classifier and API (files written behind)
+        self.store = StateStore.from_env(env, data_dir)
+        # Last segment for the dashboard: WAV written by a worker, PNGs rendered on request
+        self.renderer = SegmentRenderer(out_dir=data_dir) if env.get('VISUALIZE', '1') == '1' else None
+        # Every classified segment with its result and cycle outcome (written by a background thread)
+        self.archive = SegmentArchive.from_env(env, data_dir)
+        # Per-trigger latency traces (ring of the most recent ones, see /api/traces)
+        self.tracer = Tracer.from_env(env)
+        # One mechanical cycle at a time, whether started by a bottle or an API job
+        self.cycle_lock = threading.Lock()
+        self.listening = threading.Event()  # set once its input stream runs
+        self.arduino = None  # arduino.Arduino once connected
+        self.jobs = None     # jobs.JobQueue once connected
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'serial_port': self.serial_port,
+            'connected': self.arduino is not None,
+            'listening': self.listening.is_set(),
+            'audio_device': self.device_id,
+            'data_dir': self.data_dir,
+            'triggers': self.pipeline.triggers,
+            'classify_mode': self.classify_mode,
+            'state': self.store.get('state'),
+            'result': self.store.get('result'),
+            'config_in_sync': not self.config.diff(),
+        }
+
+
+class Station:
+    """All bins served by this daemon process, sharing one inference backend.
+
+    Without BINS the station has a single bin 'main' that uses the plain
+    environment and keeps its files in the daemon directory as before; with
+    BINS every bin keeps them under bins/<name>/.
+    """
+    def __init__(self, env, base_dir: str):
+        names = bin_names(env)
+        legacy = not env.get('BINS')
+        self.bins: 'OrderedDict[str, Bin]' = OrderedDict(
+            (n, Bin(n, bin_env(env, n), base_dir if legacy else os.path.join(base_dir, 'bins', n)))
+            for n in names)
+        self.inference: Optional[FairInference] = None
+        self.pool = None  # inference_pool.InferencePool when INFERENCE_WORKERS > 1
+
+    @property
+    def default(self) -> Bin:
+        """The first bin; also served under the plain /api/... paths."""
+        return next(iter(self.bins.values()))
+
+    def bind(self, runner) -> Dict[str, Any]:
+        """Per-bin runner: the backend itself for one bin or a pool, fair-scheduled clients otherwise."""
+        if len(self.bins) == 1 or getattr(runner, 'workers', 1) > 1:
+            # one bin, or an inference pool that already runs windows side by side
+            self.pool = runner if getattr(runner, 'workers', 1) > 1 else None
+            return {n: runner for n in self.bins}
+        self.inference = FairInference(runner)
+        return {n: self.inference.client(n) for n in self.bins}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'bins': [b.stats() for b in self.bins.values()],
+            'inference': self.inference.stats() if self.inference is not None else None,
+            'pool': self.pool.stats() if self.pool is not None else None,
+        }
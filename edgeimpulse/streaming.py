@@ -0,0 +1,281 @@
+"""Streaming classification: overlapping windows every hop, decision once confidence holds.
+
+The trigger path classifies one onset-aligned window after the full
+POST_MS post-roll, so a decision takes at least 0.8 s plus inference. In
+streaming mode (CLASSIFY_MODE=stream|both) the newest window is classified
+every STREAM_HOP_MS straight from the detector's ring buffer, and a cycle
+is decided as soon as STREAM_SUSTAIN consecutive hops are confident about
+the same label (the decision engine's thresholds and margin, per hop).
+
+Window starts lie on the log-mel frame grid, so with a backend that takes
+features (numpy) only the frames a hop adds are computed (features.FrameCache);
+other backends get the raw window.
+
+With CLASSIFY_MODE=both the trigger path still drives the mechanics and the
+stream runs alongside it; DecisionComparison pairs both decisions per onset
+(label agreement, onset-to-decision latency). replay.py does the same offline.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from arduino import TYPE_NAME_BY_ID, label_type
+from decision import DecisionEngine
+from features import FrameCache
+
+CLASSIFY_MODES = ('trigger', 'stream', 'both')
+
+
+class StreamWindow:
+    """One hop: the newest complete window of the stream."""
+    def __init__(self, audio: np.ndarray, start_index: int, onset_index: Optional[int] = None):
+        self.audio = audio                # int16 copy, window_samples long
+        self.start_index = start_index    # absolute sample index of audio[0]
+        self.end_index = start_index + audio.size
+        self.onset_index = onset_index    # newest trigger onset inside the window, if any
+        self.t_ready = time.monotonic()
+
+
+class DecisionComparison:
+    """Trigger-path and stream decisions paired by onset: label agreement and latency.
+
+    Latency is onset-to-decision: recorded audio after the onset (post-roll
+    or the rest of the stream window) plus queue wait and inference.
+    """
+    PATHS = ('trigger', 'stream')
+
+    def __init__(self, history: int = 200):
+        self.history = int(history)
+        self._pairs: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.unpaired_stream = 0  # stream decisions without a trigger onset in their window
+
+    def add(self, path: str, onset_index: Optional[int], type_name: Optional[str], latency_ms: float) -> None:
+        if onset_index is None:
+            if path == 'stream':
+                self.unpaired_stream += 1
+            return
+        with self._lock:
+            pair = self._pairs.setdefault(int(onset_index), {})
+            if path in pair:  # first decision per onset and path counts
+                return
+            pair[path] = {'type_name': type_name, 'latency_ms': round(float(latency_ms), 1)}
+            while len(self._pairs) > self.history:
+                self._pairs.popitem(last=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pairs.clear()
+        self.unpaired_stream = 0
+
+    def stats(self, recent: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            pairs = [(k, dict(v)) for k, v in self._pairs.items()]
+        both = [p for _, p in pairs if all(path in p for path in self.PATHS)]
+        out: Dict[str, Any] = {
+            'onsets': len(pairs),
+            'paired': len(both),
+            'agree': sum(p['trigger']['type_name'] == p['stream']['type_name'] for p in both),
+            'trigger_only': sum('stream' not in p for _, p in pairs),
+            'stream_only': sum('trigger' not in p for _, p in pairs),
+            'unpaired_stream': self.unpaired_stream,
+        }
+        for path in self.PATHS:
+            lat = sorted(p[path]['latency_ms'] for _, p in pairs if path in p and p[path]['type_name'])
+            out[f'{path}_latency_ms'] = {
+                'count': len(lat),
+                'p50': lat[len(lat) // 2] if lat else None,
+                'max': lat[-1] if lat else None,
+            }
+        out['recent'] = [{'onset_index': k, **p} for k, p in pairs[-recent:]] if recent > 0 else []
+        return out
+
+
+class StreamingClassifier:
+    """Sliding-window classification of one bin's stream with sustained-confidence decisions.
+
+    pop_ready()/note_onset() are called by the trigger loop, classify()/
+    decide() by the stream worker (one at a time); stats() from any thread.
+    """
+    def __init__(self, hop_ms: float = 250.0, sustain: int = 2, holdoff_s: float = 2.0,
+                 decisions: Optional[DecisionEngine] = None, latency_window: int = 500):
+        if hop_ms <= 0:
+            raise ValueError(f"Invalid STREAM_HOP_MS {hop_ms} (> 0)")
+        if sustain < 1:
+            raise ValueError(f"Invalid STREAM_SUSTAIN {sustain} (>= 1)")
+        self.hop_ms = float(hop_ms)
+        self.sustain = int(sustain)
+        self.holdoff_s = float(holdoff_s)
+        self.decisions = decisions if decisions is not None else DecisionEngine()
+        self.compare = DecisionComparison()
+        self.runner = None
+        self.sample_rate = 16000
+        self.window_samples = 16000
+        self.hop_samples = 4000
+        self.frames: Optional[FrameCache] = None
+        self._onsets: deque = deque(maxlen=16)
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.reset()
+        self.hops = 0
+        self.skipped = 0
+        self.decided = 0
+        self.hop_outcomes: Dict[str, int] = {'accept': 0, 'uncertain': 0, 'reject': 0}
+        self.last_decision: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_env(cls, env, decisions: Optional[DecisionEngine] = None) -> 'StreamingClassifier':
+        return cls(
+            hop_ms=float(env.get('STREAM_HOP_MS', '250')),
+            sustain=int(env.get('STREAM_SUSTAIN', '2')),
+            holdoff_s=float(env.get('STREAM_HOLDOFF_S', '2')),
+            decisions=decisions,
+        )
+
+    def bind(self, runner, sample_rate: int, window_samples: int) -> None:
+        """Attach the runner; the hop is rounded to whole log-mel frames if it takes features."""
+        self.runner = runner
+        self.sample_rate = int(sample_rate)
+        self.window_samples = int(window_samples)
+        bands = getattr(runner, 'features', None)
+        if bands is not None and hasattr(runner, 'classify_features') and bands.sample_rate == self.sample_rate:
+            self.frames = FrameCache(bands, max_frames=2 * (self.window_samples // bands.frame + 1))
+            frame = bands.frame
+        else:
+            self.frames = None
+            frame = 1
+        hop = int(round(self.sample_rate * self.hop_ms / 1000.0 / frame)) * frame
+        self.hop_samples = max(frame, hop)
+        self.reset()
+
+    @property
+    def effective_hop_ms(self) -> float:
+        return self.hop_samples * 1000.0 / self.sample_rate
+
+    def reset(self) -> None:
+        """New stream (sample indices restart): forget windows, onsets and the streak."""
+        self._next_start = 0
+        self._onsets.clear()
+        self._streak_label: Optional[str] = None
+        self._streak: List[float] = []
+        self._armed = True
+        self._last_emit: Optional[int] = None
+        if self.frames is not None:
+            self.frames.clear()
+
+    # Trigger loop side
+    def note_onset(self, onset_index: int) -> None:
+        self._onsets.append(int(onset_index))
+
+    def pop_ready(self, ring) -> Optional[StreamWindow]:
+        """The next hop's window once it is recorded (copied out of the ring), else None."""
+        total = ring.total_written
+        if total - self._next_start < self.window_samples:
+            return None
+        # behind by more than a hop (e.g. after a stall): jump to the newest complete window
+        newest = (total - self.window_samples) // self.hop_samples * self.hop_samples
+        if newest > self._next_start:
+            self.skipped += (newest - self._next_start) // self.hop_samples
+            self._next_start = newest
+        start = self._next_start
+        self._next_start += self.hop_samples
+        audio = ring.window(start, self.window_samples).copy()
+        end = start + self.window_samples
+        onset = next((o for o in reversed(self._onsets) if start <= o < end), None)
+        return StreamWindow(audio, start, onset)
+
+    # Worker side
+    def classify(self, win: StreamWindow) -> Dict[str, Any]:
+        """Scores of one window; features of frames seen by earlier hops are reused."""
+        if self.runner is None:
+            raise RuntimeError("streaming runner not bound")
+        t0 = time.monotonic()
+        if self.frames is not None:
+            res = self.runner.classify_features(self.frames.window(win.audio, win.start_index))
+        else:
+            res = self.runner.classify(win.audio)
+        t1 = time.monotonic()
+        dt = (t1 - t0) * 1000.0
+        with self._lock:
+            self._latencies.append(dt)
+        self.hops += 1
+        scores = res.get('result', {}).get('classification', {})
+        top_label = max(scores, key=scores.get) if scores else None
+        return {
+            'scores': scores,
+            'top_label': top_label,
+            'top_score': scores.get(top_label, 0.0) if top_label else 0.0,
+            'latency_ms': dt,
+            'wait_ms': (t0 - win.t_ready) * 1000.0,
+        }
+
+    def decide(self, result: Dict[str, Any], win: StreamWindow) -> Optional[Dict[str, Any]]:
+        """A decision once STREAM_SUSTAIN consecutive hops accept the same label, else None.
+
+        After a decision the stream stays quiet until a hop is no longer
+        confident (the sound is over) and STREAM_HOLDOFF_S has passed.
+        """
+        outcome, reason, label, score, margin, _ = self.decisions.evaluate(result['scores'])
+        with self._lock:
+            self.hop_outcomes[outcome] += 1
+        if outcome != 'accept':
+            self._streak_label, self._streak = None, []
+            self._armed = True
+            return None
+        if label != self._streak_label:
+            self._streak_label, self._streak = label, []
+        self._streak.append(score)
+        holdoff = int(self.holdoff_s * self.sample_rate)
+        if not self._armed or len(self._streak) < self.sustain or \
+                (self._last_emit is not None and win.end_index - self._last_emit < holdoff):
+            return None
+        self._armed = False
+        self._last_emit = win.end_index
+        type_id = label_type(label)
+        audio_ms = (win.end_index - win.onset_index) * 1000.0 / self.sample_rate if win.onset_index is not None else None
+        decision = {
+            'outcome': 'accept',
+            'reason': 'sustained',
+            'label': label,
+            'score': float(np.mean(self._streak[-self.sustain:])),
+            'margin': margin,
+            'hops': len(self._streak),
+            'type_id': type_id,
+            'type_name': TYPE_NAME_BY_ID.get(type_id),
+            'start_index': win.start_index,
+            'end_index': win.end_index,
+            'onset_index': win.onset_index,
+            # recorded audio after the onset + queue wait + inference of the deciding hop
+            'latency_ms': (audio_ms + result['wait_ms'] + result['latency_ms']) if audio_ms is not None else None,
+            'ts': time.time(),
+        }
+        self.decided += 1
+        self.last_decision = decision
+        self.compare.add('stream', win.onset_index, decision['type_name'], decision['latency_ms'] or 0.0)
+        return decision
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self._latencies)
+            hop_outcomes = dict(self.hop_outcomes)
+
+        def pct(p: float) -> Optional[float]:
+            return lat[min(len(lat) - 1, int(p * len(lat)))] if lat else None
+        return {
+            'hop_ms': self.effective_hop_ms,
+            'window_ms': self.window_samples * 1000.0 / self.sample_rate,
+            'sustain': self.sustain,
+            'holdoff_s': self.holdoff_s,
+            'hops': self.hops,
+            'skipped': self.skipped,
+            'hop_outcomes': hop_outcomes,
+            'decided': self.decided,
+            'last_decision': self.last_decision,
+            'features': {'computed': self.frames.computed, 'reused': self.frames.reused}
+                        if self.frames is not None else None,
+            'latency_ms': {'p50': pct(0.5), 'p95': pct(0.95), 'max': lat[-1] if lat else None, 'count': len(lat)},
+            'compare': self.compare.stats(),
+        }
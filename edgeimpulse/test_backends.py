@@ -0,0 +1,79 @@
+"""Backends shared by the classify and stream workers (CLASSIFY_MODE=both).
+
+    python -m pytest edgeimpulse/test_backends.py
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from backends import EdgeImpulseBackend  # noqa: E402
+from classifier import ClassificationRequest, ClassificationService  # noqa: E402
+from streaming import StreamWindow, StreamingClassifier  # noqa: E402
+
+
+class OverlapRunner:
+    """AudioImpulseRunner stand-in that records calls overlapping each other."""
+    def __init__(self, latency_s: float = 0.002):
+        self.latency_s = latency_s
+        self.active = 0
+        self.overlaps = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def classify(self, segment):
+        with self._lock:
+            self.active += 1
+            self.calls += 1
+            if self.active > 1:
+                self.overlaps += 1
+        time.sleep(self.latency_s)
+        with self._lock:
+            self.active -= 1
+        return {'result': {'classification': {'can': 0.1, 'glas': 0.1, 'plastic': 0.8}}, 'timing': {}}
+
+    def stop(self):
+        pass
+
+
+def test_eim_backend_serializes_classify_and_stream_workers():
+    sr = 16000
+    runner = OverlapRunner()
+    backend = EdgeImpulseBackend('model.eim')
+    backend._runner = runner  # init() would start the .eim process
+    classifier = ClassificationService()
+    classifier.bind(backend, sr)
+    streamer = StreamingClassifier()
+    streamer.bind(backend, sr, classifier.window_samples)
+    n = 40
+    errors = []
+
+    def classify_worker():
+        try:
+            for i in range(n):
+                req = ClassificationRequest(np.zeros(classifier.span_samples, dtype=np.int16),
+                                            classifier.span_before, i * sr)
+                classifier.classify(req)
+        except Exception as e:  # pragma: no cover - surfaced by the assert below
+            errors.append(e)
+
+    def stream_worker():
+        try:
+            for i in range(n):
+                streamer.classify(StreamWindow(np.zeros(classifier.window_samples, dtype=np.int16),
+                                               i * streamer.hop_samples))
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=classify_worker), threading.Thread(target=stream_worker)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30.0)
+    assert not errors
+    assert runner.calls == 2 * n
+    assert runner.overlaps == 0
@@ -0,0 +1,173 @@
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class Trace:
+    """Timeline of one trigger, from acoustic onset to the end of its cycle.
+
+    Spans and instant marks carry time.monotonic() timestamps and the name
+    of the recording thread; they are appended from the trigger loop, the
+    classify/actuator workers and the serial reader without a lock (list
+    appends are atomic).
+    """
+    def __init__(self, trace_id: int, name: str, t0: Optional[float] = None, **args: Any):
+        self.id = trace_id
+        self.name = name
+        self.t0 = time.monotonic() if t0 is None else t0
+        self.ts = time.time() - (time.monotonic() - self.t0)
+        self.args: Dict[str, Any] = dict(args)
+        self.events: List[Dict[str, Any]] = []
+        self.status = 'open'
+        self.t_end: Optional[float] = None
+
+    def add(self, name: str, start: float, end: float, **args: Any) -> None:
+        """Record a span between two monotonic timestamps."""
+        self.events.append({'name': name, 'start': start, 'end': end,
+                            'thread': threading.current_thread().name, 'args': args})
+
+    def mark(self, name: str, t: Optional[float] = None, **args: Any) -> None:
+        """Record an instant (e.g. a firmware state transition)."""
+        t = time.monotonic() if t is None else t
+        self.events.append({'name': name, 'start': t, 'end': None,
+                            'thread': threading.current_thread().name, 'args': args})
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+        """with trace.span('classify') as a: ... (a is merged into the span args)."""
+        t0 = time.monotonic()
+        try:
+            yield args
+        finally:
+            self.add(name, t0, time.monotonic(), **args)
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-span durations and mark offsets in ms relative to the onset."""
+        spans: Dict[str, float] = {}
+        marks: List[Dict[str, Any]] = []
+        for e in list(self.events):
+            if e['end'] is None:
+                marks.append({'name': e['name'], 'ms': round((e['start'] - self.t0) * 1000.0, 1)})
+            else:
+                spans[e['name']] = round(spans.get(e['name'], 0.0) + (e['end'] - e['start']) * 1000.0, 1)
+        end = self.t_end if self.t_end is not None else time.monotonic()
+        return {
+            'id': self.id, 'name': self.name, 'ts': self.ts, 'status': self.status,
+            'total_ms': round((end - self.t0) * 1000.0, 1), 'args': self.args,
+            'spans_ms': spans, 'marks': marks,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = self.summary()
+        out['events'] = [{
+            'name': e['name'], 'thread': e['thread'], 'args': e['args'],
+            'start_ms': round((e['start'] - self.t0) * 1000.0, 3),
+            'dur_ms': None if e['end'] is None else round((e['end'] - e['start']) * 1000.0, 3),
+        } for e in list(self.events)]
+        return out
+
+
+class Tracer:
+    """Creates traces and keeps the most recent finished ones in a ring.
+
+    One trace at a time can be bound as the active cycle trace; the serial
+    reader's state events are marked on it (see mark_active) so the
+    timeline runs up to BOTTLE_IN_TRAY and back to IDLE.
+    """
+    def __init__(self, capacity: int = 100):
+        self.capacity = max(1, int(capacity))
+        self._done: deque = deque(maxlen=self.capacity)
+        self._open: Dict[int, Trace] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.active: Optional[Trace] = None
+        self.started = 0
+
+    @classmethod
+    def from_env(cls, env) -> Optional['Tracer']:
+        """Tracer keeping TRACE_HISTORY traces, or None if 0."""
+        n = int(env.get('TRACE_HISTORY', '100'))
+        return cls(n) if n > 0 else None
+
+    def start(self, name: str, t0: Optional[float] = None, **args: Any) -> Trace:
+        trace = Trace(next(self._ids), name, t0, **args)
+        with self._lock:
+            self._open[trace.id] = trace
+            self.started += 1
+            # a trace lost on the way (e.g. never finished) must not pile up
+            while len(self._open) > self.capacity:
+                lost = self._open.pop(next(iter(self._open)))
+                lost.status = 'lost'
+                self._done.append(lost)
+        return trace
+
+    def finish(self, trace: Optional[Trace], status: str = 'ok') -> None:
+        if trace is None:
+            return
+        with self._lock:
+            if self._open.pop(trace.id, None) is None:
+                return
+            trace.status = status
+            trace.t_end = time.monotonic()
+            if self.active is trace:
+                self.active = None
+            self._done.append(trace)
+
+    def bind(self, trace: Optional[Trace]) -> None:
+        """Make trace the active cycle trace (None to unbind)."""
+        self.active = trace
+
+    def mark_active(self, name: str, **args: Any) -> None:
+        trace = self.active
+        if trace is not None:
+            trace.mark(name, **args)
+
+    def get(self, trace_id: int) -> Optional[Trace]:
+        with self._lock:
+            if trace_id in self._open:
+                return self._open[trace_id]
+            for t in self._done:
+                if t.id == trace_id:
+                    return t
+        return None
+
+    def recent(self, limit: int = 20, include_open: bool = True) -> List[Trace]:
+        """Newest traces last."""
+        with self._lock:
+            traces = list(self._done)
+            if include_open:
+                traces.extend(self._open.values())
+        traces.sort(key=lambda t: t.id)
+        return traces[-limit:] if limit else traces
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'capacity': self.capacity, 'started': self.started,
+                    'open': len(self._open), 'kept': len(self._done)}
+
+
+def chrome_trace(traces: Iterable[Trace]) -> Dict[str, Any]:
+    """Chrome trace event format (chrome://tracing, Perfetto): one process per trace, one row per thread."""
+    events: List[Dict[str, Any]] = []
+    tids: Dict[str, int] = {}
+    for trace in traces:
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': trace.id,
+                       'args': {'name': f"#{trace.id} {trace.name} ({trace.status})"}})
+        seen = set()
+        for e in list(trace.events):
+            tid = tids.setdefault(e['thread'], len(tids) + 1)
+            if tid not in seen:
+                seen.add(tid)
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': trace.id, 'tid': tid,
+                               'args': {'name': e['thread']}})
+            ev = {'name': e['name'], 'pid': trace.id, 'tid': tid,
+                  'ts': round(e['start'] * 1e6, 1), 'args': e['args']}
+            if e['end'] is None:
+                ev.update(ph='i', s='p')
+            else:
+                ev.update(ph='X', dur=round((e['end'] - e['start']) * 1e6, 1))
+            events.append(ev)
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -0,0 +1,268 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import logs
+
+log = logs.get('SERIAL')
+
+# Upper bounds (ms) of the round-trip latency histogram buckets; the last bucket is open
+RTT_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class PendingCommand:
+    """One in-flight command waiting for its `<cmd>::ack::<payload>` line."""
+    __slots__ = ('cmd', 'line', 'timeout', 't_queued', 't_sent', 'seq', 'payload', 'expired', '_done', 'future')
+
+    def __init__(self, cmd: str, line: str, timeout: float):
+        self.cmd = cmd
+        self.line = line
+        self.timeout = timeout
+        self.t_queued = time.monotonic()
+        self.t_sent: Optional[float] = None
+        self.seq: Optional[int] = None  # write order across all commands
+        self.payload: Optional[str] = None
+        self.expired = False
+        self._done = threading.Event()
+        self.future: concurrent.futures.Future = concurrent.futures.Future()  # for asyncio waiters
+
+    def resolve(self, payload: Optional[str]) -> None:
+        self.payload = payload
+        self._done.set()
+        try:
+            self.future.set_result(payload)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def wait(self) -> bool:
+        return self._done.wait(self.timeout)
+
+
+class RttHistogram:
+    def __init__(self):
+        self.buckets = [0] * (len(RTT_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float) -> None:
+        i = 0
+        while i < len(RTT_BUCKETS_MS) and ms > RTT_BUCKETS_MS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        edges = [f"le_{b}" for b in RTT_BUCKETS_MS] + ['inf']
+        return {
+            'count': self.count,
+            'mean_ms': (self.sum_ms / self.count) if self.count else None,
+            'max_ms': self.max_ms,
+            'buckets': dict(zip(edges, self.buckets)),
+        }
+
+
+def ack_timeouts_from_env(env) -> Dict[str, float]:
+    """Per-command ack timeouts from ACK_TIMEOUTS, e.g. 'recover=15,start=3'."""
+    out: Dict[str, float] = {}
+    for item in env.get('ACK_TIMEOUTS', '').split(','):
+        if '=' in item:
+            k, v = item.split('=', 1)
+            try:
+                out[k.strip()] = float(v)
+            except ValueError:
+                pass
+    return out
+
+
+class SerialTransport:
+    """Pipelined command/ack transport over a serial port.
+
+    All writes go through one writer thread. Every command is appended to a
+    per-command FIFO of in-flight requests before it is written, and each
+    incoming ack resolves the oldest entry of its command (the firmware
+    answers in command order), so concurrent callers of the same command get
+    their own ack. A request that times out
+    stays in the FIFO as expired for stale_grace_s so a late ack is swallowed
+    instead of being handed to the next caller, unless a command written
+    after it is answered first (then its ack is not coming); acks with nothing in flight
+    are counted as stale and dropped. request_async() awaits the same ack
+    from an event loop and, with dedup, joins an identical command (same
+    line) that is still in flight instead of sending it again.
+    """
+    def __init__(self, ser, default_timeout: float = 2.0,
+                 timeouts: Optional[Dict[str, float]] = None, stale_grace_s: Optional[float] = None,
+                 name: str = 'main'):
+        self.ser = ser
+        self.name = name  # bin name in log records
+        self.default_timeout = float(default_timeout)
+        self.timeouts: Dict[str, float] = dict(timeouts or {})
+        self.stale_grace_s = stale_grace_s
+        self._inflight: Dict[str, Deque[PendingCommand]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._writes: queue.Queue = queue.Queue()
+        self._write_seq = 0
+        self._answered_seq = -1  # newest write order an ack arrived for
+        self._rtt: Dict[str, RttHistogram] = defaultdict(RttHistogram)
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {'sent': 0, 'acked': 0, 'timeouts': 0, 'stale': 0, 'late': 0, 'deduped': 0})
+        self.write_errors = 0
+        self._running = True
+        self._writer = threading.Thread(target=self._write_loop, name='serial-writer', daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        self._running = False
+        self._writes.put(None)
+
+    def timeout_for(self, cmd: str) -> float:
+        return self.timeouts.get(cmd, self.default_timeout)
+
+    # Writer thread
+    def _write_loop(self) -> None:
+        while self._running:
+            p = self._writes.get()
+            if p is None:
+                continue
+            if p.expired:
+                # caller gave up before it was even written: no ack will come
+                with self._lock:
+                    self._remove(p)
+                continue
+            try:
+                p.t_sent = time.monotonic()
+                p.seq = self._write_seq
+                self._write_seq += 1
+                self.ser.write(p.line.encode('utf-8'))
+            except Exception as e:
+                self.write_errors += 1
+                log.error(f"write {p.cmd}: {e}", bin=self.name, cmd=p.cmd)
+                with self._lock:
+                    self._remove(p)
+                p.resolve(None)
+
+    def _remove(self, p: PendingCommand) -> None:
+        try:
+            self._inflight[p.cmd].remove(p)
+        except ValueError:
+            pass
+
+    # Caller side
+    def submit(self, cmd: str, line: str, timeout: Optional[float] = None,
+               dedup: bool = False) -> Tuple[PendingCommand, bool]:
+        """Queue line for writing; returns (pending command, False if joined an identical one)."""
+        with self._lock:
+            if dedup:
+                for p in self._inflight[cmd]:
+                    if p.line == line and not p.expired and not p._done.is_set():
+                        self._counters[cmd]['deduped'] += 1
+                        return p, False
+            self._purge(cmd)
+            p = PendingCommand(cmd, line, self.timeout_for(cmd) if timeout is None else timeout)
+            self._inflight[cmd].append(p)
+            self._counters[cmd]['sent'] += 1
+        self._writes.put(p)
+        return p, True
+
+    def request(self, cmd: str, line: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Queue line for writing and wait for the matching ack payload (None on timeout)."""
+        p, _ = self.submit(cmd, line, timeout)
+        if p.wait():
+            return p.payload
+        return self._expire(p)
+
+    def request_many(self, items: Sequence[Tuple[str, str]], timeout: Optional[float] = None) -> List[Optional[str]]:
+        """Pipelined request(): every (cmd, line) is queued at once, then the acks are awaited in order."""
+        pending = [self.submit(cmd, line, timeout)[0] for cmd, line in items]
+        return [p.payload if p.wait() else self._expire(p) for p in pending]
+
+    async def request_async(self, cmd: str, line: str, timeout: Optional[float] = None,
+                            dedup: bool = True) -> Optional[str]:
+        """Like request(), but awaits the ack without holding a thread."""
+        p, _ = self.submit(cmd, line, timeout, dedup)
+        try:
+            # shield: a timed-out waiter must not cancel the future other waiters share
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(p.future)), p.timeout)
+        except asyncio.TimeoutError:
+            return self._expire(p)
+        return p.payload
+
+    def _expire(self, p: PendingCommand) -> Optional[str]:
+        with self._lock:
+            if p._done.is_set():  # ack raced the timeout
+                return p.payload
+            if p.expired:  # a deduplicated waiter already gave up on it
+                return None
+            p.expired = True
+            p.t_queued = time.monotonic()  # start of the grace period
+            self._counters[p.cmd]['timeouts'] += 1
+        log.warning(f"ack timeout for {p.cmd}", category='SERIAL.timeout', bin=self.name, cmd=p.cmd,
+                    timeout_s=p.timeout)
+        return None
+
+    def _purge(self, cmd: str) -> None:
+        """Drop expired requests that will not be answered any more.
+
+        That is once their grace period for a late ack has passed, or once a
+        command written after them was answered: the firmware answers in order,
+        so a late ack would have arrived before that one.
+        """
+        fifo = self._inflight[cmd]
+        now = time.monotonic()
+        while fifo and fifo[0].expired:
+            head = fifo[0]
+            grace = self.stale_grace_s if self.stale_grace_s is not None else head.timeout
+            if now - head.t_queued < grace and (head.seq is None or head.seq > self._answered_seq):
+                break
+            fifo.popleft()
+
+    def drop_expired(self) -> int:
+        """Forget every expired request (e.g. the firmware rebooted: nothing sent before is answered)."""
+        with self._lock:
+            n = 0
+            for fifo in self._inflight.values():
+                live = [p for p in fifo if not p.expired]
+                n += len(fifo) - len(live)
+                fifo.clear()
+                fifo.extend(live)
+            return n
+
+    # Reader side
+    def on_ack(self, cmd: str, payload: Optional[str]) -> None:
+        with self._lock:
+            self._purge(cmd)
+            fifo = self._inflight.get(cmd)
+            if not fifo:
+                self._counters[cmd]['stale'] += 1
+                return
+            p = fifo.popleft()
+            if p.seq is not None and p.seq > self._answered_seq:
+                self._answered_seq = p.seq
+            if p.expired:
+                self._counters[cmd]['late'] += 1
+                return
+            self._counters[cmd]['acked'] += 1
+            if p.t_sent is not None:
+                self._rtt[cmd].record((time.monotonic() - p.t_sent) * 1000.0)
+        p.resolve(payload)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(1 for fifo in self._inflight.values() for p in fifo if not p.expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cmds: List[str] = sorted(set(self._counters) | set(self._rtt))
+            return {
+                'in_flight': sum(1 for fifo in self._inflight.values() for p in fifo if not p.expired),
+                'write_queue': self._writes.qsize(),
+                'write_errors': self.write_errors,
+                'commands': {c: {**self._counters[c], 'rtt': self._rtt[c].to_dict()} for c in cmds},
+            }
@@ -0,0 +1,159 @@
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class TriggerEngine:
+    """Per-block trigger detector.
+
+    process() is called once per audio block and returns the sample offset of
+    the onset inside that block when it fires, otherwise None. The most recent
+    block features are kept in `features` for logging/metrics.
+    """
+    name = 'base'
+
+    def __init__(self):
+        self.features: Dict[str, float] = {}
+
+    def process(self, block: np.ndarray) -> Optional[int]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {'mode': self.name, **self.features}
+
+
+class RmsTrigger(TriggerEngine):
+    """Legacy trigger: fixed int16 RMS threshold over the whole block, onset at block start."""
+    name = 'rms'
+
+    def __init__(self, threshold: float, blocksize: int):
+        super().__init__()
+        self.threshold = float(threshold)
+        self._work = np.zeros(blocksize, dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> Optional[int]:
+        n = block.size
+        if n == 0:
+            return None
+        if self._work.size != n:
+            self._work = np.zeros(n, dtype=np.float32)
+        np.copyto(self._work, block, casting='unsafe')
+        rms = float(np.sqrt(np.dot(self._work, self._work) / n))
+        self.features = {'rms': rms}
+        return 0 if rms > self.threshold else None
+
+
+class AdaptiveTrigger(TriggerEngine):
+    """Multi-feature trigger with an exponentially tracked noise floor.
+
+    Per block (one pass over preallocated buffers): RMS, peak, spectral flux
+    (positive magnitude change vs. the previous block) and the share of
+    spectral energy inside [band_lo_hz, band_hi_hz]. Fires when RMS and flux
+    both stand out from their tracked floors and the block has enough energy
+    in the impact band. The onset is the first sample inside the block whose
+    amplitude exceeds onset_fraction of the block peak.
+    """
+    name = 'adaptive'
+
+    def __init__(self, sample_rate: int, blocksize: int, min_rms: float = 300.0,
+                 rms_factor: float = 4.0, flux_factor: float = 3.0,
+                 band_lo_hz: float = 2000.0, band_hi_hz: float = 8000.0,
+                 min_band_ratio: float = 0.3, floor_tau_s: float = 2.0,
+                 onset_fraction: float = 0.25):
+        super().__init__()
+        self.sample_rate = int(sample_rate)
+        self.min_rms = float(min_rms)
+        self.rms_factor = float(rms_factor)
+        self.flux_factor = float(flux_factor)
+        self.band_lo_hz = float(band_lo_hz)
+        self.band_hi_hz = float(band_hi_hz)
+        self.min_band_ratio = float(min_band_ratio)
+        self.floor_tau_s = float(floor_tau_s)
+        self.onset_fraction = float(onset_fraction)
+        self.noise_rms: Optional[float] = None
+        self.noise_flux: Optional[float] = None
+        self._alloc(blocksize)
+
+    def _alloc(self, n: int) -> None:
+        self.blocksize = n
+        self._work = np.zeros(n, dtype=np.float32)
+        self._windowed = np.zeros(n, dtype=np.float32)
+        self._window = np.hanning(n).astype(np.float32)
+        bins = n // 2 + 1
+        self._mag = np.zeros(bins, dtype=np.float32)
+        self._prev_mag = np.zeros(bins, dtype=np.float32)
+        self._diff = np.zeros(bins, dtype=np.float32)
+        freqs = np.fft.rfftfreq(n, d=1.0 / self.sample_rate)
+        self._band = (freqs >= self.band_lo_hz) & (freqs <= self.band_hi_hz)
+        block_s = n / float(self.sample_rate)
+        # Rise slowly (events must not lift the floor), fall 10x faster
+        self._alpha_up = min(1.0, block_s / self.floor_tau_s)
+        self._alpha_down = min(1.0, 10.0 * self._alpha_up)
+
+    def _track(self, floor: Optional[float], value: float) -> float:
+        if floor is None:
+            return value
+        alpha = self._alpha_up if value > floor else self._alpha_down
+        return floor + alpha * (value - floor)
+
+    def process(self, block: np.ndarray) -> Optional[int]:
+        n = block.size
+        if n == 0:
+            return None
+        if n != self.blocksize:
+            self._alloc(n)
+        work = self._work
+        np.copyto(work, block, casting='unsafe')
+
+        rms = float(np.sqrt(np.dot(work, work) / n))
+        peak = float(max(int(block.max()), -int(block.min())))
+
+        np.multiply(work, self._window, out=self._windowed)
+        np.abs(np.fft.rfft(self._windowed), out=self._mag)
+        np.subtract(self._mag, self._prev_mag, out=self._diff)
+        np.maximum(self._diff, 0.0, out=self._diff)
+        flux = float(self._diff.sum())
+        self._mag, self._prev_mag = self._prev_mag, self._mag
+        # energy share from the (now previous) magnitude spectrum
+        energy = float(np.dot(self._prev_mag, self._prev_mag))
+        band = self._prev_mag[self._band]
+        band_ratio = float(np.dot(band, band) / energy) if energy > 0 else 0.0
+
+        noise_rms = self.noise_rms if self.noise_rms is not None else rms
+        noise_flux = self.noise_flux if self.noise_flux is not None else flux
+        rms_threshold = max(self.min_rms, noise_rms * self.rms_factor)
+        fired = (
+            rms > rms_threshold
+            and flux > noise_flux * self.flux_factor
+            and band_ratio >= self.min_band_ratio
+        )
+        self.noise_rms = self._track(self.noise_rms, rms)
+        self.noise_flux = self._track(self.noise_flux, flux)
+        self.features = {
+            'rms': rms, 'peak': peak, 'flux': flux, 'band_ratio': band_ratio,
+            'noise_rms': self.noise_rms, 'threshold': rms_threshold,
+        }
+        if not fired:
+            return None
+        level = max(rms_threshold, self.onset_fraction * peak)
+        return int(np.argmax(np.abs(block.astype(np.int32)) > level))
+
+
+def create_trigger(env, sample_rate: int, blocksize: int) -> TriggerEngine:
+    """Build the trigger engine selected by TRIGGER_MODE (rms|adaptive)."""
+    threshold = float(env.get('AUDIO_RMS_THRESHOLD', '1200'))
+    mode = env.get('TRIGGER_MODE', 'rms').strip().lower()
+    if mode == 'rms':
+        return RmsTrigger(threshold, blocksize)
+    if mode == 'adaptive':
+        return AdaptiveTrigger(
+            sample_rate, blocksize,
+            min_rms=threshold,
+            rms_factor=float(env.get('TRIGGER_RMS_FACTOR', '4.0')),
+            flux_factor=float(env.get('TRIGGER_FLUX_FACTOR', '3.0')),
+            band_lo_hz=float(env.get('TRIGGER_BAND_LO_HZ', '2000')),
+            band_hi_hz=float(env.get('TRIGGER_BAND_HI_HZ', '8000')),
+            min_band_ratio=float(env.get('TRIGGER_MIN_BAND_RATIO', '0.3')),
+            floor_tau_s=float(env.get('TRIGGER_FLOOR_TAU_S', '2.0')),
+        )
+    raise ValueError(f"Invalid TRIGGER_MODE '{mode}'")